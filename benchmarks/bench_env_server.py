@@ -0,0 +1,94 @@
+"""
+Step rate and latency of the environment server.
+
+Starts components.env_server in a subprocess on a free port (or a Unix socket) and runs
+concurrent sessions against it from client threads, each stepping a simple policy. Reports
+the total step rate and the per-step round-trip latency.
+
+Run from the repository root:
+    python -m benchmarks.bench_env_server [--sessions 4] [--steps 500] [--unix]
+"""
+import argparse
+import ast
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from components.controllers import ANGLES_SLICE
+from components.env_client import EnvClient
+
+
+def _policy(observations):
+    # Steer towards the next checkpoint at full throttle
+    difference = observations[:, ANGLES_SLICE][:, 1]
+    return np.where(difference > 15, 2, np.where(difference < -15, 3, 0))
+
+
+def start_server(unix_path=None):
+    """Start a server subprocess, return it and its address once it listens."""
+    command = [sys.executable, "-m", "components.env_server"]
+    command += ["--unix", unix_path] if unix_path else ["--port", "0"]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    for line in process.stdout:
+        if line.startswith("listening on "):
+            address = line[len("listening on "):].strip()
+            return process, address if unix_path else ast.literal_eval(address)[:2]
+    raise RuntimeError("Server exited before listening")
+
+
+def run_session(address, steps, num_cars, image_size, latencies, seed):
+    with EnvClient(address) as env:
+        result = env.reset(num_cars=num_cars, seed=seed, max_steps=steps,
+                           image_size=image_size)
+        while not result.done:
+            actions = _policy(result.observations)
+            started = time.perf_counter()
+            result = env.step(actions)
+            latencies.append(time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Environment server benchmark.")
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=500)
+    parser.add_argument("--cars", type=int, default=4)
+    parser.add_argument("--image-size", type=int, default=0)
+    parser.add_argument("--unix", action="store_true", help="use a Unix socket")
+    args = parser.parse_args()
+
+    unix_path = os.path.join(tempfile.mkdtemp(), "env.sock") if args.unix else None
+    process, address = start_server(unix_path)
+    try:
+        latencies = [[] for _ in range(args.sessions)]
+        threads = [threading.Thread(target=run_session,
+                                    args=(address, args.steps, args.cars, args.image_size,
+                                          latencies[i], i))
+                   for i in range(args.sessions)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        process.terminate()
+        process.wait()
+    samples = sorted(latency for session in latencies for latency in session)
+    if not samples:
+        sys.exit("No steps were completed")
+    print(f"{args.sessions} sessions x {args.cars} cars over "
+          f"{'unix socket' if args.unix else 'tcp'}: "
+          f"{len(samples) / elapsed:.0f} steps/s ({len(samples) * args.cars / elapsed:.0f} "
+          f"car-steps/s)")
+    print(f"latency: median {statistics.median(samples) * 1e3:.2f} ms  "
+          f"p99 {samples[int(len(samples) * 0.99) - 1] * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
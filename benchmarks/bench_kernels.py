@@ -0,0 +1,104 @@
+"""
+Parity and speed of the geometry kernels in components.kernels.
+
+Each kernel is compared with the tuple based code it replaces on random inputs over a
+real track, first as plain Python and then, when numba is installed, JIT-compiled.
+Any mismatch fails the run.
+
+Run from the repository root:
+    python -m benchmarks.bench_kernels [--map map.json] [--samples 2000]
+"""
+import argparse
+import math
+import random
+import sys
+import time
+
+import pygame
+
+import components.globals as cg
+import game  # noqa: F401 - sets cg.MAP_FILE
+from components import kernels
+from components.car_class import Car
+from components.functions_helper import point_in_polygon
+from components.track_context import TrackContext
+
+WIDTH, HEIGHT = 1000, 800
+
+
+def _time(function, arguments):
+    start = time.perf_counter()
+    results = [function(*args) for args in arguments]
+    return results, time.perf_counter() - start
+
+
+def _reference_ray(track, center, direction, max_length):
+    # The border part of Car._cast_single_ray on the pygame mask and the inner tuple
+    car = Car.__new__(Car)
+    car.track = None
+    _, _, hit, distance = Car._cast_single_ray(
+        car, center, direction, max_length, track.track_mask.get_size(), track.track_mask,
+        track.inner, [])
+    return hit[0], hit[1], distance
+
+
+def _cases(track, samples, rng):
+    points = [(rng.uniform(0, WIDTH), rng.uniform(0, HEIGHT)) for _ in range(samples)]
+    directions = [(math.cos(a), math.sin(a))
+                  for a in (rng.uniform(0, 2 * math.pi) for _ in range(samples))]
+    return {
+        "point_in_polygon": (
+            [(x, y, track.outer) for x, y in points],
+            lambda: [(x, y, track.outer_array) for x, y in points],
+            point_in_polygon, kernels.point_in_polygon, kernels._point_in_polygon),
+        "march_border_ray": (
+            [(track, point, direction, 1000) for point, direction in zip(points, directions)],
+            lambda: [(x, y, dx, dy, 1000, track.track_bits, track.inner_array)
+                     for (x, y), (dx, dy) in zip(points, directions)],
+            _reference_ray, kernels.march_border_ray, kernels._march_border_ray),
+    }
+
+
+def _same(name, expected, actual):
+    if name == "march_border_ray":
+        actual = [result[:3] for result in actual]
+    return all(e == a for e, a in zip(expected, actual))
+
+
+def run(map_file, samples, seed):
+    pygame.init()
+    rng = random.Random(seed)
+    track = TrackContext.from_file(map_file, WIDTH, HEIGHT)
+    ok = True
+    kernels.enabled()
+    print(f"backend: {'numba ' + kernels.numba.__version__ if kernels.JIT else 'python'}")
+    for name, (ref_args, kernel_args, reference, compiled, source) in \
+            _cases(track, samples, rng).items():
+        expected, reference_time = _time(reference, ref_args)
+        arguments = kernel_args()
+        actual, python_time = _time(source, arguments)
+        line = f"{name:>17}: reference {reference_time * 1e6 / samples:8.2f} us  " \
+               f"python kernel {python_time * 1e6 / samples:8.2f} us"
+        same = _same(name, expected, actual)
+        if kernels.JIT:
+            compiled(*arguments[0])  # Compile outside the timing
+            jit_results, jit_time = _time(compiled, arguments)
+            same &= _same(name, expected, jit_results)
+            line += f"  jit {jit_time * 1e6 / samples:8.2f} us " \
+                    f"({reference_time / jit_time:6.1f}x)"
+        print(line + ("" if same else "  MISMATCH"))
+        ok &= same
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Geometry kernel parity and speed.")
+    parser.add_argument("--map", default=cg.MAP_FILE)
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.map, args.samples, args.seed) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Cold start benchmark of GameEngine.
+
+Every sample runs in a fresh interpreter so imports, texture decoding and mask
+generation are measured the way a new process-pool worker pays for them.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Startup budget in seconds for each engine mode
+BUDGETS = {
+    "headless": 0.5,
+    "visual": 1.5,
+}
+
+_SAMPLE_CODE = """
+import json, os, sys, time
+start = time.perf_counter()
+import game
+imported = time.perf_counter()
+engine = game.GameEngine(visualize={visualize})
+created = time.perf_counter()
+print(json.dumps({{"import": imported - start, "engine": created - imported}}))
+"""
+
+
+def measure_startup(mode, repeat=5):
+    """
+    Measure import and construction time of GameEngine in fresh processes.
+
+    :param mode: "headless" or "visual".
+    :param repeat: Number of processes to start.
+    :return: List of dictionaries with "import" and "engine" times in seconds.
+    """
+    env = dict(os.environ)
+    if mode == "visual":
+        # Real window creation is not what we measure, keep it runnable on CI
+        env.setdefault("SDL_VIDEODRIVER", "dummy")
+    code = _SAMPLE_CODE.format(visualize=mode == "visual")
+    samples = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                env=env, check=True)
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def report(mode, samples):
+    total = [s["import"] + s["engine"] for s in samples]
+    median = statistics.median(total)
+    budget = BUDGETS[mode]
+    status = "OK" if median <= budget else "OVER BUDGET"
+    print(f"{mode:>9}: import {statistics.median(s['import'] for s in samples):.3f}s  "
+          f"engine {statistics.median(s['engine'] for s in samples):.3f}s  "
+          f"total {median:.3f}s  (budget {budget:.2f}s) {status}")
+    return median <= budget
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GameEngine cold start benchmark.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mode", choices=sorted(BUDGETS), action="append",
+                        help="mode to measure (default: all)")
+    args = parser.parse_args()
+
+    within_budget = True
+    for mode in args.mode or sorted(BUDGETS):
+        within_budget &= report(mode, measure_startup(mode, args.repeat))
+    sys.exit(0 if within_budget else 1)
+
+
+if __name__ == "__main__":
+    main()
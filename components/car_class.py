@@ -1,14 +1,24 @@
 import pygame
-import os
 import math
 import json
 
 import components.globals as cg
+from components import kernels
 from components.functions_helper import point_in_polygon, scale_points, get_scaling_params, \
-    lines_params_prep
+    lines_params_prep, load_image
+from components.track_render import track_background
+from components.observation import scratch_surface, write_observation
+from components.controllers import VECTOR_PARTS, BORDER_RAYS, CAR_RAYS, PROGRESS, ANGLES
+from components.physics import step_continuous
+from components.sprites import car_image, scaled_car_image
+from components.spatial_hash import SpatialHash
 
 
 class Car:
+    # Parts of the state choose_action reads (components.controllers), the engine computes
+    # only these; screenshots follow the engine's screenshots flag
+    observation_parts = VECTOR_PARTS
+
     def __init__(self, x, y, track_width, inner_polygon, outer_polygon):
         self.x = x
         self.y = y
@@ -26,12 +36,17 @@ class Car:
         self.acceleration = 0.2
         self.friction = 0.05
         self.turn_slowdown = 0.1
+        # Simulation pixels per window pixel, speeds and observations stay in window pixels
+        self.scale = 1.0
 
         self.set_image(track_width=track_width)
 
         # checkpoints, finish line
         self.checkpoints = []
         self.win = False
+        self.finish_tick = None  # Set by the engine when the car finishes
+        self.collisions = 0
+        self.last_action = None  # Discrete action of the last update
 
         self.inner_polygon = inner_polygon
         self.outer_polygon = outer_polygon
@@ -43,10 +58,25 @@ class Car:
         self.rays = []
         self.distances = []
 
-        self.white_car = pygame.image.load(os.path.join("imgs", "white-car.png")).convert_alpha()
-        self.purple_car = pygame.image.load(os.path.join("imgs", "purple-car.png")).convert_alpha()
-
         self._state_screenshot_map_data = None  # Cache for map data used in state_screenshot
+        self._mask_cache = (None, None, None)  # (angle, image, mask) of the last get_mask
+
+        # Set by the engine; when present, car-to-car queries only look at nearby cells
+        self.spatial_hash = None
+        # Set by the engine; a ghost car neither collides with nor senses other cars
+        self.ghost = False
+        # Set by the engine; TrackContext of the simulation canvas shared by all cars
+        self.track = None
+
+    @property
+    def white_car(self):
+        """Screenshot sprite of the observing car, loaded on first screenshot."""
+        return load_image("white-car.png")
+
+    @property
+    def purple_car(self):
+        """Screenshot sprite of the other cars, loaded on first screenshot."""
+        return load_image("purple-car.png")
 
     def fix_angle(self, finish_point):
         """
@@ -92,6 +122,7 @@ class Car:
 
     def _handle_collision(self, old_x, old_y, cars):
         if self.check_collision(self.outer_polygon, self.inner_polygon, cars):
+            self.collisions += 1
             self.x, self.y = old_x, old_y
             self.speed = 0
 
@@ -99,48 +130,85 @@ class Car:
         if self.win is True:
             return
         old_x, old_y = self.x, self.y
+        self.last_action = action
         turning = self._handle_action(action)
         if action == 10:  # No action
             self._handle_no_action()
         if turning:
             self._handle_turning()
+        self.speed = max(-self.max_speed, min(self.speed, self.max_speed))
         # Car position update
-        self.x += self.speed * math.cos(math.radians(self.angle))
-        self.y -= self.speed * math.sin(math.radians(self.angle))
+        self.x += self.speed * self.scale * math.cos(math.radians(self.angle))
+        self.y -= self.speed * self.scale * math.sin(math.radians(self.angle))
         self._handle_collision(old_x, old_y, cars)
 
-    def draw(self, screen):
+    def update_continuous(self, action, cars):
+        """
+        Continuous counterpart of update.
+        :param action: (throttle, brake, steering), each in [-1, 1], see components.physics.
+        :param cars: Cars used for collision checks.
+        """
+        step_continuous([self], [action], cars)
+
+    def draw(self, screen, offset=(0, 0)):
+        """
+        :param offset: Canvas position of the screen's top left corner, for drawing on a
+                       surface that covers only part of the canvas.
+        """
         if self.win is True:
             return
+        x, y = self.x - offset[0], self.y - offset[1]
         if self.img is not None:
             # Use the loaded image for rendering
             rotated_image = pygame.transform.rotate(self.image, self.angle)
-            screen.blit(rotated_image, (self.x - rotated_image.get_width() // 2,
-                                        self.y - rotated_image.get_height() // 2))
+            screen.blit(rotated_image, (x - rotated_image.get_width() // 2,
+                                        y - rotated_image.get_height() // 2))
         else:
             # Fall back to rendering the car as a rectangle
-            car_rect = pygame.Rect(self.x - 15, self.y - 10, 30, 20)
+            car_rect = pygame.Rect(x - 15, y - 10, 30, 20)
             rotated_car = pygame.transform.rotate(pygame.Surface(car_rect.size), -self.angle)
             rotated_car.fill((255, 0, 0))
             rotated_rect = rotated_car.get_rect(center=car_rect.center)
             screen.blit(rotated_car, rotated_rect.topleft)
 
     def get_mask(self):
-        rotated_image = pygame.transform.rotate(self.image, -self.angle)
-        return pygame.mask.from_surface(rotated_image), rotated_image.get_rect(
-            center=(self.x, self.y))
-
-    def get_distances_to_cars(self, cars):
+        angle, image, mask = self._mask_cache
+        if angle != self.angle or image is not self.image:
+            # Rotating and building the mask is the expensive part, the rect is cheap
+            mask = pygame.mask.from_surface(pygame.transform.rotate(self.image, -self.angle))
+            self._mask_cache = (self.angle, self.image, mask)
+        rect = pygame.Rect((0, 0), mask.get_size())
+        rect.center = (self.x, self.y)
+        return mask, rect
+
+    def _collision_margin(self):
+        # Cars may move after the spatial hash was rebuilt, this covers one tick of both cars
+        return 2 * self.max_speed * self.scale
+
+    def get_distances_to_cars(self, cars, radius=None):
+        """
+        Distances to the other cars in window pixels.
+        :param radius: Only cars within this radius (window pixels) are returned.
+        """
+        if self.ghost:
+            return []
+        if radius is not None and self.spatial_hash is not None:
+            cars = [item[0] for item in
+                    self.spatial_hash.query_radius(self.x, self.y, radius * self.scale)]
         distances = []
         for other_car in cars:
             if other_car != self:
                 dx = other_car.x - self.x
                 dy = other_car.y - self.y
-                distance = math.sqrt(dx ** 2 + dy ** 2)
-                distances.append(distance)
+                distance = math.sqrt(dx ** 2 + dy ** 2) / self.scale
+                if radius is None or distance <= radius:
+                    distances.append(distance)
         return distances
 
     def _check_car_collision(self, test_x, test_y, other_cars):
+        if isinstance(other_cars, SpatialHash):
+            other_cars = [(car_mask, car_rect) for car, car_mask, car_rect
+                          in other_cars.query_point(test_x, test_y) if car is not self]
         for car_mask, car_rect in other_cars:
             offset = (test_x - car_rect.left, test_y - car_rect.top)
             if 0 <= offset[0] < car_mask.get_size()[0] and 0 <= offset[1] < car_mask.get_size()[1]:
@@ -155,6 +223,9 @@ class Car:
 
     def _cast_single_ray(self, center, direction, max_length, bounds, mask, inner_polygon,
                          other_cars):
+        if self.track is not None and kernels.enabled() and mask is self.track.track_mask \
+                and inner_polygon is self.track.inner:
+            return self._cast_single_ray_compiled(center, direction, max_length, other_cars)
         center_x, center_y = center
         dx, dy = direction
         max_width, max_height = bounds
@@ -191,6 +262,26 @@ class Car:
             border_hit_distance = max_length
         return car_hit, car_hit_distance, border_hit, border_hit_distance
 
+    def _cast_single_ray_compiled(self, center, direction, max_length, other_cars):
+        # Border march in the compiled kernel, then the same per-step car test as
+        # _cast_single_ray over the steps the kernel checked
+        center_x, center_y = center
+        dx, dy = direction
+        hit_x, hit_y, border_hit_distance, steps = kernels.march_border_ray(
+            center_x, center_y, dx, dy, max_length, self.track.track_bits,
+            self.track.inner_array)
+        car_hit = None
+        car_hit_distance = None
+        if other_cars:
+            for ray_length in range(steps):
+                test_x = int(center_x + ray_length * dx)
+                test_y = int(center_y + ray_length * dy)
+                car_hit = self._check_car_collision(test_x, test_y, other_cars)
+                if car_hit:
+                    car_hit_distance = ray_length
+                    break
+        return car_hit, car_hit_distance, (hit_x, hit_y), border_hit_distance
+
     def _get_ray_params(self, center_x, center_y, dx, dy, max_length, max_width, max_height, mask,
                         inner_polygon, other_cars):
         center = (center_x, center_y)
@@ -199,6 +290,11 @@ class Car:
         return center, direction, max_length, bounds, mask, inner_polygon, other_cars
 
     def _prepare_other_cars(self, cars):
+        if self.ghost:
+            return []
+        if self.spatial_hash is not None:
+            # Masks were built once for this tick, rays look them up per cell
+            return self.spatial_hash
         other_cars = []
         if cars is not None:
             for car in cars:
@@ -226,7 +322,11 @@ class Car:
         ray_result['distance_to_border'] = border_hit_distance
         return ray_result
 
-    def get_rays_and_distances(self, mask, inner_polygon, cars=None):
+    def get_rays_and_distances(self, mask, inner_polygon, cars=None, sense_cars=True):
+        """
+        Cast the 8 rays of the car, stopping at the track border and, with sense_cars, at
+        other cars.
+        """
         if self.img is None:
             car_width = 30
             car_height = 20
@@ -244,8 +344,8 @@ class Car:
         self.rays_to_border = []
         self.distances_to_border = []
         max_width, max_height = mask.get_size()
-        max_length = 1000
-        other_cars = self._prepare_other_cars(cars)
+        max_length = 1000 * self.scale
+        other_cars = self._prepare_other_cars(cars) if sense_cars else []
         for ray_angle in ray_angles:
             total_angle = angle_rad + math.radians(ray_angle)
             dx = math.cos(total_angle)
@@ -253,11 +353,13 @@ class Car:
             ray_result = self._process_single_ray(center_x, center_y, dx, dy, max_length, max_width,
                                                   max_height, mask, inner_polygon, other_cars)
             self.rays.append(ray_result['ray'])
-            self.distances.append(ray_result['distance'])
+            self.distances.append(ray_result['distance'] / self.scale)
             self.rays_to_cars.append(ray_result['ray_to_car'])
-            self.distances_to_cars.append(ray_result['distance_to_car'])
+            distance_to_car = ray_result['distance_to_car']
+            self.distances_to_cars.append(
+                distance_to_car / self.scale if distance_to_car is not None else None)
             self.rays_to_border.append(ray_result['ray_to_border'])
-            self.distances_to_border.append(ray_result['distance_to_border'])
+            self.distances_to_border.append(ray_result['distance_to_border'] / self.scale)
         return self.rays, self.distances
 
     def draw_rays(self, surface, rays):
@@ -283,17 +385,11 @@ class Car:
     def set_image(self, track_width):
         """
         Sets the car's image by scaling it based on the track width.
+        The first cars use the PNGs from cg.COLORS, the following ones tinted copies.
 
         :param track_width: The width of the track, used to scale the car's image.
         """
-        # Check if the limit of available colors is exceeded
-        if cg.USED_CARS >= len(cg.COLORS):
-            raise ValueError("Too many cars created, not enough colors available.")
-
-        # Load the image
-        self.img = pygame.image.load(os.path.join("imgs", cg.COLORS[cg.USED_CARS])).convert_alpha()
-
-        # Increment cg.USED_CARS only after the check passes
+        self.img = car_image(cg.USED_CARS)
         cg.USED_CARS += 1
         # Preserve original aspect ratio
         self.image_setter(track_width=track_width)
@@ -305,11 +401,8 @@ class Car:
         original_width, original_height = self.img.get_size()
         new_width = int(desired_car_width)
         new_height = int(original_height * (new_width / original_width))
-        # Scale the image
-        scaled_image = pygame.transform.scale(self.img, (new_width, new_height))
-        # Rotate the image 90 degrees to the left (counterclockwise)
-        self.image = pygame.transform.rotate(scaled_image, -90)
-        self.mask = pygame.mask.from_surface(self.image)
+        # Scale and rotate the image, shared with other cars of the same look and size
+        self.image, self.mask = scaled_car_image(self.img, new_width, new_height)
         return desired_car_width
 
     def check_checkpoints(self, checkpoints, data=None, outer_line=None, inner_line=None,
@@ -323,7 +416,17 @@ class Car:
         :param width: Screen width
         :param height: Screen height
         :return: True if the car has passed a checkpoint, False otherwise.
+        With a TrackContext (self.track) its prebuilt gates are used instead of the map data.
         """
+        if self.track is not None:
+            car_mask, car_rect = self.get_mask()
+            for gate in self.track.gates:
+                if gate.point not in self.checkpoints and self._overlaps(gate, car_mask,
+                                                                        car_rect):
+                    self.checkpoints.append(gate.point)
+                    return True
+            return False
+
         if cg.FINISH_TEXTURE is None or data is None:
             return False
 
@@ -352,6 +455,7 @@ class Car:
         :param width: Screen width
         :param height: Screen height
         :return: True if the car has crossed the finish line, False otherwise.
+        With a TrackContext (self.track) its prebuilt finish gate is used instead.
         """
         if cg.FINISH_TEXTURE is None or data is None:
             return False
@@ -362,6 +466,13 @@ class Car:
         if len(checkpoints) > len(self.checkpoints):
             return False
 
+        if self.track is not None:
+            car_mask, car_rect = self.get_mask()
+            if self._overlaps(self.track.finish_gate, car_mask, car_rect):
+                self.win = True
+                return True
+            return False
+
         # Prepare scaling params
         car_mask, car_rect, inner_line, min_x, min_y, outer_line, scale = self.scaling_params_prep(
             data, height, inner_line, outer_line, width)
@@ -375,6 +486,13 @@ class Car:
             return True
         return False
 
+    @staticmethod
+    def _overlaps(gate, car_mask, car_rect):
+        if not gate.rect.colliderect(car_rect):
+            return False
+        offset = (gate.rect.left - car_rect.left, gate.rect.top - car_rect.top)
+        return car_mask.overlap(gate.mask, offset) is not None
+
     def scaling_params_prep(self, data, height, inner_line, outer_line, width):
         min_x, min_y, scale = get_scaling_params([data["outer_points"], data["inner_points"]],
                                                  width, height, scale_factor=0.9)
@@ -385,6 +503,15 @@ class Car:
         car_mask, car_rect = self.get_mask()
         return car_mask, car_rect, inner_line, min_x, min_y, outer_line, scale
 
+    def _inside(self, x, y, polygon):
+        # Track lines go through the compiled kernel, anything else through the helper
+        if self.track is not None and kernels.enabled():
+            if polygon is self.track.inner:
+                return kernels.point_in_polygon(x, y, self.track.inner_array)
+            if polygon is self.track.outer:
+                return kernels.point_in_polygon(x, y, self.track.outer_array)
+        return point_in_polygon(x, y, polygon)
+
     def check_if_on_track(self, track_mask, inner_polygon, outer_polygon):
         # Get the car's mask
         car_mask = pygame.mask.from_surface(self.image)
@@ -399,10 +526,10 @@ class Car:
         if overlap is None:
             return False
 
-        if point_in_polygon(self.x, self.y, inner_polygon):
+        if self._inside(self.x, self.y, inner_polygon):
             return False
 
-        if not point_in_polygon(self.x, self.y, outer_polygon):
+        if not self._inside(self.x, self.y, outer_polygon):
             return False  # The car is outside the track
 
         return True
@@ -410,21 +537,31 @@ class Car:
     def check_collision(self, outer_polygon, inner_polygon, cars):
         # Check collision with other cars (full masks)
         self_mask, self_rect = self.get_mask()
+        if self.ghost:
+            cars = []
+        elif self.spatial_hash is not None:
+            margin = self._collision_margin()
+            cars = [item[0] for item in self.spatial_hash.query_rect(
+                self_rect.left - margin, self_rect.top - margin,
+                self_rect.right + margin, self_rect.bottom + margin)]
         for other_car in cars:
             if other_car != self:
                 if other_car.win is True:
                     continue
                 other_mask, other_rect = other_car.get_mask()
+                if not self_rect.colliderect(other_rect):
+                    continue
                 offset = (other_rect.left - self_rect.left, other_rect.top - self_rect.top)
                 if self_mask.overlap(other_mask, offset):
                     return True
         # Collision with the track
         cx, cy = int(self.x), int(self.y)
-        if point_in_polygon(cx, cy, outer_polygon) and not point_in_polygon(cx, cy, inner_polygon):
+        if self._inside(cx, cy, outer_polygon) and not self._inside(cx, cy, inner_polygon):
             return False  # The car is on the track
         return True  # Collision
 
-    def states_generation(self, screen, checkpoints, cars, screenshots=False, debug=False):
+    def states_generation(self, screen, checkpoints, cars, screenshots=False, debug=False,
+                          screenshot_out=None, observation_format=None, parts=VECTOR_PARTS):
         """
          Parameters:
             state (list): A 3-element list representing the car's current state:
@@ -439,27 +576,38 @@ class Car:
                             - state[3][0]: The car's current angle (compass).
                             - state[3][1]: The angle to the next checkpoint.
                 - state[4]: Image of the screen.
+        :param screenshot_out: Optional array the screenshot is written into, see
+                               state_screenshot.
+        :param observation_format: Optional ObservationFormat of the screenshot.
+        :param parts: Parts of state[0:4] to compute (components.controllers), the others
+                      are None.
         :return: list of states
         """
         state = []
         # Distances to the track border
-        distances_to_border = self.state_from_distances_to_border()
+        distances_to_border = None
+        if BORDER_RAYS in parts:
+            distances_to_border = self.state_from_distances_to_border()
         state.append(distances_to_border)
 
         # Distances to other cars
-        distances_to_cars = self.state_from_distances_to_cars()
+        distances_to_cars = None
+        if CAR_RAYS in parts:
+            distances_to_cars = self.state_from_distances_to_cars()
         state.append(distances_to_cars)
 
         # Progress information
-        progress_info = self.progress_info(checkpoints)
+        progress_info = self.progress_info(checkpoints) if PROGRESS in parts else None
         state.append(progress_info)
 
         # Angles states
-        angles_info = self.state_from_angles(checkpoints)
+        angles_info = self.state_from_angles(checkpoints) if ANGLES in parts else None
         state.append(angles_info)
 
         # Screenshot of the screen
-        screenshot = self.state_screenshot(cars, screen, screenshots, debug=debug)
+        screenshot = self.state_screenshot(cars, screen, screenshots, debug=debug,
+                                           out=screenshot_out,
+                                           observation_format=observation_format)
         state.append(screenshot)
 
         return state
@@ -472,16 +620,12 @@ class Car:
         state_compass = self.angle
 
         # Find next checkpoint index (first not in self.checkpoints)
-        next_index = None
-        for i, cp in enumerate(checkpoints):
-            if cp not in self.checkpoints:
-                next_index = i
-                break
+        next_index = self._next_checkpoint_index(checkpoints)
         if next_index is None:
             # All checkpoints passed, wrap to first
             return (state_compass, None)
 
-        next_checkpoint = checkpoints[next_index]
+        next_checkpoint = self._checkpoint_position(checkpoints, next_index)
         dx = next_checkpoint[0] - self.x
         dy = next_checkpoint[1] - self.y
         angle_to_next = math.degrees(math.atan2(-dy, dx))
@@ -500,26 +644,37 @@ class Car:
         """
         Returns progress information for the car.
         :param checkpoints: List of checkpoints.
-        :return: A tuple containing the index of the next checkpoint and the car's progress.
+        :return: A tuple containing the index of the next checkpoint and the car's progress
+                 (distance to it in window pixels).
         """
         if not checkpoints:
-            return (-1. - 1)  # No checkpoints available
+            return (-1, -1)  # No checkpoints available
 
         # Find the next checkpoint not yet passed
-        next_index = None
-        for i, cp in enumerate(checkpoints):
-            if cp not in self.checkpoints:
-                next_index = i
-                break
+        next_index = self._next_checkpoint_index(checkpoints)
         if next_index is None:
             # All checkpoints passed, wrap to first
             next_index = 0
 
-        next_checkpoint = checkpoints[next_index]
-        progress = math.dist((self.x, self.y), next_checkpoint)
+        next_checkpoint = self._checkpoint_position(checkpoints, next_index)
+        progress = math.dist((self.x, self.y), next_checkpoint) / self.scale
         return (next_index, progress)
 
+    def _next_checkpoint_index(self, checkpoints):
+        for i, cp in enumerate(checkpoints):
+            if cp not in self.checkpoints:
+                return i
+        return None
+
+    def _checkpoint_position(self, checkpoints, index):
+        # Map checkpoints are in map coordinates, the car is on the simulation canvas
+        if self.track is not None and checkpoints is self.track.checkpoints:
+            return self.track.gates[index].center
+        return checkpoints[index]
+
     def track_width_calculation(self, car, screen):
+        if self.track is not None:
+            return self.track.lookup.width_at(car.x, car.y)
         map_data = None
         if hasattr(car, "outer_polygon") and hasattr(car, "inner_polygon"):
             # Determine track width at the car's position
@@ -551,27 +706,23 @@ class Car:
         desired_car_width = None
         for car in cars:
             if car is self:
-                # Assign a fresh, scaled copy of the white car image
-                car.img = self.white_car.copy()
+                # Assign a scaled white car image
+                car.img = self.white_car
                 track_width = self.track_width_calculation(car, screen)
                 desired_car_width = track_width * cg.CAR_SIZE_RATIO
                 original_width, original_height = car.img.get_size()
                 new_width = int(desired_car_width)
                 new_height = int(original_height * (new_width / original_width))
-                scaled_image = pygame.transform.scale(car.img, (new_width, new_height))
-                car.image = pygame.transform.rotate(scaled_image, -90)
-                car.mask = pygame.mask.from_surface(car.image)
+                car.image, car.mask = scaled_car_image(car.img, new_width, new_height)
             else:
-                # Assign a fresh, scaled copy of the purple car image
-                car.img = self.purple_car.copy()
+                # Assign a scaled purple car image
+                car.img = self.purple_car
                 track_width = self.track_width_calculation(car, screen)
                 desired_car_width_other = track_width * cg.CAR_SIZE_RATIO
                 original_width, original_height = car.img.get_size()
                 new_width = int(desired_car_width_other)
                 new_height = int(original_height * (new_width / original_width))
-                scaled_image = pygame.transform.scale(car.img, (new_width, new_height))
-                car.image = pygame.transform.rotate(scaled_image, -90)
-                car.mask = pygame.mask.from_surface(car.image)
+                car.image, car.mask = scaled_car_image(car.img, new_width, new_height)
         return original_states, desired_car_width
 
     def _restore_car_images_after_screenshot(self, cars, original_states, desired_car_width):
@@ -583,34 +734,59 @@ class Car:
 
     def _get_or_load_map_data(self):
         """Load map data if not already loaded."""
-        if not hasattr(self, "_state_screenshot_map_data"):
+        if self.track is not None:
+            return self.track.data
+        if getattr(self, "_state_screenshot_map_data", None) is None:
             with open(cg.MAP_FILE, "r") as f:
                 self._state_screenshot_map_data = json.load(f)
         return self._state_screenshot_map_data
 
-    def _draw_screenshot_surface(self, screen, cars):
-        """Draw background, track, and cars on a new surface."""
-        screenshot_surface = pygame.Surface(screen.get_size())
-        screenshot_surface.blit(cg.BACKGROUND_IMAGE, (0, 0))
-        from game import draw_track
-        map_data = self._get_or_load_map_data()
-        draw_track(screenshot_surface, map_data)
+    def _draw_screenshot_surface(self, screen, cars, area=None):
+        """
+        Draw background, track, and cars on a new surface.
+        :param area: Rect of the canvas to draw (default: the whole canvas). The static
+                     track is copied from a cached background, only cars near it are drawn.
+        """
+        if area is None:
+            area = screen.get_rect()
+        screenshot_surface = pygame.Surface(area.size)
+        if self.track is not None and self.track.size == screen.get_size():
+            background = self.track.background
+        else:
+            background = track_background(self._get_or_load_map_data(), *screen.get_size())
+        screenshot_surface.blit(background, (0, 0), area)
         for car in cars:
-            car.draw(screenshot_surface)
+            # A rotated car fits in a square of its diagonal around its center
+            reach = math.hypot(*car.image.get_size()) / 2 + 1
+            if (area.left - reach <= car.x <= area.right + reach
+                    and area.top - reach <= car.y <= area.bottom + reach):
+                car.draw(screenshot_surface, area.topleft)
         return screenshot_surface
 
-    def state_screenshot(self, cars, screen, screenshots_state, debug=False):
+    def state_screenshot(self, cars, screen, screenshots_state, debug=False, out=None,
+                         observation_format=None):
+        """
+        Crop of the track around the car, with this car white and the others purple.
+        The crop is scaled straight to the output size.
+        :param out: Optional array to write into instead of returning a new one, e.g. a
+                    FrameStack slot. Without observation_format it has shape
+                    (size, size, 3) and the crop is scaled to its size.
+        :param observation_format: Optional ObservationFormat (size, grayscale, layout,
+                                   dtype) of the result and of out.
+        :return: The observation, by default a (width, height, 3) uint8 array, or None
+                 without screenshots_state.
+        """
         if not screenshots_state:
             return None
+        if self.ghost:
+            cars = [self]
         # Swap images and scale for screenshot
         original_imgs, desired_car_width = self._swap_car_images_for_screenshot(cars, screen)
-        # Draw everything on screenshot surface
-        screenshot_surface = self._draw_screenshot_surface(screen, cars)
 
-        ZOOM_SIZE = 200  # crop size (e.g. 200x200 px)
+        ZOOM_SIZE = max(1, round(cg.SCREENSHOT_SIZE * self.scale))  # crop on simulation canvas
         car_center_x = int(self.x)
         car_center_y = int(self.y)
-        surf_w, surf_h = screenshot_surface.get_size()
+        surf_w, surf_h = screen.get_size()
         left = max(0, car_center_x - ZOOM_SIZE // 2)
         top = max(0, car_center_y - ZOOM_SIZE // 2)
         right = min(surf_w, left + ZOOM_SIZE)
@@ -620,10 +796,32 @@ class Car:
         if bottom - top < ZOOM_SIZE:
             top = max(0, bottom - ZOOM_SIZE)
         zoom_rect = pygame.Rect(left, top, ZOOM_SIZE, ZOOM_SIZE)
-        zoom_surface = pygame.Surface((ZOOM_SIZE, ZOOM_SIZE))
-        zoom_surface.blit(screenshot_surface, (0, 0), zoom_rect)
-
-        screenshot = pygame.surfarray.array3d(zoom_surface)
+        if observation_format is not None:
+            output_size = (observation_format.size,) * 2
+        elif out is not None:
+            output_size = tuple(out.shape[:2])
+        else:
+            output_size = (cg.SCREENSHOT_SIZE,) * 2
+        # Draw only the cropped area
+        crop = self._draw_screenshot_surface(screen, cars, zoom_rect)
+        # Same observation size at every simulation scale, drawn into a reused surface
+        zoom_surface = scratch_surface(output_size, "screenshot")
+        if (ZOOM_SIZE, ZOOM_SIZE) != output_size:
+            pygame.transform.smoothscale(crop, output_size, zoom_surface)
+        else:
+            zoom_surface.blit(crop, (0, 0))
+
+        if observation_format is not None:
+            if out is None:
+                out = observation_format.empty()
+            screenshot = write_observation(zoom_surface, out, observation_format)
+        elif out is None:
+            screenshot = pygame.surfarray.array3d(zoom_surface)
+        else:
+            view = pygame.surfarray.pixels3d(zoom_surface)
+            out[...] = view
+            del view  # Unlocks the surface
+            screenshot = out
         # Restore original images and scaling
         self._restore_car_images_after_screenshot(cars, original_imgs, desired_car_width)
         if debug:
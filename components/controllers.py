@@ -0,0 +1,209 @@
+import asyncio
+
+import numpy as np
+
+from components.physics import step_continuous
+
+RAY_COUNT = 8
+MAX_RAY_DISTANCE = 1000  # Used for rays that have not been cast or hit no car
+# Layout of one stacked observation row
+BORDER_SLICE = slice(0, RAY_COUNT)
+CARS_SLICE = slice(RAY_COUNT, 2 * RAY_COUNT)
+PROGRESS_SLICE = slice(2 * RAY_COUNT, 2 * RAY_COUNT + 2)
+ANGLES_SLICE = slice(2 * RAY_COUNT + 2, 2 * RAY_COUNT + 4)
+OBSERVATION_SIZE = 2 * RAY_COUNT + 4
+NO_ACTION = 10  # Discrete action code of a coasting car, see Car.update
+NO_CONTINUOUS_ACTION = (0.0, 0.0, 0.0)  # Throttle, brake, steering of a coasting car
+
+# Observation parts a decider can declare in observation_parts. The engine computes only
+# the parts some car needs; missing parts are None in a state and keep their fill values
+# (MAX_RAY_DISTANCE, 0) in stacked observations. Car rays imply marching the border rays.
+BORDER_RAYS = "border_rays"
+CAR_RAYS = "car_rays"
+PROGRESS = "progress"
+ANGLES = "angles"
+SCREENSHOT = "screenshot"  # Also on whenever the engine generates screenshots
+VECTOR_PARTS = frozenset({BORDER_RAYS, CAR_RAYS, PROGRESS, ANGLES})
+ALL_PARTS = VECTOR_PARTS | {SCREENSHOT}
+
+
+class BatchController:
+    """
+    Controller deciding the actions of all active cars of a tick in a single call.
+
+    Subclasses implement act(). Discrete controllers return one action code per car
+    (the same codes as Car.update), continuous controllers (continuous = True) return
+    one (throttle, brake, steering) row per car, see components.physics.
+    observation_parts lists the parts act() reads; the engine skips the others.
+
+    Example:
+        class Forward(BatchController):
+            def act(self, observations, images=None):
+                return np.zeros(len(observations), dtype=np.int64)
+    """
+
+    continuous = False
+    observation_parts = VECTOR_PARTS
+
+    def act(self, observations, images=None):
+        """
+        :param observations: float32 array (cars, OBSERVATION_SIZE), see stack_observations.
+        :param images: uint8 array (cars, W, H, 3) of screenshots when the engine
+                       generates them, (cars,) + ObservationFormat.shape with an
+                       observation format, (cars, k) + ObservationFormat.shape with a frame
+                       stack of k frames, otherwise None.
+        :return: Array of actions, one row per observation.
+        """
+        raise NotImplementedError
+
+
+class AsyncController:
+    """
+    Controller whose per-car decisions are coroutines, e.g. requests to a model server.
+
+    Every tick the decisions of all active cars are awaited concurrently. Decisions still
+    pending at the engine's decision deadline are cancelled and the car gets
+    default_action, so one slow agent cannot stall the race. Exceptions raised by
+    decide() propagate. observation_parts lists the parts decide() reads.
+
+    Example:
+        class Remote(AsyncController):
+            async def decide(self, grid_index, observation, image=None):
+                return await self.client.predict(observation)
+    """
+
+    continuous = False
+    # Action of the cars that miss the deadline, an action code or a (throttle, brake,
+    # steering) row when continuous. None: the car coasts (NO_ACTION, NO_CONTINUOUS_ACTION)
+    default_action = None
+    observation_parts = VECTOR_PARTS
+
+    async def decide(self, grid_index, observation, image=None):
+        """
+        :param grid_index: Index of the car in the starting grid.
+        :param observation: float32 array (OBSERVATION_SIZE,), see stack_observations.
+        :param image: The car's row of the images BatchController.act would receive.
+        :return: Action code, or a (throttle, brake, steering) row when continuous.
+        """
+        raise NotImplementedError
+
+
+async def gather_actions(controller, grid_indices, observations, images=None, deadline=None):
+    """
+    Await the decisions of all cars concurrently.
+
+    :param controller: AsyncController.
+    :param grid_indices: Grid index of every observation row.
+    :param deadline: Seconds to wait for the decisions (None: wait for all of them).
+    :return: (actions, missed) - actions in row order with default_action for the cars
+             that missed the deadline, and the rows of those cars.
+    :raises ValueError: When default_action does not fit the controller's action type.
+    """
+    shape = (len(grid_indices), 3) if controller.continuous else (len(grid_indices),)
+    default_action = _default_action(controller, shape[1:])
+    tasks = [asyncio.ensure_future(controller.decide(grid_index, observations[row],
+                                                     None if images is None else images[row]))
+             for row, grid_index in enumerate(grid_indices)]
+    pending = ()
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.add_done_callback(_discard)
+            task.cancel()
+        if pending:
+            # One loop pass delivers the cancellations. Decisions that still run (catching
+            # CancelledError, awaiting in finally) are left behind, not waited for.
+            await asyncio.wait(pending, timeout=0)
+    actions = np.empty(shape, dtype=np.float32 if controller.continuous else np.int64)
+    actions[...] = default_action
+    missed = []
+    errors = []
+    for row, task in enumerate(tasks):
+        if task in pending:
+            missed.append(row)
+        elif task.exception() is not None:
+            errors.append(task.exception())
+        else:
+            actions[row] = task.result()
+    if errors:
+        raise errors[0]
+    return actions, missed
+
+
+def _default_action(controller, row_shape):
+    """
+    default_action of an AsyncController as an array of one action row.
+    :raises ValueError: When it does not fit the controller's action type.
+    """
+    action = controller.default_action
+    if action is None:
+        action = NO_CONTINUOUS_ACTION if controller.continuous else NO_ACTION
+    action = np.asarray(action)
+    if action.shape != row_shape:
+        kind = "continuous" if controller.continuous else "discrete"
+        raise ValueError(f"default_action of shape {action.shape} for a {kind} controller, "
+                         f"expected {row_shape}")
+    return action
+
+
+def _discard(task):
+    # Outcome of a decision past the deadline, retrieved so that asyncio does not log it
+    if not task.cancelled():
+        task.exception()
+
+
+def _fill(row, values):
+    if values is None:
+        return
+    for i, value in enumerate(values[:len(row)]):
+        if value is not None:
+            row[i] = value
+
+
+def stack_observations(states, out=None):
+    """
+    Stack the states returned by Car.states_generation into one float32 array.
+
+    Columns: 8 border distances, 8 car distances, next checkpoint index, distance to it,
+    car angle, angle to the next checkpoint. Missing distances (and parts that were not
+    computed) are MAX_RAY_DISTANCE, missing progress and angles 0.
+
+    :param states: List of states, one per car.
+    :param out: Optional preallocated array of shape (len(states), OBSERVATION_SIZE).
+    :return: The stacked observations.
+    """
+    if out is None:
+        out = np.empty((len(states), OBSERVATION_SIZE), dtype=np.float32)
+    out[:, BORDER_SLICE] = MAX_RAY_DISTANCE
+    out[:, CARS_SLICE] = MAX_RAY_DISTANCE
+    out[:, PROGRESS_SLICE.start:] = 0
+    for row, state in zip(out, states):
+        _fill(row[BORDER_SLICE], state[0])
+        _fill(row[CARS_SLICE], state[1])
+        _fill(row[PROGRESS_SLICE], state[2])
+        _fill(row[ANGLES_SLICE], state[3])
+    return out
+
+
+def stack_screenshots(states):
+    """Stack the screenshot part of the states, or None if the cars produced none."""
+    images = [state[4] for state in states]
+    if not images or images[0] is None:
+        return None
+    return np.stack(images)
+
+
+def apply_actions(cars, actions, all_cars, continuous=False):
+    """
+    Apply one action per car.
+
+    :param cars: Cars in the same order as the actions.
+    :param actions: Discrete action codes (cars,) or continuous actions (cars, 3).
+    :param all_cars: Cars used for collision checks.
+    :param continuous: Interpret actions as continuous controls.
+    """
+    if continuous:
+        step_continuous(cars, actions, all_cars)
+        return
+    for car, action in zip(cars, np.asarray(actions).reshape(len(cars))):
+        car.update(int(action), all_cars)
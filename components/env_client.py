@@ -0,0 +1,107 @@
+"""
+Blocking client of components.env_server, for agents in other processes or on other hosts.
+Needs only the standard library, numpy and components.env_protocol.
+
+    with EnvClient(("127.0.0.1", 5555)) as env:
+        step = env.reset(num_cars=4, seed=1)
+        while not step.done:
+            step = env.step(policy(step.observations))
+"""
+import socket
+from collections import namedtuple
+
+from components import env_protocol as protocol
+
+# Observations of the cars racing at tick (grid_indices are their rows in the grid), the
+# race totals and whether the episode is over. Arrays view the received message.
+EnvStep = namedtuple("EnvStep", "tick winners num_cars grid_indices observations images done")
+
+
+class EnvError(Exception):
+    """Error reported by the server."""
+
+
+class EnvClient:
+    """One environment session: a connection to the server."""
+
+    def __init__(self, address, timeout=None):
+        """
+        :param address: (host, port) of a TCP server or the path of a Unix socket.
+        :param timeout: Socket timeout in seconds (None: block).
+        """
+        if isinstance(address, str):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        self.request = None
+        self._header = bytearray(protocol.HEADER.size)
+
+    def reset(self, num_cars=4, map_file=None, seed=None, sim_scale=1.0, max_steps=0,
+              ghost=False, continuous=False, image_size=0, grayscale=False):
+        """
+        Start an episode.
+        :param map_file: Map path on the server (None: the server's default).
+        :param seed: Seed of the server-side random generators (None: not reseeded).
+        :param max_steps: Tick limit of the episode (0: until every car finished).
+        :param ghost: Cars neither collide with nor sense each other.
+        :param continuous: step() takes (throttle, brake, steering) rows instead of codes.
+        :param image_size: Side of the screenshot observations (0: no images).
+        :param grayscale: One channel screenshots.
+        :return: EnvStep of the first tick.
+        """
+        flags = ((protocol.FLAG_GHOST if ghost else 0)
+                 | (protocol.FLAG_CONTINUOUS if continuous else 0)
+                 | (protocol.FLAG_GRAYSCALE if grayscale else 0))
+        request = protocol.ResetRequest(-1 if seed is None else seed, num_cars, sim_scale,
+                                        max_steps, image_size, flags, map_file)
+        result = self._exchange(protocol.pack_reset(request), request)
+        # The session keeps its previous request when the server refused the reset
+        self.request = request
+        return result
+
+    def step(self, actions):
+        """
+        :param actions: One action per row of the last observations: codes (cars,) or,
+                        for continuous sessions, (cars, 3) rows.
+        :return: EnvStep of the next tick.
+        """
+        continuous = bool(self.request.flags & protocol.FLAG_CONTINUOUS)
+        return self._exchange(protocol.pack_step(actions, continuous), self.request)
+
+    def close(self):
+        try:
+            self.sock.sendall(protocol.HEADER.pack(protocol.CLOSE, 0))
+        except OSError:
+            pass
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+
+    def _exchange(self, message, request):
+        self.sock.sendall(b"".join(message))  # Actions are small, one send
+        message_type, length = protocol.parse_header(self._receive(self._header))
+        payload = self._receive(bytearray(length))
+        if message_type == protocol.ERROR:
+            raise EnvError(payload.decode())
+        if message_type != protocol.OBSERVATION:
+            raise protocol.ProtocolError(f"Unexpected message type {message_type}")
+        header, indices, observations, images = protocol.unpack_observation(
+            payload, request.image_size, bool(request.flags & protocol.FLAG_GRAYSCALE))
+        return EnvStep(header.tick, header.winners, header.num_cars, indices, observations,
+                       images, bool(header.done))
+
+    def _receive(self, buffer):
+        view = memoryview(buffer)
+        while view:
+            received = self.sock.recv_into(view)
+            if not received:
+                raise ConnectionError("Server closed the connection")
+            view = view[received:]
+        return buffer
@@ -0,0 +1,136 @@
+"""
+Binary framing of the environment server (components.env_server).
+
+Every message is a 5 byte header, message type (uint8) and payload length (uint32),
+followed by the payload. All numbers are little-endian; arrays are sent as raw bytes in
+C order. The module needs only the standard library and numpy, so agents can use it (and
+components.env_client) from another Python environment.
+
+Client to server:
+    RESET   ResetRequest header, then the map file path as UTF-8 (empty: server default)
+    STEP    uint32 number of rows, then int32 action codes (rows,) or, for continuous
+            sessions, float32 (rows, 3) throttle/brake/steering rows
+    CLOSE   empty
+
+Server to client:
+    OBSERVATION  ObservationHeader, int32 grid indices (cars,), float32 observations
+                 (cars, OBSERVATION_SIZE), then the images of the cars when the session
+                 asked for them, uint8 (cars, size, size, channels)
+    ERROR        message as UTF-8; the session stays open and may be reset
+"""
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from components.controllers import OBSERVATION_SIZE
+
+HEADER = struct.Struct("<BI")
+MAX_PAYLOAD = 1 << 30  # Larger lengths mean a broken stream
+
+RESET = 1
+STEP = 2
+CLOSE = 3
+OBSERVATION = 129
+ERROR = 255
+
+# Reset flags
+FLAG_GHOST = 1
+FLAG_CONTINUOUS = 2
+FLAG_GRAYSCALE = 4
+
+# seed (-1: none), number of cars, simulation scale, step limit (0: none), image size
+# (0: no images), flags
+RESET_STRUCT = struct.Struct("<qIdIHB")
+ResetRequest = namedtuple("ResetRequest", "seed num_cars sim_scale max_steps image_size "
+                                          "flags map_file")
+
+# tick, cars finished, grid size, cars racing now, done
+OBSERVATION_STRUCT = struct.Struct("<IIIIB")
+ObservationHeader = namedtuple("ObservationHeader", "tick winners num_cars cars done")
+
+ROWS_STRUCT = struct.Struct("<I")
+
+
+class ProtocolError(Exception):
+    """Malformed message."""
+
+
+def frame(message_type, *parts):
+    """
+    Header and payload of one message as a list of byte views, without copying arrays
+    (for transport.writelines or socket.sendmsg).
+    """
+    views = [view.cast("B") for view in map(memoryview, parts) if view.nbytes]
+    return [memoryview(HEADER.pack(message_type, sum(view.nbytes for view in views))),
+            *views]
+
+
+def parse_header(data):
+    message_type, length = HEADER.unpack(data)
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"Payload of {length} bytes")
+    return message_type, length
+
+
+def pack_reset(request):
+    return frame(RESET, RESET_STRUCT.pack(*request[:-1]), (request.map_file or "").encode())
+
+
+def unpack_reset(payload):
+    if len(payload) < RESET_STRUCT.size:
+        raise ProtocolError("Short reset message")
+    fields = RESET_STRUCT.unpack_from(payload)
+    return ResetRequest(*fields, bytes(payload[RESET_STRUCT.size:]).decode() or None)
+
+
+def pack_step(actions, continuous=False):
+    actions = np.ascontiguousarray(actions, dtype=np.float32 if continuous else np.int32)
+    return frame(STEP, ROWS_STRUCT.pack(len(actions)), actions)
+
+
+def unpack_step(payload, continuous=False):
+    """Actions of a step message as a read-only array viewing the payload."""
+    if len(payload) < ROWS_STRUCT.size:
+        raise ProtocolError("Short step message")
+    (rows,) = ROWS_STRUCT.unpack_from(payload)
+    dtype, columns = (np.float32, 3) if continuous else (np.int32, 1)
+    expected = ROWS_STRUCT.size + rows * columns * np.dtype(dtype).itemsize
+    if len(payload) != expected:
+        raise ProtocolError(f"Step message of {len(payload)} bytes, expected {expected}")
+    actions = np.frombuffer(payload, dtype=dtype, offset=ROWS_STRUCT.size)
+    return actions.reshape(rows, 3) if continuous else actions
+
+
+def image_shape(image_size, grayscale):
+    return image_size, image_size, 1 if grayscale else 3
+
+
+def pack_observation(header, indices, observations, images=None):
+    parts = [OBSERVATION_STRUCT.pack(*header),
+             np.ascontiguousarray(indices, dtype=np.int32),
+             np.ascontiguousarray(observations, dtype=np.float32)]
+    if images is not None:
+        parts.append(np.ascontiguousarray(images, dtype=np.uint8))
+    return frame(OBSERVATION, *parts)
+
+
+def unpack_observation(payload, image_size=0, grayscale=False):
+    """
+    :return: (ObservationHeader, grid indices, observations, images or None); the arrays
+             view the payload.
+    """
+    header = ObservationHeader(*OBSERVATION_STRUCT.unpack_from(payload))
+    offset = OBSERVATION_STRUCT.size
+    indices = np.frombuffer(payload, dtype=np.int32, count=header.cars, offset=offset)
+    offset += indices.nbytes
+    observations = np.frombuffer(payload, dtype=np.float32,
+                                 count=header.cars * OBSERVATION_SIZE,
+                                 offset=offset).reshape(header.cars, OBSERVATION_SIZE)
+    offset += observations.nbytes
+    images = None
+    if image_size:
+        shape = (header.cars,) + image_shape(image_size, grayscale)
+        images = np.frombuffer(payload, dtype=np.uint8, count=int(np.prod(shape)),
+                               offset=offset).reshape(shape)
+    return header, indices, observations, images
@@ -0,0 +1,209 @@
+"""
+Environment server for agents running in other processes or on other hosts.
+
+Every connection is one environment session with its own headless GameEngine. The
+client resets it (map, grid size, seed, ...) and then sends one batch of actions per
+tick, answered with the packed observations of the next tick; see
+components.env_protocol for the framing and components.env_client for a client.
+
+Sessions are served concurrently on one asyncio event loop. A tick runs on the loop
+between two socket reads, so sessions interleave tick by tick. Simulation is CPU bound:
+for more throughput than one core gives, start one server per core.
+
+    python -m components.env_server --port 5555
+    python -m components.env_server --unix /tmp/racing.sock
+"""
+import argparse
+import asyncio
+import random
+
+import numpy as np
+
+import components.globals as cg
+import game
+from components import env_protocol as protocol
+from components.controllers import VECTOR_PARTS
+from components.observation import ObservationFormat
+from components.track_cache import TrackCache
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5555
+
+
+class Session:
+    """
+    One environment of a connection. The engine is reused while the grid options match,
+    also across maps.
+    """
+
+    def __init__(self, map_file=None, track_cache=None):
+        """
+        :param map_file: Map used when a reset does not name one (default: cg.MAP_FILE).
+        :param track_cache: TrackCache shared with the other sessions.
+        """
+        self.map_file = map_file or cg.MAP_FILE
+        self.track_cache = track_cache
+        self.engine = None
+        self.request = None
+        self._options = None
+        self._initial_state = None
+        self.cars = None
+
+    @property
+    def continuous(self):
+        return self.request is not None and bool(self.request.flags & protocol.FLAG_CONTINUOUS)
+
+    def reset(self, request):
+        """Start an episode, return the frames of its first observation."""
+        if request.num_cars < 1:
+            raise ValueError("A session needs at least one car")
+        if request.seed >= 0:
+            random.seed(request.seed)
+            np.random.seed(request.seed % 2 ** 32)
+        observation_format = None
+        if request.image_size:
+            grayscale = bool(request.flags & protocol.FLAG_GRAYSCALE)
+            observation_format = ObservationFormat(size=request.image_size, grayscale=grayscale)
+        map_file = request.map_file or self.map_file
+        options = (request.num_cars, request.sim_scale, bool(request.flags & protocol.FLAG_GHOST),
+                   observation_format)
+        if options != self._options:
+            num_cars, sim_scale, ghost, observation_format = options
+            self.engine = game.GameEngine(visualize=False, num_cars=num_cars, map_file=map_file,
+                                          sim_scale=sim_scale, ghost=ghost,
+                                          screenshots=observation_format is not None,
+                                          observation_format=observation_format,
+                                          track_cache=self.track_cache,
+                                          observation_parts=VECTOR_PARTS)
+            self._initial_state = self.engine.snapshot()
+            self._options = options
+        elif map_file != self.engine.map_file:
+            # Same grid on another map: the engine switches to the cached map
+            self.engine.reset(map_file)
+            self._initial_state = self.engine.snapshot()
+        else:
+            # Same map and grid: rewinding is much cheaper than setting the cars up again
+            self.engine.restore(self._initial_state)
+        self.request = request
+        return self._observe()
+
+    def step(self, actions):
+        """Apply the actions of the cars of the last observation, return the next one."""
+        if self.engine is None:
+            raise ValueError("Reset the session before stepping")
+        if self._done():
+            raise ValueError("The episode is over, reset the session")
+        if len(actions) != len(self.cars):
+            raise ValueError(f"Got {len(actions)} actions for {len(self.cars)} cars")
+        self.engine.advance(self.cars, actions, self.continuous)
+        return self._observe()
+
+    def _done(self):
+        engine = self.engine
+        return not engine.cars or 0 < self.request.max_steps <= engine.tick
+
+    def _observe(self):
+        engine = self.engine
+        done = self._done()
+        if done:
+            self.cars = []
+            observations = np.empty((0, protocol.OBSERVATION_SIZE), dtype=np.float32)
+            images = None
+        else:
+            self.cars, observations, images = engine.observe()
+        header = protocol.ObservationHeader(engine.tick, engine.winners, len(engine.all_cars),
+                                            len(self.cars), done)
+        return protocol.pack_observation(header, [car.grid_index for car in self.cars],
+                                         observations, images)
+
+
+class EnvServer:
+    """asyncio server of environment sessions, one per connection."""
+
+    def __init__(self, map_file=None):
+        """
+        :param map_file: Default map of the sessions (default: cg.MAP_FILE).
+        """
+        self.map_file = map_file
+        self.track_cache = TrackCache()  # Maps prepared once for all sessions
+        self.sessions = 0  # Open connections
+        self.server = None
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, path=None):
+        """Listen on a TCP port, or on a Unix socket when path is given."""
+        if path is not None:
+            self.server = await asyncio.start_unix_server(self._handle, path=path)
+        else:
+            self.server = await asyncio.start_server(self._handle, host, port)
+        return self.server
+
+    @property
+    def addresses(self):
+        return [sock.getsockname() for sock in self.server.sockets]
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def _handle(self, reader, writer):
+        session = Session(self.map_file, self.track_cache)
+        self.sessions += 1
+        # Responses view engine-owned arrays: drain() then waits until they are sent
+        writer.transport.set_write_buffer_limits(high=0)
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(protocol.HEADER.size)
+                    message_type, length = protocol.parse_header(header)
+                    payload = await reader.readexactly(length)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if message_type == protocol.CLOSE:
+                    break
+                try:
+                    if message_type == protocol.RESET:
+                        response = session.reset(protocol.unpack_reset(payload))
+                    elif message_type == protocol.STEP:
+                        response = session.step(
+                            protocol.unpack_step(payload, session.continuous))
+                    else:
+                        raise protocol.ProtocolError(f"Unknown message type {message_type}")
+                except Exception as e:
+                    response = protocol.frame(protocol.ERROR,
+                                              f"{type(e).__name__}: {e}".encode())
+                writer.writelines(response)
+                await writer.drain()
+        except protocol.ProtocolError:
+            pass  # Broken stream, drop the connection
+        finally:
+            self.sessions -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+
+async def _serve(args):
+    server = EnvServer(map_file=args.map)
+    await server.start(args.host, args.port, args.unix)
+    for address in server.addresses:
+        print(f"listening on {address}", flush=True)
+    await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve racing environments over a socket.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="0 picks a free port")
+    parser.add_argument("--unix", default=None, help="listen on this Unix socket instead")
+    parser.add_argument("--map", default=None, help="default map of the sessions")
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
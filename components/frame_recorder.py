@@ -0,0 +1,129 @@
+import json
+import os
+import queue
+import threading
+
+import numpy as np
+import pygame
+
+CHUNK_FRAMES = 256  # Frames per archive
+QUEUE_FRAMES = 16  # Frames waiting for the writer before new ones are dropped
+INDEX_FILE = "index.json"
+
+
+class FrameRecorder:
+    """
+    Records frames of the race into compressed, chunked archives.
+
+    capture() reads the drawn surface through a pygame.surfarray view, optionally scaled
+    into a preallocated surface first, and hands one (height, width, 3) uint8 copy to a
+    writer thread. The writer fills a preallocated chunk and saves every CHUNK_FRAMES
+    frames as frames_<n>.npz (arrays "frames" and "ticks") with np.savez_compressed,
+    updating index.json after every chunk. When the writer falls behind, frames are
+    dropped instead of stalling the simulation, so memory stays bounded on long runs.
+
+    Use as a context manager or call close() to write the last chunk.
+    """
+
+    def __init__(self, directory, stride=1, size=None, chunk_frames=CHUNK_FRAMES,
+                 queue_frames=QUEUE_FRAMES):
+        """
+        :param directory: Output directory (created if missing).
+        :param stride: Record every n-th tick.
+        :param size: Optional (width, height) the frames are scaled to.
+        :param chunk_frames: Frames per archive.
+        :param queue_frames: Frames buffered for the writer.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.stride = max(1, int(stride))
+        self.size = tuple(size) if size is not None else None
+        self.chunk_frames = chunk_frames
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.chunks = []
+        self._scaled = None
+        self._queue = queue.Queue(maxsize=queue_frames)
+        self._writer = threading.Thread(target=self._write_loop, name="frame-writer",
+                                        daemon=True)
+        self._writer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def wants(self, tick):
+        """Whether the frame of this tick is recorded."""
+        return tick % self.stride == 0
+
+    def capture(self, surface, tick):
+        """
+        Record the surface if the tick falls on the stride.
+        :return: True if the frame was queued.
+        """
+        if not self.wants(tick):
+            return False
+        if self._queue.full():
+            self.frames_dropped += 1
+            return False
+        if self.size is not None and surface.get_size() != self.size:
+            if self._scaled is None:
+                self._scaled = pygame.Surface(self.size)
+            pygame.transform.smoothscale(surface, self.size, self._scaled)
+            surface = self._scaled
+        view = pygame.surfarray.pixels3d(surface)
+        # The only copy: the view is (width, height, 3) and locks the surface
+        frame = np.ascontiguousarray(view.transpose(1, 0, 2))
+        del view
+        self._queue.put((tick, frame))
+        self.frames_captured += 1
+        return True
+
+    def close(self):
+        """Write the remaining frames and stop the writer thread."""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    def _write_loop(self):
+        frames = None
+        ticks = []
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            tick, frame = item
+            if frames is None:
+                frames = np.empty((self.chunk_frames,) + frame.shape, dtype=np.uint8)
+            frames[len(ticks)] = frame
+            ticks.append(tick)
+            if len(ticks) == self.chunk_frames:
+                self._write_chunk(frames, ticks)
+                ticks = []
+        if ticks:
+            self._write_chunk(frames[:len(ticks)], ticks)
+
+    def _write_chunk(self, frames, ticks):
+        name = f"frames_{len(self.chunks):06d}.npz"
+        np.savez_compressed(os.path.join(self.directory, name), frames=frames,
+                            ticks=np.asarray(ticks, dtype=np.int64))
+        self.chunks.append({"file": name, "first_tick": ticks[0], "last_tick": ticks[-1],
+                            "frames": len(ticks)})
+        index = {"stride": self.stride, "frame_shape": list(frames.shape[1:]),
+                 "chunks": self.chunks}
+        with open(os.path.join(self.directory, INDEX_FILE), "w") as f:
+            json.dump(index, f, indent=2)
+
+
+def read_frames(directory):
+    """
+    Iterate over a recording made by FrameRecorder.
+    :return: Generator of (tick, frame) with frames of shape (height, width, 3).
+    """
+    with open(os.path.join(directory, INDEX_FILE), "r") as f:
+        index = json.load(f)
+    for chunk in index["chunks"]:
+        with np.load(os.path.join(directory, chunk["file"])) as archive:
+            yield from zip(archive["ticks"].tolist(), archive["frames"])
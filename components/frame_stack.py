@@ -0,0 +1,67 @@
+import numpy as np
+
+import components.globals as cg
+
+
+class FrameStack:
+    """
+    Preallocated history of the last k screenshot observations of every car.
+
+    Every frame is stored twice, k slots apart, in a buffer of 2k slots per car, so the
+    last k frames are always one contiguous slice and stacked() returns a view instead of
+    a copy. Observations are rendered straight into slot() and push() advances all cars
+    together, once per tick, without allocating.
+    """
+
+    def __init__(self, num_cars, k, frame_shape=None, dtype=np.uint8):
+        """
+        :param num_cars: Number of cars (rows).
+        :param k: Frames kept per car.
+        :param frame_shape: Shape of one frame (default: the screenshot observation,
+                            (cg.SCREENSHOT_SIZE, cg.SCREENSHOT_SIZE, 3)).
+        :param dtype: Frame dtype, e.g. np.uint8 or np.float16.
+        """
+        if k < 1:
+            raise ValueError("Frame stack needs at least one frame")
+        if frame_shape is None:
+            frame_shape = (cg.SCREENSHOT_SIZE, cg.SCREENSHOT_SIZE, 3)
+        self.k = k
+        self.buffer = np.zeros((num_cars, 2 * k) + tuple(frame_shape), dtype=dtype)
+        self.position = 0  # The stacked frames are slots position .. position + k - 1
+
+    @property
+    def frame_shape(self):
+        return self.buffer.shape[2:]
+
+    def reset(self):
+        self.buffer.fill(0)
+        self.position = 0
+
+    def slot(self, index):
+        """Writable view for the next frame of a car (replaces its oldest frame)."""
+        return self.buffer[index, self.position]
+
+    def push(self):
+        """Complete the frames written into slot() for this tick."""
+        p = self.position
+        self.buffer[:, p + self.k] = self.buffer[:, p]
+        self.position = (p + 1) % self.k
+
+    def stacked(self, indices=None):
+        """
+        Last k frames of the cars, oldest first.
+        :param indices: Car rows to return (default: all). Any other selection than all rows
+                        in order is copied.
+        :return: Array of shape (cars, k) + frame_shape.
+        """
+        window = slice(self.position, self.position + self.k)
+        if indices is None or list(indices) == list(range(len(self.buffer))):
+            return self.buffer[:, window]
+        return self.buffer[np.asarray(indices), window]
+
+    def copy(self):
+        stack = FrameStack.__new__(FrameStack)
+        stack.k = self.k
+        stack.buffer = self.buffer.copy()
+        stack.position = self.position
+        return stack
@@ -1,8 +1,25 @@
 import math
+import os
+from functools import lru_cache
+
 import pygame
 import components.globals as cg
 
 
+@lru_cache(maxsize=None)
+def load_image(name, alpha=True):
+    """
+    Load an image from the imgs directory once and share it between callers.
+    The image is converted to the display format only when a display exists.
+    :param name: File name inside imgs.
+    :param alpha: Keep per-pixel alpha when converting.
+    """
+    image = pygame.image.load(os.path.join("imgs", name))
+    if pygame.display.get_init() and pygame.display.get_surface() is not None:
+        image = image.convert_alpha() if alpha else image.convert()
+    return image
+
+
 def point_in_polygon(x, y, polygon):
     # Algorytm ray-casting
     num = len(polygon)
@@ -5,5 +5,6 @@ BACKGROUND_IMAGE = None
 
 WIDTH, HEIGHT = 1200, 800
 CAR_SIZE_RATIO = 0.2  # Ratio of car size to track width
+SCREENSHOT_SIZE = 200  # Side of the square screenshot observation in window pixels
 USED_CARS = 0
 COLORS = ["red-car.png", "white-car.png", "green-car.png", "grey-car.png", "purple-car.png"]
@@ -0,0 +1,93 @@
+"""
+Geometry hot loops as kernels over contiguous arrays.
+
+When numba is installed the kernels are JIT-compiled on first use (enabled() returns True)
+and Car uses them for its track tests and ray marching. Without numba the existing
+pure-Python implementations over tuples stay in use; the kernel sources below then run as
+plain Python and are only used by the parity checks in benchmarks/bench_kernels.py.
+"""
+import importlib.util
+import math
+
+import numpy as np
+import pygame
+
+numba = None  # Imported by compile_kernels, it adds about half a second to startup
+# None until the first enabled() call, then whether the compiled kernels are in use
+JIT = None
+
+
+def compile_kernels():
+    """Swap in the numba versions of the kernels, when numba is installed."""
+    global numba, JIT, point_in_polygon, march_border_ray
+    if JIT is not None:
+        return JIT
+    JIT = importlib.util.find_spec("numba") is not None
+    if JIT:
+        import numba
+        jit = numba.njit(cache=True, nogil=True)
+        # march_border_ray resolves point_in_polygon when it is compiled, on its first call
+        point_in_polygon = jit(_point_in_polygon)
+        march_border_ray = jit(_march_border_ray)
+    return JIT
+
+
+def enabled():
+    """Whether the compiled kernels are in use, compiling them on the first call."""
+    if JIT is None:
+        return compile_kernels()
+    return JIT
+
+
+def _point_in_polygon(x, y, polygon):
+    # Same ray casting as functions_helper.point_in_polygon, polygon is a (n, 2) array
+    num = polygon.shape[0]
+    j = num - 1
+    inside = False
+    for i in range(num):
+        xi = polygon[i, 0]
+        yi = polygon[i, 1]
+        xj = polygon[j, 0]
+        yj = polygon[j, 1]
+        if ((yi > y) != (yj > y)) and \
+                (x < (xj - xi) * (y - yi) / (yj - yi + 1e-10) + xi):
+            inside = not inside
+        j = i
+    return inside
+
+
+point_in_polygon = _point_in_polygon
+
+
+def _march_border_ray(center_x, center_y, dx, dy, max_length, track, inner):
+    # Border part of Car._cast_single_ray; track is the track mask as a [x, y] bool array.
+    # Returns the hit point, its distance and how many steps were tested on the canvas.
+    width = track.shape[0]
+    height = track.shape[1]
+    ray_length = 0
+    while ray_length < max_length:
+        test_x = int(center_x + ray_length * dx)
+        test_y = int(center_y + ray_length * dy)
+        if not (0 <= test_x < width and 0 <= test_y < height):
+            return test_x, test_y, math.hypot(test_x - center_x, test_y - center_y), ray_length
+        if not track[test_x, test_y] or point_in_polygon(test_x, test_y, inner):
+            return test_x, test_y, float(ray_length), ray_length + 1
+        ray_length += 1
+    test_x = int(center_x + max_length * dx)
+    test_y = int(center_y + max_length * dy)
+    return test_x, test_y, float(max_length), ray_length
+
+
+march_border_ray = _march_border_ray
+
+
+def as_points(points):
+    """Contiguous float64 (n, 2) array of a point list, the layout the kernels take."""
+    return np.ascontiguousarray(np.asarray(points, dtype=np.float64).reshape(-1, 2))
+
+
+def mask_to_array(mask):
+    """Bits of a pygame.Mask as a bool array indexed [x, y]."""
+    surface = mask.to_surface(setcolor=(255, 255, 255, 255), unsetcolor=(0, 0, 0, 0))
+    return np.ascontiguousarray(pygame.surfarray.array_alpha(surface) > 0)
+
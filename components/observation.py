@@ -0,0 +1,64 @@
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+import pygame
+
+import components.globals as cg
+
+
+class ObservationFormat(namedtuple("ObservationFormat", "size grayscale channels_first dtype")):
+    """
+    Layout of screenshot observations.
+
+    size: side of the square image in pixels; grayscale: one luminance channel instead of
+    RGB; channels_first: (C, H, W) instead of (H, W, C); dtype: np.uint8 (0-255) or a float
+    type such as np.float16 (0-1).
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, size=cg.SCREENSHOT_SIZE, grayscale=False, channels_first=False,
+                dtype=np.uint8):
+        return super().__new__(cls, size, grayscale, channels_first, np.dtype(dtype))
+
+    @property
+    def channels(self):
+        return 1 if self.grayscale else 3
+
+    @property
+    def shape(self):
+        if self.channels_first:
+            return self.channels, self.size, self.size
+        return self.size, self.size, self.channels
+
+    def empty(self, *leading):
+        """Uninitialized array for observations, with optional leading dimensions."""
+        return np.empty(tuple(leading) + self.shape, dtype=self.dtype)
+
+
+@lru_cache(maxsize=16)
+def scratch_surface(size, purpose):
+    """Reusable surface of the given size, one per purpose (callers must not keep it)."""
+    return pygame.Surface(size)
+
+
+def write_observation(surface, out, observation_format):
+    """
+    Convert a surface of the observation size into out without intermediate arrays:
+    pixel data is read through surfarray views and written with a single assignment.
+    :param surface: Surface of size (observation_format.size, observation_format.size).
+    :param out: Array of shape observation_format.shape.
+    """
+    if observation_format.grayscale:
+        gray = pygame.transform.grayscale(surface, scratch_surface(surface.get_size(), "gray"))
+        source = pygame.surfarray.pixels_red(gray).T[..., None]
+    else:
+        source = pygame.surfarray.pixels3d(surface).transpose(1, 0, 2)
+    target = out.transpose(1, 2, 0) if observation_format.channels_first else out
+    if np.issubdtype(out.dtype, np.floating):
+        np.multiply(source, 1 / 255, out=target, casting="unsafe")
+    else:
+        target[...] = source
+    del source  # Unlocks the surface
+    return out
@@ -0,0 +1,70 @@
+import numpy as np
+
+# Continuous control, one row per car: (throttle, brake, steering), every value in [-1, 1]
+#   throttle > 0 accelerates forward, throttle < 0 accelerates backward
+#   brake > 0 slows the car towards standstill (negative values are ignored)
+#   steering > 0 turns left, steering < 0 turns right
+THROTTLE, BRAKE, STEERING = 0, 1, 2
+ACCELERATION_PER_TICK = 1.0  # same as one discrete "UP" action
+BRAKE_PER_TICK = 1.0
+STEERING_DEGREES_PER_TICK = 5.0  # same as one discrete turn action
+
+
+def _gather(cars, name):
+    return np.fromiter((getattr(car, name) for car in cars), dtype=np.float64, count=len(cars))
+
+
+def _towards_zero(speed, amount):
+    return np.sign(speed) * np.maximum(np.abs(speed) - amount, 0.0)
+
+
+def step_continuous(cars, actions, all_cars=None):
+    """
+    Apply continuous actions to many cars at once.
+
+    Throttle, brake and steering are applied together in one vectorized update of speed,
+    angle and position. Friction scales with the released throttle, turning slows the car
+    proportionally to the steering and the speed is limited to car.max_speed. Cars that
+    collide afterwards are moved back, as in Car.update.
+
+    :param cars: Cars to update.
+    :param actions: Array-like of shape (len(cars), 3) with (throttle, brake, steering).
+    :param all_cars: Cars used for collision checks (default: cars).
+    """
+    if not cars:
+        return
+    actions = np.clip(np.asarray(actions, dtype=np.float64).reshape(len(cars), 3), -1.0, 1.0)
+    throttle = actions[:, THROTTLE]
+    brake = np.maximum(actions[:, BRAKE], 0.0)
+    steering = actions[:, STEERING]
+    active = np.fromiter((car.win is not True for car in cars), dtype=bool, count=len(cars))
+
+    x = _gather(cars, "x")
+    y = _gather(cars, "y")
+    angle = _gather(cars, "angle")
+    speed = _gather(cars, "speed")
+    max_speed = _gather(cars, "max_speed")
+    scale = _gather(cars, "scale")
+
+    speed = speed + throttle * ACCELERATION_PER_TICK
+    speed = _towards_zero(speed, brake * BRAKE_PER_TICK)
+    speed = _towards_zero(speed, (1.0 - np.abs(throttle)) * _gather(cars, "friction"))
+    speed = _towards_zero(speed, np.abs(steering) * _gather(cars, "turn_slowdown"))
+    speed = np.clip(speed, -max_speed, max_speed)
+    angle = angle + steering * STEERING_DEGREES_PER_TICK
+
+    radians = np.radians(angle)
+    new_x = x + speed * scale * np.cos(radians)
+    new_y = y - speed * scale * np.sin(radians)
+
+    for i, car in enumerate(cars):
+        if not active[i]:
+            continue
+        car.angle = float(angle[i])
+        car.speed = float(speed[i])
+        car.x = float(new_x[i])
+        car.y = float(new_y[i])
+    collision_cars = cars if all_cars is None else all_cars
+    for i, car in enumerate(cars):
+        if active[i]:
+            car._handle_collision(float(x[i]), float(y[i]), collision_cars)
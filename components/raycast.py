@@ -0,0 +1,96 @@
+import math
+
+import numpy as np
+import pygame
+
+from components.track_render import track_surface_create
+
+RAY_ANGLES = (0, 45, 90, 135, 180, 225, 270, 315)
+MAX_RAY_LENGTH = 1000
+CARS_PER_CHUNK = 64  # Bounds the (cars, rays, steps) sample arrays
+
+
+def drivable_array(inner, outer, width, height):
+    """
+    Boolean array indexed [x, y]: True between the outer and inner track lines.
+    Same area as the track mask minus the inner polygon, used by Car for border hits.
+    """
+    track_surface = track_surface_create(inner, outer, width, height)
+    pygame.draw.polygon(track_surface, (0, 0, 0, 0), inner)
+    # pygame.mask.from_surface uses the same alpha threshold
+    return pygame.surfarray.array_alpha(track_surface) > 127
+
+
+def cast_border_rays(drivable, centers, angles, max_length=MAX_RAY_LENGTH,
+                     ray_angles=RAY_ANGLES):
+    """
+    March the border rays of many cars at once.
+
+    Follows Car._cast_single_ray without the car checks: samples every pixel of length
+    along the ray and stops at the first one off the drivable area or outside the canvas.
+
+    :param drivable: Array from drivable_array.
+    :param centers: (cars, 2) ray origins in pixels.
+    :param angles: (cars,) car angles in degrees.
+    :param max_length: Ray length in pixels.
+    :param ray_angles: Ray directions relative to the car, in degrees.
+    :return: (distances (cars, rays), end points (cars, rays, 2))
+    """
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    angles = np.asarray(angles, dtype=np.float64).reshape(-1)
+    width, height = drivable.shape
+    steps = np.arange(int(math.ceil(max_length)), dtype=np.float64)
+    directions = -np.radians(angles)[:, None] + np.radians(np.asarray(ray_angles))[None, :]
+    dx, dy = np.cos(directions), np.sin(directions)
+
+    distances = np.empty(dx.shape)
+    ends = np.empty(dx.shape + (2,), dtype=np.int64)
+    for start in range(0, len(centers), CARS_PER_CHUNK):
+        chunk = slice(start, start + CARS_PER_CHUNK)
+        cx = centers[chunk, 0, None, None]
+        cy = centers[chunk, 1, None, None]
+        xs = (cx + steps * dx[chunk, :, None]).astype(np.int64)
+        ys = (cy + steps * dy[chunk, :, None]).astype(np.int64)
+        inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+        hit = ~inside
+        hit[inside] = ~drivable[xs[inside], ys[inside]]
+
+        any_hit = hit.any(axis=2)
+        first = hit.argmax(axis=2)
+        hit_x = np.take_along_axis(xs, first[..., None], axis=2)[..., 0]
+        hit_y = np.take_along_axis(ys, first[..., None], axis=2)[..., 0]
+        out_of_canvas = ~np.take_along_axis(inside, first[..., None], axis=2)[..., 0]
+
+        chunk_distances = first.astype(np.float64)
+        # Leaving the canvas measures the distance to the sampled pixel, as Car does
+        chunk_distances[out_of_canvas] = np.hypot(hit_x - cx[..., 0],
+                                                  hit_y - cy[..., 0])[out_of_canvas]
+        chunk_distances[~any_hit] = max_length
+        hit_x[~any_hit] = (cx[..., 0] + max_length * dx[chunk])[~any_hit].astype(np.int64)
+        hit_y[~any_hit] = (cy[..., 0] + max_length * dy[chunk])[~any_hit].astype(np.int64)
+
+        distances[chunk] = chunk_distances
+        ends[chunk, :, 0] = hit_x
+        ends[chunk, :, 1] = hit_y
+    return distances, ends
+
+
+def update_border_rays(cars, drivable):
+    """
+    Cast the border rays of all cars in one batch and store them on the cars, like
+    Car.get_rays_and_distances does when no other cars are sensed.
+    """
+    if not cars:
+        return
+    centers = [car.image.get_rect(center=(car.x, car.y)).center for car in cars]
+    angles = [car.angle for car in cars]
+    # All cars of an engine share the simulation scale
+    scale = cars[0].scale
+    distances, ends = cast_border_rays(drivable, centers, angles, MAX_RAY_LENGTH * scale)
+    for car, (center_x, center_y), car_distances, car_ends in zip(cars, centers, distances, ends):
+        car.rays = [(center_x, center_y, int(x), int(y)) for x, y in car_ends]
+        car.rays_to_border = car.rays
+        car.distances = [float(d) / scale for d in car_distances]
+        car.distances_to_border = car.distances
+        car.rays_to_cars = [None] * len(car.rays)
+        car.distances_to_cars = [None] * len(car.rays)
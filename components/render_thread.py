@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pygame
+
+from components.renderer import IncrementalRenderer, snapshot_cars
+
+
+class RenderThread(threading.Thread):
+    """
+    Draws the race at its own frame rate, separately from the simulation.
+
+    The simulation publishes a snapshot of the cars every tick; the thread always draws
+    the latest one and skips the rest, so a slow frame never slows the physics and a fast
+    simulation never queues up frames. When drawing takes longer than the frame interval
+    the thread does not try to catch up, it drops frames.
+
+    Events must still be pumped from the main thread. Drawing from a second thread works
+    with the Windows and X11 video drivers, not on macOS.
+    """
+
+    def __init__(self, engine, target_fps=60):
+        super().__init__(name="render", daemon=True)
+        self.engine = engine
+        self.target_fps = target_fps
+        self.renderer = IncrementalRenderer(engine)
+        if engine.window.get_size() == (engine.sim_width, engine.sim_height):
+            self.canvas = engine.window
+        else:
+            self.canvas = pygame.Surface((engine.sim_width, engine.sim_height))
+        self.frames_rendered = 0
+        self.snapshots_published = 0
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._new_snapshot = threading.Event()
+        self._stopping = threading.Event()
+
+    @property
+    def frames_dropped(self):
+        return self.snapshots_published - self.frames_rendered
+
+    def publish(self, cars):
+        """Hand the current car state to the renderer (called from the simulation)."""
+        snapshot = snapshot_cars(cars)
+        with self._lock:
+            self._snapshot = snapshot
+            self.snapshots_published += 1
+        self._new_snapshot.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._new_snapshot.set()
+        self.join()
+
+    def render(self, snapshot):
+        self.renderer.render(self.canvas, self.engine.window, snapshot)
+
+    def run(self):
+        interval = 1.0 / self.target_fps
+        next_frame = time.perf_counter()
+        while not self._stopping.is_set():
+            if not self._new_snapshot.wait(timeout=interval):
+                continue
+            self._new_snapshot.clear()
+            if self._stopping.is_set():
+                break
+            with self._lock:
+                snapshot = self._snapshot
+            self.render(snapshot)
+            if self.engine.recorder is not None:
+                # Frames drawn by this thread, the simulation tick is not known here
+                self.engine.recorder.capture(self.canvas, self.frames_rendered)
+            self.frames_rendered += 1
+
+            next_frame += interval
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                self._stopping.wait(delay)
+            else:
+                # Behind schedule: drop the missed frames instead of rendering a burst
+                next_frame = time.perf_counter()
@@ -0,0 +1,92 @@
+from collections import namedtuple
+
+import pygame
+
+from components.track_render import draw_gates
+
+RAY_COLOR = (255, 0, 0)
+RAY_WIDTH = 2
+
+# Everything the renderer needs from a car, copied by the simulation once per tick
+CarSnapshot = namedtuple("CarSnapshot", "x y angle image rays checkpoints")
+
+
+def snapshot_cars(cars):
+    """Capture the drawable state of the cars still racing."""
+    return [CarSnapshot(car.x, car.y, car.angle, car.image, car.rays, tuple(car.checkpoints))
+            for car in cars if car.win is not True]
+
+
+class IncrementalRenderer:
+    """
+    Dirty-rectangle renderer of the race.
+
+    The static part of the frame (grass, track, finish line and checkpoint gates) is drawn
+    once into a cached background. Every frame only the areas covered by cars and rays in
+    the previous frame are restored from it, sprites are drawn with one batched blit and
+    only the touched rectangles are sent to the display, so the cost follows the number of
+    cars instead of the screen area. The background is rebuilt when a checkpoint changes
+    color.
+
+    When the simulation canvas and the window differ in size the canvas is still updated
+    incrementally, but the whole frame is scaled to the window.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.background = None
+        self._gates_state = None
+        self._dirty = []
+
+    def invalidate(self):
+        """Force a full repaint on the next frame (e.g. after the map changed)."""
+        self.background = None
+
+    def _build_background(self, cars):
+        engine = self.engine
+        background = engine.track.background.copy()
+        draw_gates(background, engine.track, cars)
+        return background
+
+    def draw(self, canvas, cars):
+        """
+        Draw the cars on the canvas.
+        :param canvas: Surface of the simulation size.
+        :param cars: CarSnapshot list.
+        :return: Rectangles that changed, or None when the whole canvas was repainted.
+        """
+        gates_state = frozenset(tuple(cp) for car in cars for cp in car.checkpoints)
+        full = self.background is None or gates_state != self._gates_state
+        if full:
+            self.background = self._build_background(cars)
+            self._gates_state = gates_state
+            canvas.blit(self.background, (0, 0))
+        else:
+            canvas.blits([(self.background, rect, rect) for rect in self._dirty],
+                         doreturn=False)
+
+        sprites = []
+        for car in cars:
+            rotated_image = pygame.transform.rotate(car.image, car.angle)
+            sprites.append((rotated_image, (car.x - rotated_image.get_width() // 2,
+                                            car.y - rotated_image.get_height() // 2)))
+        dirty = canvas.blits(sprites)
+        for car in cars:
+            for start_x, start_y, end_x, end_y in car.rays:
+                dirty.append(pygame.draw.line(canvas, RAY_COLOR, (start_x, start_y),
+                                              (end_x, end_y), RAY_WIDTH))
+
+        changed = None if full else self._dirty + dirty
+        self._dirty = dirty
+        return changed
+
+    def render(self, canvas, window, cars):
+        """Draw the cars and present the changed part of the canvas on the window."""
+        changed = self.draw(canvas, cars)
+        if canvas is not window:
+            pygame.transform.scale(canvas, window.get_size(), window)
+            changed = None
+        if changed is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(changed)
@@ -0,0 +1,40 @@
+from collections import namedtuple
+
+# Mutable state of one car. Ray and distance lists are replaced, never changed in place,
+# every tick, so they are shared with the car instead of copied.
+CarState = namedtuple("CarState", "x y angle speed checkpoints win finish_tick collisions "
+                                  "rays distances rays_to_cars distances_to_cars "
+                                  "rays_to_border distances_to_border last_action")
+
+# Mutable state of a GameEngine: tick counter, finished cars, indexes of the cars still
+# racing (into engine.all_cars), one CarState per car of engine.all_cars and the
+# TelemetryState of engine.telemetry (None without telemetry)
+SimulationState = namedtuple("SimulationState", "tick winners active cars telemetry",
+                             defaults=(None,))
+
+
+def capture_car(car):
+    """Snapshot of the car's mutable state."""
+    return CarState(car.x, car.y, car.angle, car.speed, tuple(car.checkpoints), car.win,
+                    car.finish_tick, car.collisions, car.rays, car.distances,
+                    car.rays_to_cars, car.distances_to_cars, car.rays_to_border,
+                    car.distances_to_border, car.last_action)
+
+
+def restore_car(car, state):
+    """Put the car back into a state from capture_car. Images and masks are kept."""
+    car.x = state.x
+    car.y = state.y
+    car.angle = state.angle
+    car.speed = state.speed
+    car.checkpoints = list(state.checkpoints)
+    car.win = state.win
+    car.finish_tick = state.finish_tick
+    car.collisions = state.collisions
+    car.rays = state.rays
+    car.distances = state.distances
+    car.rays_to_cars = state.rays_to_cars
+    car.distances_to_cars = state.distances_to_cars
+    car.rays_to_border = state.rays_to_border
+    car.distances_to_border = state.distances_to_border
+    car.last_action = state.last_action
@@ -0,0 +1,60 @@
+class SpatialHash:
+    """
+    Uniform grid over the simulation canvas mapping each cell to the cars overlapping it.
+
+    Rebuilt once per tick from the cars' rotated bounding boxes; neighbour queries and
+    collision checks then only look at the cells around the query instead of every car.
+    Items are (car, mask, rect) tuples taken at rebuild time.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = max(1, int(cell_size))
+        self.cells = {}
+        self.items = []
+
+    def _cell_range(self, left, top, right, bottom):
+        size = self.cell_size
+        return (range(int(left // size), int(right // size) + 1),
+                range(int(top // size), int(bottom // size) + 1))
+
+    def rebuild(self, cars):
+        """Index the masks and bounding boxes of the cars still racing."""
+        self.cells = {}
+        self.items = []
+        for car in cars:
+            if car.win is True:
+                continue
+            car_mask, car_rect = car.get_mask()
+            item = (car, car_mask, car_rect)
+            self.items.append(item)
+            columns, rows = self._cell_range(car_rect.left, car_rect.top, car_rect.right - 1,
+                                             car_rect.bottom - 1)
+            for cx in columns:
+                for cy in rows:
+                    self.cells.setdefault((cx, cy), []).append(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def query_point(self, x, y):
+        """Items whose cell contains the point (may include boxes not covering it)."""
+        return self.cells.get((int(x // self.cell_size), int(y // self.cell_size)), ())
+
+    def query_rect(self, left, top, right, bottom):
+        """Items in the cells overlapping the box, each item once."""
+        columns, rows = self._cell_range(left, top, right, bottom)
+        if len(columns) * len(rows) > len(self.cells):
+            # Larger than the occupied area, scanning the items is cheaper
+            return [item for item in self.items
+                    if item[2].right > left and item[2].left <= right
+                    and item[2].bottom > top and item[2].top <= bottom]
+        found = {}
+        for cx in columns:
+            for cy in rows:
+                for item in self.cells.get((cx, cy), ()):
+                    found[id(item[0])] = item
+        return list(found.values())
+
+    def query_radius(self, x, y, radius):
+        """Items in the cells within radius of the point."""
+        return self.query_rect(x - radius, y - radius, x + radius, y + radius)
@@ -0,0 +1,48 @@
+import colorsys
+from functools import lru_cache
+
+import pygame
+
+import components.globals as cg
+from components.functions_helper import load_image
+
+TINT_BASE_IMAGE = "white-car.png"  # Recolored for cars beyond the predefined PNGs
+GOLDEN_RATIO = 0.618033988749895
+
+
+def car_tint(index):
+    """Color of the n-th car, hues spread by the golden ratio so neighbours differ."""
+    hue = (index * GOLDEN_RATIO) % 1.0
+    red, green, blue = colorsys.hsv_to_rgb(hue, 0.75, 1.0)
+    return int(red * 255), int(green * 255), int(blue * 255)
+
+
+@lru_cache(maxsize=None)
+def tinted_image(color):
+    """Base car image multiplied by the color, created once per color."""
+    image = load_image(TINT_BASE_IMAGE).copy()
+    image.fill((*color, 255), special_flags=pygame.BLEND_RGBA_MULT)
+    return image
+
+
+def car_image(index):
+    """
+    Unscaled image of the n-th car: the PNGs from cg.COLORS first, then tinted copies
+    of TINT_BASE_IMAGE, so any number of cars can be created.
+    """
+    if index < len(cg.COLORS):
+        return load_image(cg.COLORS[index])
+    return tinted_image(car_tint(index))
+
+
+@lru_cache(maxsize=1024)
+def scaled_car_image(image, width, height):
+    """
+    Scale a car image and rotate it to face along the x axis.
+    Cars with the same image and size share the result and its mask.
+    :return: (image, mask)
+    """
+    scaled_image = pygame.transform.scale(image, (width, height))
+    # Rotate the image 90 degrees to the left (counterclockwise)
+    rotated_image = pygame.transform.rotate(scaled_image, -90)
+    return rotated_image, pygame.mask.from_surface(rotated_image)
@@ -0,0 +1,208 @@
+from collections import namedtuple
+
+import numpy as np
+
+TELEMETRY_CAPACITY = 4096  # Ticks kept in the ring buffer
+ACTION_CODES = 11  # Discrete actions 0-10, see Car.update
+# Episode accumulators, copied by Telemetry.capture
+EPISODE_ARRAYS = ("gate_ticks", "action_counts", "continuous_action_sums", "total_collisions",
+                  "total_off_track", "speed_sums", "max_speed", "active_ticks",
+                  "_gates_passed")
+
+# Episode totals and ring buffer position of a Telemetry at one tick, see Telemetry.capture
+TelemetryState = namedtuple("TelemetryState", "writes cursor recorded kept arrays "
+                                              "last_collisions")
+
+
+def car_progress(car, num_gates):
+    """Share of the lap done: passed checkpoints, with the finish line as the last gate."""
+    if car.win is True:
+        return 1.0
+    return len(car.checkpoints) / (num_gates + 1)
+
+
+class Telemetry:
+    """
+    Per-tick metrics of every car in preallocated arrays.
+
+    The last `capacity` ticks are kept in a ring buffer, one row per tick and one column
+    per car (car.grid_index): speed, progress, new collisions, off-track events and whether
+    the car was still racing. Episode totals (gate times, action histogram, collisions,
+    off-track events, speed sums) are accumulated separately, so summary() covers the
+    whole episode however long it is. Recording is a handful of vectorized writes per tick.
+    """
+
+    def __init__(self, num_cars, num_gates, capacity=TELEMETRY_CAPACITY):
+        """
+        :param num_cars: Number of cars (columns).
+        :param num_gates: Number of checkpoints of the map.
+        :param capacity: Ticks kept in the ring buffer.
+        """
+        self.num_cars = num_cars
+        self.num_gates = num_gates
+        self.capacity = capacity
+        self.ticks = np.zeros(capacity, dtype=np.int64)
+        self.speed = np.zeros((capacity, num_cars), dtype=np.float32)
+        self.progress = np.zeros((capacity, num_cars), dtype=np.float32)
+        self.collisions = np.zeros((capacity, num_cars), dtype=np.int32)
+        self.off_track = np.zeros((capacity, num_cars), dtype=bool)
+        self.active = np.zeros((capacity, num_cars), dtype=bool)
+        self.writes = 0  # Rows written since creation, across episodes and restores
+        self.reset()
+
+    def reset(self):
+        """Start a new episode."""
+        self.cursor = 0  # Row of the next tick
+        self.recorded = 0  # Ticks recorded in this episode
+        self.kept = 0  # Rows of the ring buffer that belong to this episode
+        # Tick each car passed its n-th checkpoint, the finish line in the last column
+        self.gate_ticks = np.full((self.num_cars, self.num_gates + 1), -1, dtype=np.int64)
+        self.action_counts = np.zeros((self.num_cars, ACTION_CODES), dtype=np.int64)
+        self.continuous_action_sums = np.zeros((self.num_cars, 3), dtype=np.float64)
+        self.total_collisions = np.zeros(self.num_cars, dtype=np.int64)
+        self.total_off_track = np.zeros(self.num_cars, dtype=np.int64)
+        self.speed_sums = np.zeros(self.num_cars, dtype=np.float64)
+        self.max_speed = np.zeros(self.num_cars, dtype=np.float32)
+        self.active_ticks = np.zeros(self.num_cars, dtype=np.int64)
+        self._last_collisions = None
+        self._gates_passed = np.zeros(self.num_cars, dtype=np.int64)
+
+    def record(self, tick, all_cars, active_cars, off_track=(), actions=None,
+               continuous=False):
+        """
+        Record one tick.
+        :param tick: Engine tick.
+        :param all_cars: Every car of the grid, in grid_index order.
+        :param active_cars: Cars that raced this tick, in the order of actions.
+        :param off_track: Cars that left the track this tick.
+        :param actions: Actions of active_cars: discrete codes, or (throttle, brake,
+                        steering) rows with continuous.
+        """
+        row = self.cursor
+        speed = np.fromiter((abs(car.speed) for car in all_cars), dtype=np.float32,
+                            count=self.num_cars)
+        collisions = np.fromiter((car.collisions for car in all_cars), dtype=np.int64,
+                                 count=self.num_cars)
+        gates = np.fromiter((len(car.checkpoints) + (car.win is True) for car in all_cars),
+                            dtype=np.int64, count=self.num_cars)
+        active = np.zeros(self.num_cars, dtype=bool)
+        active[[car.grid_index for car in active_cars]] = True
+        off_track_row = np.zeros(self.num_cars, dtype=bool)
+        off_track_row[[car.grid_index for car in off_track]] = True
+        if self._last_collisions is None:
+            self._last_collisions = collisions
+        new_collisions = collisions - self._last_collisions
+        self._last_collisions = collisions
+
+        self.ticks[row] = tick
+        self.speed[row] = speed
+        self.progress[row] = np.minimum(gates, self.num_gates + 1) / (self.num_gates + 1)
+        self.collisions[row] = new_collisions
+        self.off_track[row] = off_track_row
+        self.active[row] = active
+
+        # Gates are passed one per tick at most, the finish line after all checkpoints
+        for car_index in np.flatnonzero(gates > self._gates_passed):
+            passed = min(gates[car_index], self.num_gates + 1)
+            self.gate_ticks[car_index, self._gates_passed[car_index]:passed] = tick
+            self._gates_passed[car_index] = passed
+
+        if actions is not None and len(active_cars):
+            rows = [car.grid_index for car in active_cars]
+            if continuous:
+                self.continuous_action_sums[rows] += np.asarray(actions, dtype=np.float64)
+            else:
+                codes = np.clip(np.asarray(actions, dtype=np.int64).reshape(len(rows)), 0,
+                                ACTION_CODES - 1)
+                np.add.at(self.action_counts, (rows, codes), 1)
+        self.total_collisions += new_collisions
+        self.total_off_track += off_track_row
+        self.speed_sums += np.where(active, speed, 0.0)
+        np.maximum(self.max_speed, speed, out=self.max_speed)
+        self.active_ticks += active
+
+        self.cursor = (row + 1) % self.capacity
+        self.recorded += 1
+        self.kept = min(self.kept + 1, self.capacity)
+        self.writes += 1
+
+    def __len__(self):
+        return self.kept
+
+    def capture(self):
+        """
+        Episode totals and ring buffer position, for GameEngine.snapshot.
+        :return: TelemetryState
+        """
+        return TelemetryState(self.writes, self.cursor, self.recorded, self.kept,
+                              {name: getattr(self, name).copy() for name in EPISODE_ARRAYS},
+                              None if self._last_collisions is None
+                              else self._last_collisions.copy())
+
+    def restore(self, state):
+        """
+        Return to a state from capture() of this telemetry or a copy of it. Episode totals
+        are rewound. The ring buffer keeps its rows up to the snapshot only when nothing was
+        recorded since; otherwise it restarts at the restored tick.
+        """
+        if self.writes != state.writes:
+            self.kept = 0
+        else:
+            self.kept = state.kept
+        self.cursor = state.cursor
+        self.recorded = state.recorded
+        for name, array in state.arrays.items():
+            setattr(self, name, array.copy())
+        self._last_collisions = None if state.last_collisions is None \
+            else state.last_collisions.copy()
+
+    def compatible(self, state):
+        """Whether a TelemetryState was captured with this number of cars and gates."""
+        return state.arrays["gate_ticks"].shape == self.gate_ticks.shape
+
+    def sync(self, all_cars):
+        """Take the cars' current collisions and gates as recorded, e.g. after a reset."""
+        self._last_collisions = np.fromiter((car.collisions for car in all_cars),
+                                            dtype=np.int64, count=self.num_cars)
+        gates = np.fromiter((len(car.checkpoints) + (car.win is True) for car in all_cars),
+                            dtype=np.int64, count=self.num_cars)
+        self._gates_passed = np.minimum(gates, self.num_gates + 1)
+
+    def recent(self, name, ticks=None):
+        """
+        Chronological copy of the last ticks of one series.
+        :param name: "ticks", "speed", "progress", "collisions", "off_track" or "active".
+        :param ticks: Number of ticks (default: everything kept).
+        :return: Array (ticks,) or (ticks, cars), oldest first.
+        """
+        count = len(self) if ticks is None else min(ticks, len(self))
+        rows = (self.cursor - count + np.arange(count)) % self.capacity
+        return getattr(self, name)[rows]
+
+    def summary(self):
+        """
+        Episode statistics, per car as arrays indexed by grid_index and over all cars.
+        :return: Dictionary of numbers and numpy arrays.
+        """
+        active_ticks = np.maximum(self.active_ticks, 1)
+        finished = self.gate_ticks[:, -1] >= 0
+        finish_ticks = self.gate_ticks[finished, -1]
+        summary = {
+            "ticks": self.recorded,
+            "finished": int(finished.sum()),
+            "completion_rate": float(finished.mean()) if self.num_cars else 0.0,
+            "finish_ticks": self.gate_ticks[:, -1].copy(),
+            "mean_finish_tick": float(finish_ticks.mean()) if len(finish_ticks) else None,
+            "gate_ticks": self.gate_ticks.copy(),
+            "progress": np.minimum(self._gates_passed, self.num_gates + 1) / (self.num_gates + 1),
+            "collisions": self.total_collisions.copy(),
+            "off_track": self.total_off_track.copy(),
+            "mean_speed": self.speed_sums / active_ticks,
+            "max_speed": self.max_speed.copy(),
+            "action_histogram": self.action_counts.copy(),
+            "mean_continuous_action": self.continuous_action_sums / active_ticks[:, None],
+        }
+        summary["total_collisions"] = int(self.total_collisions.sum())
+        summary["total_off_track"] = int(self.total_off_track.sum())
+        summary["mean_progress"] = float(summary["progress"].mean()) if self.num_cars else 0.0
+        return summary
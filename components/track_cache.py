@@ -0,0 +1,114 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from components.track_context import TrackContext
+
+TRACK_CACHE_BUDGET = 256 * 1024 ** 2  # Bytes of prepared maps kept, see TrackContext.nbytes
+
+
+class TrackCache:
+    """
+    Prepared maps (TrackContext: geometry, masks, gates, lookups and, for rendering engines,
+    the background) by map file and canvas size, least recently used first out once the
+    memory budget is exceeded.
+
+    A cached map is handed out by reference, so switching to it costs nothing; prefetch()
+    prepares upcoming maps on a background thread. Backgrounds are never drawn there:
+    drawing uses the shared render textures, so get() renders them on the caller's thread.
+    Eviction only drops the cache's reference: an engine keeps racing on its map. One
+    cache can be shared by several engines.
+    """
+
+    def __init__(self, budget=TRACK_CACHE_BUDGET, backgrounds=False):
+        """
+        :param budget: Memory budget in bytes.
+        :param backgrounds: Render the static background of every map when get() hands it
+                            out (engines that draw or take screenshots).
+        """
+        self.budget = budget
+        self.backgrounds = backgrounds
+        self.hits = 0
+        self.misses = 0
+        self._tracks = OrderedDict()
+        self._pending = {}  # Futures of maps being prefetched
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @staticmethod
+    def _key(map_file, width, height):
+        return os.path.abspath(map_file), width, height
+
+    def __len__(self):
+        return len(self._tracks)
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(track.nbytes for track in self._tracks.values())
+
+    def get(self, map_file, width, height):
+        """
+        Prepared map, loaded now unless it is cached or being prefetched.
+        :return: TrackContext
+        """
+        key = self._key(map_file, width, height)
+        with self._lock:
+            track = self._tracks.get(key)
+            if track is not None:
+                self._tracks.move_to_end(key)
+                self.hits += 1
+            future = self._pending.get(key)
+        if track is None:
+            if future is not None and not future.cancelled():
+                track = future.result()
+                self.hits += 1
+            else:
+                track = TrackContext.from_file(*key)
+                self.misses += 1
+        elif not self.backgrounds or track.has_background:
+            return track
+        if self.backgrounds:
+            track.background  # Counted by the insertion below
+        self._insert(key, track)
+        return track
+
+    def prefetch(self, map_files, width, height):
+        """Prepare maps on a background thread, so that a later get() finds them."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1,
+                                                    thread_name_prefix="track-prefetch")
+            for map_file in map_files:
+                key = self._key(map_file, width, height)
+                if key not in self._tracks and key not in self._pending:
+                    self._pending[key] = self._executor.submit(self._prefetch, key)
+
+    def clear(self):
+        with self._lock:
+            self._tracks.clear()
+
+    def close(self):
+        """Stop the prefetch thread, waiting for the map being prepared."""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def _prefetch(self, key):
+        try:
+            track = TrackContext.from_file(*key)
+            self._insert(key, track)
+            return track
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _insert(self, key, track):
+        with self._lock:
+            self._tracks[key] = track
+            self._tracks.move_to_end(key)
+            used = sum(cached.nbytes for cached in self._tracks.values())
+            while used > self.budget and len(self._tracks) > 1:
+                _, evicted = self._tracks.popitem(last=False)
+                used -= evicted.nbytes
@@ -0,0 +1,133 @@
+import json
+import math
+from collections import namedtuple
+
+import pygame
+
+import components.globals as cg
+from components import kernels
+from components.functions_helper import get_scaling_params, scale_points, lines_params_prep, \
+    load_image
+from components.raycast import drivable_array
+from components.track_lookup import TrackLookup, track_midline
+from components.track_render import track_surface_create, render_track_background
+
+TRACK_SCALE_FACTOR = 0.9  # Share of the canvas the track is fitted into
+
+# A checkpoint or the finish line: the raw map point (cars remember passed gates by it),
+# the point and its closest ends on the outer and inner line on the canvas, and the drawn
+# texture with its mask and position on the canvas
+Gate = namedtuple("Gate", "point center outer inner image rect mask")
+
+
+def _make_gate(point, outer, inner, min_x, min_y, scale):
+    mask, _, image, rect = lines_params_prep(None, point, inner, min_x, min_y, outer, scale)
+    scaled = scale_points([point], min_x, min_y, scale)[0]
+    outer_closest = min(outer, key=lambda p: math.dist(scaled, p))
+    inner_closest = min(inner, key=lambda p: math.dist(scaled, p))
+    return Gate(point, scaled, outer_closest, inner_closest, image, rect, mask)
+
+
+class TrackContext:
+    """
+    Everything derived from one map at one canvas size, built once and shared by reference
+    between the engine, the cars and the renderer, so no per-tick code touches the raw
+    map data or rescales it.
+
+    Treat it as immutable: lines are tuples and the masks and surfaces must not be drawn on.
+    """
+
+    def __init__(self, data, width, height):
+        """
+        :param data: Map data (outer_points, inner_points, checkpoints, finish_line).
+        :param width: Canvas width the track is fitted into.
+        :param height: Canvas height the track is fitted into.
+        """
+        self.data = data
+        self.width = width
+        self.height = height
+        self.min_x, self.min_y, self.scale = get_scaling_params(
+            [data["outer_points"], data["inner_points"]], width, height,
+            scale_factor=TRACK_SCALE_FACTOR)
+        self.outer = tuple(scale_points(data["outer_points"], self.min_x, self.min_y,
+                                        self.scale))
+        self.inner = tuple(scale_points(data["inner_points"], self.min_x, self.min_y,
+                                        self.scale))
+        # Line layouts of the compiled kernels (components.kernels)
+        self.outer_array = kernels.as_points(self.outer)
+        self.inner_array = kernels.as_points(self.inner)
+        self.finish_point = self.scale_point(data["finish_line"]["point"])
+        outer_closest = min(self.outer, key=lambda p: math.dist(self.finish_point, p))
+        inner_closest = min(self.inner, key=lambda p: math.dist(self.finish_point, p))
+        self.track_width = math.dist(outer_closest, inner_closest)
+
+        self.checkpoints = data["checkpoints"]
+        if cg.FINISH_TEXTURE is None:
+            cg.FINISH_TEXTURE = load_image("finish.png")
+        gate_args = (self.outer, self.inner, self.min_x, self.min_y, self.scale)
+        self.gates = tuple(_make_gate(point, *gate_args) for point in self.checkpoints)
+        self.finish_gate = _make_gate(data["finish_line"]["point"], *gate_args)
+
+        self.track_mask = pygame.mask.from_surface(
+            track_surface_create(self.inner, self.outer, width, height))
+        # Middle of the track, for the starting grid and the lookup directions
+        self.midline = tuple(map(tuple, track_midline(self.inner, self.outer).tolist()))
+        self.lookup = TrackLookup(self.inner, self.outer, width, height, midline=self.midline)
+        self._drivable = None
+        self._track_bits = None
+        self._background = None
+
+    @classmethod
+    def from_file(cls, file_path, width, height):
+        with open(file_path, "r") as f:
+            return cls(json.load(f), width, height)
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    @property
+    def drivable(self):
+        """Boolean [x, y] array of the drivable area, built on first use (ghost rays)."""
+        if self._drivable is None:
+            self._drivable = drivable_array(self.inner, self.outer, self.width, self.height)
+        return self._drivable
+
+    @property
+    def background(self):
+        """
+        Grass and track at the canvas size, rendered on first use (drawing, screenshots) on
+        the calling thread. Owned by the context, so it goes with it.
+        """
+        if self._background is None:
+            self._background = render_track_background(self.data, self.width, self.height)
+        return self._background
+
+    @property
+    def has_background(self):
+        return self._background is not None
+
+    @property
+    def nbytes(self):
+        """Approximate memory held: surfaces, masks and arrays, lazy ones once built."""
+        gates = self.gates + (self.finish_gate,)
+        surfaces = [gate.image for gate in gates]
+        if self._background is not None:
+            surfaces.append(self._background)
+        masks = [self.track_mask] + [gate.mask for gate in gates]
+        arrays = [self.outer_array, self.inner_array, self.lookup.widths,
+                  self.lookup.directions, self._drivable, self._track_bits]
+        return (sum(s.get_width() * s.get_height() * s.get_bytesize() for s in surfaces)
+                + sum(m.get_size()[0] * m.get_size()[1] // 8 for m in masks)
+                + sum(a.nbytes for a in arrays if a is not None))
+
+    @property
+    def track_bits(self):
+        """track_mask as a boolean [x, y] array, built on first use (compiled ray kernel)."""
+        if self._track_bits is None:
+            self._track_bits = kernels.mask_to_array(self.track_mask)
+        return self._track_bits
+
+    def scale_point(self, point):
+        """Map coordinates to canvas pixels."""
+        return scale_points([point], self.min_x, self.min_y, self.scale)[0]
@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+
+LOOKUP_CELL_SIZE = 8  # Grid resolution in simulation pixels
+_CHUNK = 1024  # Cells per distance matrix, keeps memory bounded on detailed tracks
+
+
+def _closest_indexes(points, line):
+    """Index of the closest line point for every point."""
+    closest = np.empty(len(points), dtype=np.int64)
+    line_norms = (line ** 2).sum(axis=1)
+    for start in range(0, len(points), _CHUNK):
+        block = points[start:start + _CHUNK]
+        # |p - q|^2 without the |p|^2 term, which does not change the argmin
+        distances = line_norms[None, :] - 2 * block @ line.T
+        closest[start:start + _CHUNK] = distances.argmin(axis=1)
+    return closest
+
+
+def track_midline(inner_line, outer_line):
+    """
+    Approximate the middle of the track: for every inner point the midpoint between it
+    and the closest outer point.
+    :return: float64 array (points, 2), closed implicitly.
+    """
+    inner = np.asarray(inner_line, dtype=np.float64)
+    outer = np.asarray(outer_line, dtype=np.float64)
+    return (inner + outer[_closest_indexes(inner, outer)]) / 2
+
+
+class TrackLookup:
+    """
+    Local track width and centerline direction, precomputed on a coarse grid.
+
+    Built once per map and canvas size; every lookup is then two array reads instead of
+    nearest-point scans over both track lines. The width of a cell is measured as in
+    Car.track_width_calculation (distance between the closest outer and inner points to
+    the cell centre), the direction is the unit tangent of the track centerline in the
+    order of the inner points.
+    """
+
+    def __init__(self, inner_line, outer_line, width, height, cell_size=LOOKUP_CELL_SIZE,
+                 midline=None):
+        """
+        :param inner_line: Scaled inner track line.
+        :param outer_line: Scaled outer track line.
+        :param width: Canvas width the lines were scaled to.
+        :param height: Canvas height the lines were scaled to.
+        :param cell_size: Grid cell side in pixels.
+        :param midline: track_midline of the lines, when the caller already has it.
+        """
+        self.cell_size = cell_size
+        inner = np.asarray(inner_line, dtype=np.float64)
+        outer = np.asarray(outer_line, dtype=np.float64)
+        columns = max(1, math.ceil(width / cell_size))
+        rows = max(1, math.ceil(height / cell_size))
+        grid_x, grid_y = np.meshgrid((np.arange(columns) + 0.5) * cell_size,
+                                     (np.arange(rows) + 0.5) * cell_size, indexing="ij")
+        centers = np.column_stack((grid_x.ravel(), grid_y.ravel()))
+
+        inner_closest = _closest_indexes(centers, inner)
+        outer_closest = _closest_indexes(centers, outer)
+        widths = np.hypot(*(outer[outer_closest] - inner[inner_closest]).T)
+        self.widths = widths.reshape(columns, rows).astype(np.float32)
+
+        # Centerline through the middle of every inner point and its closest outer point
+        if midline is None:
+            midline = track_midline(inner, outer)
+        midline = np.asarray(midline, dtype=np.float64)
+        tangents = np.roll(midline, -1, axis=0) - np.roll(midline, 1, axis=0)
+        lengths = np.hypot(tangents[:, 0], tangents[:, 1])
+        tangents /= np.where(lengths > 0, lengths, 1.0)[:, None]
+        self.directions = tangents[inner_closest].reshape(columns, rows, 2).astype(np.float32)
+
+    def _cell(self, x, y):
+        columns, rows = self.widths.shape
+        column = min(max(int(x // self.cell_size), 0), columns - 1)
+        row = min(max(int(y // self.cell_size), 0), rows - 1)
+        return column, row
+
+    def width_at(self, x, y):
+        """Track width around a point of the canvas."""
+        return float(self.widths[self._cell(x, y)])
+
+    def direction_at(self, x, y):
+        """Unit (dx, dy) of the centerline around a point of the canvas."""
+        dx, dy = self.directions[self._cell(x, y)]
+        return float(dx), float(dy)
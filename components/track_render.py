@@ -0,0 +1,245 @@
+import math
+import pygame
+
+import components.globals as cg
+from components.functions_helper import get_scaling_params, scale_points, lines_params_prep, \
+    load_image
+
+BG_COLOR = (30, 30, 30)
+INNER_COLOR = (200, 50, 50)  # (50, 50, 200)
+OUTER_COLOR = (200, 50, 50)
+TRACK_COLOR = (50, 200, 50)
+FINISH_COLOR = (255, 255, 0)
+TRACK_BACKGROUNDS = 4  # Cached (map, size) combinations
+
+_track_backgrounds = {}
+
+
+def load_render_textures(width=cg.WIDTH, height=cg.HEIGHT):
+    """
+    Load the track and background textures scaled to the given size.
+    Only needed for drawing, simulation-only runs never call it.
+    """
+    if cg.TRACK_IMAGE is None or cg.TRACK_IMAGE.get_size() != (width, height):
+        cg.TRACK_IMAGE = pygame.transform.scale(load_image("road.jpg", alpha=False),
+                                                (width, height))
+    if cg.BACKGROUND_IMAGE is None or cg.BACKGROUND_IMAGE.get_size() != (width, height):
+        # Load and scale the background image to fill the entire screen
+        cg.BACKGROUND_IMAGE = pygame.transform.scale(load_image("grass.jpg", alpha=False),
+                                                     (width, height))
+
+
+def draw_finish_line(screen, data, width, height, outer_line, inner_line):
+    """
+    Draw the finish line between the outer and inner lines.
+    :param screen: Pygame surface to draw on.
+    :param data: Map data containing the finish line point.
+    :param width: Width of the screen.
+    :param height: Height of the screen.
+    :param outer_line: Scaled outer line points.
+    :param inner_line: Scaled inner line points.
+    """
+    # Extract the center point of the finish line
+    center_point = data["finish_line"]["point"]
+
+    # Scale the center point
+    min_x, min_y, scale = get_scaling_params([data["outer_points"], data["inner_points"]], width,
+                                             height,
+                                             scale_factor=0.9)
+
+    _, _, rotated_finish, finish_rect = lines_params_prep(None, center_point, inner_line, min_x,
+                                                          min_y, outer_line, scale)
+
+    # Draw the finish line image on the screen
+    screen.blit(rotated_finish, finish_rect.topleft)
+
+
+def draw_checkpoints_line(screen, data, width, height, outer_line, inner_line, cars):
+    """
+    Draw the checkpoints line between the outer and inner lines.
+    :param screen: Pygame surface to draw on.
+    :param data: Map data containing the finish line point.
+    :param width: Width of the screen.
+    :param height: Height of the screen.
+    :param outer_line: Scaled outer line points.
+    :param inner_line: Scaled inner line points.
+    """
+    checkpoints_points = data["checkpoints"]
+    min_x, min_y, scale = get_scaling_params([data["outer_points"], data["inner_points"]], width,
+                                             height, scale_factor=0.9)
+
+    for checkpoint in checkpoints_points:
+        # Scale the checkpoint point
+        checkpoint_scaled = scale_points([checkpoint], min_x, min_y, scale)[0]
+
+        # Find the closest points on the outer and inner lines
+        outer_closest = min(outer_line, key=lambda p: math.dist(checkpoint_scaled, p))
+        inner_closest = min(inner_line, key=lambda p: math.dist(checkpoint_scaled, p))
+
+        # Check if any car has passed the checkpoint
+        passed = any(checkpoint in car.checkpoints for car in cars)
+        color = (0, 255, 0) if passed else (255, 255, 0)
+
+        pygame.draw.line(screen, color, outer_closest, inner_closest, 5)
+
+
+def draw_gates(screen, track, cars):
+    """
+    Draw the finish line and the checkpoint lines of a TrackContext, checkpoints passed by
+    any car in green. Same result as draw_finish_line and draw_checkpoints_line without
+    rescaling the map.
+    """
+    finish = track.finish_gate
+    screen.blit(finish.image, finish.rect.topleft)
+    for gate in track.gates:
+        passed = any(gate.point in car.checkpoints for car in cars)
+        color = (0, 255, 0) if passed else (255, 255, 0)
+        pygame.draw.line(screen, color, gate.outer, gate.inner, 5)
+
+
+def draw_track(screen, data):
+    outer_raw = data["outer_points"]
+    inner_raw = data["inner_points"]
+    width, height = screen.get_size()
+
+    min_x, min_y, scale = get_scaling_params([outer_raw, inner_raw],
+                                             width, height, scale_factor=0.9)
+    outer = scale_points(outer_raw, min_x, min_y, scale)
+    inner = scale_points(inner_raw, min_x, min_y, scale)
+    load_render_textures(width, height)
+
+    # Create a surface for the track
+    track_surface = track_surface_create(inner, outer, width, height)
+
+    # Apply the track image to the surface
+    track_surface.blit(cg.TRACK_IMAGE, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
+
+    screen.blit(track_surface, (0, 0))
+
+    inner_surface = pygame.Surface((width, height), pygame.SRCALPHA)
+    inner_surface.fill((0, 0, 0, 0))
+    pygame.draw.polygon(inner_surface, (255, 255, 255), inner)
+    inner_surface.blit(cg.BACKGROUND_IMAGE, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
+
+    # Drawing on the screen
+    screen.blit(inner_surface, (0, 0))
+
+    pygame.draw.lines(screen, OUTER_COLOR, True, outer, 5)
+    pygame.draw.lines(screen, INNER_COLOR, True, inner, 5)
+
+    # Draw arrows with track direction, sized relative to the window canvas
+    render_scale = width / cg.WIDTH
+    draw_track_direction_arrows(screen, inner, outer, arrow_length=40 * render_scale,
+                                arrow_width=max(1, int(6 * render_scale)))
+
+    return outer, inner
+
+
+def render_track_background(data, width, height):
+    """
+    Background and track of a map without gates or cars on a new surface.
+    Draws with the shared render textures: call it from the thread that draws.
+    """
+    load_render_textures(width, height)
+    surface = pygame.Surface((width, height))
+    surface.blit(cg.BACKGROUND_IMAGE, (0, 0))
+    draw_track(surface, data)
+    return surface
+
+
+def track_background(data, width, height):
+    """
+    render_track_background drawn once per map and size, for callers without a
+    TrackContext. The surface is shared, callers copy areas out of it instead of drawing
+    on it.
+    """
+    key = (id(data), width, height)
+    cached = _track_backgrounds.get(key)
+    if cached is None or cached[0] is not data:
+        if len(_track_backgrounds) >= TRACK_BACKGROUNDS:
+            _track_backgrounds.clear()
+        # The map is kept with the surface so its id cannot be reused while cached
+        cached = _track_backgrounds[key] = (data, render_track_background(data, width, height))
+    return cached[1]
+
+
+def track_surface_create(inner, outer, width, height):
+    track_surface = pygame.Surface((width, height), pygame.SRCALPHA)
+    track_surface.fill((0, 0, 0, 0))
+    pygame.draw.polygon(track_surface, (255, 255, 255), outer)
+    pygame.draw.polygon(track_surface, (0, 0, 0), inner)
+    return track_surface
+
+
+def generate_track_mask(data, width, height):
+    # Pobierz punkty toru
+    outer_raw = data["outer_points"]
+    inner_raw = data["inner_points"]
+
+    # Oblicz skalowanie i przeskaluj punkty
+    min_x, min_y, scale = get_scaling_params([outer_raw, inner_raw],
+                                             width, height, scale_factor=0.9)
+    outer = scale_points(outer_raw, min_x, min_y, scale)
+    inner = scale_points(inner_raw, min_x, min_y, scale)
+
+    # Stwórz powierzchnię toru
+    track_surface = track_surface_create(inner, outer, width, height)
+
+    # Wygeneruj maskę z powierzchni
+    track_mask = pygame.mask.from_surface(track_surface)
+    return track_mask
+
+
+def draw_track_direction_arrows(screen, inner, outer, arrow_color=(255, 0, 255), arrow_length=40,
+                                arrow_width=6, step=10):
+    """
+    Draw arrows along the centerline of the track to indicate direction.
+    :param screen: Pygame surface to draw on.
+    :param inner: List of inner track points (scaled).
+    :param outer: List of outer track points (scaled).
+    :param arrow_color: Color of the arrows.
+    :param arrow_length: Length of each arrow.
+    :param arrow_width: Width of the arrow shaft.
+    :param step: Distance between arrows (in points, not pixels).
+    """
+    num_points = min(len(inner), len(outer))
+    for i in range(0, num_points, step):
+        # Get corresponding points
+        p_inner = inner[i % len(inner)]
+        p_outer = outer[i % len(outer)]
+        # Centerline point
+        cx = (p_inner[0] + p_outer[0]) / 2
+        cy = (p_inner[1] + p_outer[1]) / 2
+
+        # Next centerline point for direction
+        next_i = (i + 1) % num_points
+        p_inner_next = inner[next_i % len(inner)]
+        p_outer_next = outer[next_i % len(outer)]
+        nx = (p_inner_next[0] + p_outer_next[0]) / 2
+        ny = (p_inner_next[1] + p_outer_next[1]) / 2
+
+        # Reverse direction vector to fix arrow direction
+        dx = cx - nx
+        dy = cy - ny
+        length = math.hypot(dx, dy)
+        if length == 0:
+            continue
+        dx /= length
+        dy /= length
+
+        # Arrow shaft
+        end_x = cx + dx * arrow_length
+        end_y = cy + dy * arrow_length
+        pygame.draw.line(screen, arrow_color, (cx, cy), (end_x, end_y), arrow_width)
+
+        # Arrow head
+        head_size = arrow_length * 0.4
+        angle = math.atan2(dy, dx)
+        left_angle = angle + math.radians(150)
+        right_angle = angle - math.radians(150)
+        left_x = end_x + head_size * math.cos(left_angle)
+        left_y = end_y + head_size * math.sin(left_angle)
+        right_x = end_x + head_size * math.cos(right_angle)
+        right_y = end_y + head_size * math.sin(right_angle)
+        pygame.draw.polygon(screen, arrow_color,
+                            [(end_x, end_y), (left_x, left_y), (right_x, right_y)])
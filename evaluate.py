@@ -0,0 +1,178 @@
+"""
+Batch evaluation of a controller over many maps, seeds and starting grids.
+
+Episodes run headless in a process pool, each with a step and a wall-clock limit.
+Results are printed as JSON lines as soon as each episode finishes, followed by a
+summary report.
+
+The controller is given as "module:factory". The factory is called with the episode
+seed and returns a components.controllers.BatchController, e.g.
+
+    python evaluate.py my_agents:make_controller --maps generated_maps --seeds 10 --cars 4 8
+"""
+import argparse
+import glob
+import importlib
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import components.globals as cg
+import game
+from components.telemetry import car_progress
+
+DEFAULT_MAX_STEPS = 3000
+DEFAULT_MAX_SECONDS = 60.0
+
+Episode = namedtuple("Episode", "map_file seed num_cars")
+EpisodeResult = namedtuple("EpisodeResult", "map_file seed num_cars steps seconds finished "
+                                            "finish_steps collisions progress timed_out error")
+
+
+def load_controller(spec, seed):
+    """Create a controller from a "module:factory" spec."""
+    module_name, _, attribute = spec.partition(":")
+    if not attribute:
+        raise ValueError(f"Controller must be given as module:factory, got {spec!r}")
+    factory = getattr(importlib.import_module(module_name), attribute)
+    return factory(seed)
+
+
+def run_episode(episode, controller_spec, max_steps=DEFAULT_MAX_STEPS,
+                max_seconds=DEFAULT_MAX_SECONDS, engine_options=None):
+    """
+    Race one episode headless.
+
+    :param episode: Episode to run.
+    :param controller_spec: "module:factory" of the controller.
+    :param max_steps: Tick limit of the episode.
+    :param max_seconds: Wall-clock limit of the episode.
+    :param engine_options: Extra keyword arguments of GameEngine (e.g. sim_scale, ghost).
+    :return: EpisodeResult
+    """
+    random.seed(episode.seed)
+    np.random.seed(episode.seed % 2 ** 32)
+    started = time.perf_counter()
+    try:
+        engine = game.GameEngine(visualize=False, num_cars=episode.num_cars,
+                                 map_file=episode.map_file,
+                                 controller=load_controller(controller_spec, episode.seed),
+                                 **(engine_options or {}))
+        engine.main_loop(max_steps=max_steps, max_seconds=max_seconds)
+    except Exception as e:
+        return EpisodeResult(episode.map_file, episode.seed, episode.num_cars, 0,
+                             time.perf_counter() - started, 0, [], 0, 0.0, False,
+                             f"{type(e).__name__}: {e}")
+    num_gates = len(engine.data["checkpoints"])
+    cars = engine.all_cars
+    return EpisodeResult(
+        episode.map_file, episode.seed, episode.num_cars, engine.tick,
+        time.perf_counter() - started, engine.winners,
+        sorted(car.finish_tick for car in cars if car.finish_tick is not None),
+        sum(car.collisions for car in cars),
+        statistics.fmean(car_progress(car, num_gates) for car in cars),
+        engine.winners < engine.cars_number, None)
+
+
+def evaluate(episodes, controller_spec, workers=None, **options):
+    """
+    Run the episodes in a process pool.
+
+    :param episodes: Iterable of Episode.
+    :param controller_spec: "module:factory" of the controller.
+    :param workers: Number of worker processes (None - number of CPUs).
+    :param options: Keyword arguments passed to run_episode.
+    :return: Generator of EpisodeResult in completion order.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(run_episode, episode, controller_spec, **options)
+                   for episode in episodes]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def summarize(results, elapsed):
+    """Aggregate statistics of finished episodes."""
+    completed = [r for r in results if r.error is None]
+    cars = sum(r.num_cars for r in completed)
+    finish_steps = [steps for r in completed for steps in r.finish_steps]
+    return {
+        "episodes": len(results),
+        "failed": len(results) - len(completed),
+        "timed_out": sum(r.timed_out for r in completed),
+        "completion_rate": sum(r.finished for r in completed) / cars if cars else 0.0,
+        "mean_finish_steps": statistics.fmean(finish_steps) if finish_steps else None,
+        "mean_finish_seconds": (statistics.fmean(finish_steps) / game.TICKS_PER_SECOND
+                                if finish_steps else None),
+        "collisions_per_episode": (statistics.fmean(r.collisions for r in completed)
+                                   if completed else 0.0),
+        "mean_progress": statistics.fmean(r.progress for r in completed) if completed else 0.0,
+        "wall_seconds": elapsed,
+        "episodes_per_minute": len(results) / elapsed * 60 if elapsed > 0 else 0.0,
+    }
+
+
+def report(summary, file=sys.stderr):
+    print(f"episodes          {summary['episodes']} "
+          f"({summary['failed']} failed, {summary['timed_out']} hit a limit)", file=file)
+    print(f"completion rate   {summary['completion_rate']:.1%}", file=file)
+    if summary["mean_finish_steps"] is not None:
+        print(f"finish time       {summary['mean_finish_steps']:.0f} steps "
+              f"({summary['mean_finish_seconds']:.1f}s simulated)", file=file)
+    print(f"collisions        {summary['collisions_per_episode']:.1f} per episode", file=file)
+    print(f"progress          {summary['mean_progress']:.1%}", file=file)
+    print(f"throughput        {summary['episodes_per_minute']:.1f} episodes/min "
+          f"({summary['wall_seconds']:.1f}s)", file=file)
+
+
+def find_maps(paths):
+    """Map files from a list of files and directories (all *.json inside)."""
+    maps = []
+    for path in paths:
+        if os.path.isdir(path):
+            maps.extend(sorted(glob.glob(os.path.join(path, "*.json"))))
+        else:
+            maps.append(path)
+    return maps
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate a controller over many episodes.")
+    parser.add_argument("controller", help="module:factory returning a BatchController")
+    parser.add_argument("--maps", nargs="+", default=[cg.MAP_FILE],
+                        help="map files or directories of maps")
+    parser.add_argument("--seeds", type=int, default=1, help="seeds per map and grid")
+    parser.add_argument("--seed", type=int, default=0, help="first seed")
+    parser.add_argument("--cars", type=int, nargs="+", default=[4], help="starting grid sizes")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    parser.add_argument("--max-steps", type=int, default=DEFAULT_MAX_STEPS)
+    parser.add_argument("--max-seconds", type=float, default=DEFAULT_MAX_SECONDS)
+    parser.add_argument("--sim-scale", type=float, default=1.0)
+    parser.add_argument("--ghost", action="store_true", help="cars do not interact")
+    args = parser.parse_args()
+
+    episodes = [Episode(map_file, seed, num_cars) for map_file, seed, num_cars
+                in itertools.product(find_maps(args.maps),
+                                     range(args.seed, args.seed + args.seeds), args.cars)]
+    engine_options = {"sim_scale": args.sim_scale, "ghost": args.ghost}
+    started = time.perf_counter()
+    results = []
+    for result in evaluate(episodes, args.controller, workers=args.workers,
+                           max_steps=args.max_steps, max_seconds=args.max_seconds,
+                           engine_options=engine_options):
+        results.append(result)
+        print(json.dumps(result._asdict()), flush=True)
+    report(summarize(results, time.perf_counter() - started))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,45 @@
 import pygame
+import asyncio
+import copy
 import json
 import os
 import math
+import time
+from bisect import bisect_right
+
+import numpy as np
 
 import components.globals as cg
-from components.functions_helper import get_scaling_params, scale_points, lines_params_prep
+from components.functions_helper import load_image
 from components.car_class import Car
+from components.controllers import stack_observations, stack_screenshots, apply_actions, \
+    AsyncController, gather_actions, BORDER_RAYS, CAR_RAYS, SCREENSHOT
+from components.render_thread import RenderThread
+from components.renderer import IncrementalRenderer, snapshot_cars
+from components.frame_stack import FrameStack
+from components.observation import ObservationFormat
+from components.raycast import update_border_rays
+from components.snapshot import SimulationState, capture_car, restore_car
+from components.spatial_hash import SpatialHash
+from components.telemetry import Telemetry, TELEMETRY_CAPACITY
+from components.track_cache import TrackCache
+from components.track_render import draw_track, draw_finish_line, draw_checkpoints_line, \
+    track_surface_create, generate_track_mask, draw_track_direction_arrows, \
+    load_render_textures  # noqa: F401
 
 cg.MAP_FILE = os.path.join("map_generators", "map_data.json")
 
 # Constants
 
-BG_COLOR = (30, 30, 30)
-INNER_COLOR = (200, 50, 50)  # (50, 50, 200)
-OUTER_COLOR = (200, 50, 50)
-TRACK_COLOR = (50, 200, 50)
-FINISH_COLOR = (255, 255, 0)
+TICKS_PER_SECOND = 60  # Real-time simulation rate
 
 ROW_OFFSET_FACTOR = 1.5
 OFFSET_DISTANCE_FACTOR = 3
 CAR_LENGTH_RATIO = 2
 CAR_SPACING_FACTOR = 2.1
 PERPENDICULAR_ANGLE_OFFSET = 90
+SPATIAL_CELL_FACTOR = 2  # Spatial hash cell size in car lengths
+RAY_PARTS = frozenset({BORDER_RAYS, CAR_RAYS})  # Observation parts that need cast rays
 
 
 def load_map(file_path):
@@ -30,14 +48,50 @@ def load_map(file_path):
     return data
 
 
+def _path_walker(path, start_point, forward):
+    """
+    Prepare walking along a closed path from the vertex closest to start_point, in the
+    direction that agrees with the forward vector.
+    :return: Function mapping a signed arc length to ((x, y), unit tangent).
+    """
+    start = min(range(len(path)), key=lambda i: math.dist(start_point, path[i]))
+    path = path[start:] + path[:start]
+    if len(path) > 1:
+        tx, ty = path[1][0] - path[0][0], path[1][1] - path[0][1]
+        if tx * forward[0] + ty * forward[1] < 0:
+            path = [path[0]] + path[:0:-1]
+    cumulative = [0.0]
+    for i in range(len(path)):
+        cumulative.append(cumulative[-1] + math.dist(path[i], path[(i + 1) % len(path)]))
+    total = cumulative[-1]
+
+    def walk(distance):
+        distance %= total
+        i = min(bisect_right(cumulative, distance) - 1, len(path) - 1)
+        a, b = path[i], path[(i + 1) % len(path)]
+        segment = cumulative[i + 1] - cumulative[i]
+        t = (distance - cumulative[i]) / segment if segment else 0.0
+        tangent = ((b[0] - a[0]) / segment, (b[1] - a[1]) / segment) if segment else forward
+        return (a[0] + t * (b[0] - a[0]), a[1] + t * (b[1] - a[1])), tangent
+
+    return walk, total
+
+
 def calculate_starting_positions(finish_line, outer_line,
-                                 inner_line, num_cars, offset_distance, row_offset, spacing):
+                                 inner_line, num_cars, offset_distance, row_offset, spacing,
+                                 columns=2, track_path=None, car_length=None):
     """
     Calculates the starting positions and angles for cars on the starting line.
     The function finds the closest points on the outer and inner track lines to the finish line,
     determines the orientation of the starting line, and places cars in rows and columns
     with the correct angle so that the front of the car always faces the track.
 
+    Without track_path the rows are laid out on a straight line and every car looks across
+    the finish line (as Car.fix_angle). With it, rows follow the path behind the start, so
+    cars stay on the track, and every car looks along the path at its row; when the rows
+    would not fit in one lap, row_offset is reduced to spread them over the whole lap, as
+    long as no car comes closer than car_length to the car ahead of it.
+
     :param finish_line: The finish line point (tuple)
     :param outer_line: List of points of the outer track line
     :param inner_line: List of points of the inner track line
@@ -45,7 +99,12 @@ def calculate_starting_positions(finish_line, outer_line,
     :param offset_distance: Distance from the finish line to the first row of cars
     :param row_offset: Distance between rows of cars
     :param spacing: Distance between cars in a row
+    :param columns: Number of cars in a row
+    :param track_path: Optional closed line along the track (e.g. TrackContext.midline)
+    :param car_length: Shortest distance between consecutive cars of a column along
+                       track_path (None: not checked)
     :return: List of tuples (x, y, angle) for each car
+    :raises ValueError: If the rows do not fit in one lap of track_path
     """
 
     # Find the closest points on the outer and inner lines to the finish line
@@ -61,11 +120,8 @@ def calculate_starting_positions(finish_line, outer_line,
     if length == 0:
         raise ValueError("Finish line points are identical!")
 
-    # Car angle: along the finish line (front facing the track)
-    if abs(dx) > abs(dy):
-        car_angle = math.degrees(math.atan2(dy, dx)) + PERPENDICULAR_ANGLE_OFFSET
-    else:
-        car_angle = math.degrees(math.atan2(dy, dx)) - PERPENDICULAR_ANGLE_OFFSET
+    # Car angle: across the finish line (front facing the track), as Car.fix_angle
+    car_angle = math.degrees(math.atan2(-dy, dx)) + PERPENDICULAR_ANGLE_OFFSET
 
     # Midpoint of the finish line
     midpoint_x = (x1 + x2) / 2
@@ -80,137 +136,61 @@ def calculate_starting_positions(finish_line, outer_line,
     shifted_y = midpoint_y + perp_dy * offset_distance
 
     positions = []
+    if track_path:
+        walk, lap_length = _path_walker(list(track_path), (midpoint_x, midpoint_y),
+                                        (perp_dx, perp_dy))
+        rows = math.ceil(num_cars / columns)
+        row_offset = min(row_offset, lap_length / rows)
     for i in range(num_cars):
-        row = i // 2
-        col = i % 2
-        # Car position along the finish line
-        car_x = (shifted_x + (col - 0.5) * spacing * (dx / length)
-                 - row * row_offset * perp_dx)
-        car_y = (shifted_y + (col - 0.5) * spacing * (dy / length)
-                 - row * row_offset * perp_dy)
+        row = i // columns
+        col = i % columns
+        lateral = (col - (columns - 1) / 2) * spacing
+        if track_path:
+            # Row centre on the path, columns across the local track direction
+            (row_x, row_y), (tx, ty) = walk(offset_distance - row * row_offset)
+            car_x = row_x + lateral * ty
+            car_y = row_y - lateral * tx
+            # The path runs along the perpendicular, the cars face the other way
+            car_angle = math.degrees(math.atan2(ty, -tx))
+        else:
+            # Car position along the finish line
+            car_x = (shifted_x + lateral * (dx / length)
+                     - row * row_offset * perp_dx)
+            car_y = (shifted_y + lateral * (dy / length)
+                     - row * row_offset * perp_dy)
         positions.append((car_x, car_y, car_angle))
+    if track_path and car_length is not None:
+        # Overlapping cars block each other for the whole race. Inner cars in curves are
+        # closer than row_offset, so the slots themselves are measured, around the lap too
+        last = {i % columns: i for i in range(num_cars)}
+        pairs = [(i - columns, i) for i in range(columns, num_cars)]
+        pairs += [(column, i) for column, i in last.items() if i != column]
+        if any(math.dist(positions[a][:2], positions[b][:2]) < car_length for a, b in pairs):
+            raise ValueError(f"{num_cars} cars do not fit on the track: the rows of "
+                             f"{columns} cars would overlap")
     return positions
 
 
-def draw_finish_line(screen, data, width, height, outer_line, inner_line):
-    """
-    Draw the finish line between the outer and inner lines.
-    :param screen: Pygame surface to draw on.
-    :param data: Map data containing the finish line point.
-    :param width: Width of the screen.
-    :param height: Height of the screen.
-    :param outer_line: Scaled outer line points.
-    :param inner_line: Scaled inner line points.
-    """
-    # Extract the center point of the finish line
-    center_point = data["finish_line"]["point"]
-
-    # Scale the center point
-    min_x, min_y, scale = get_scaling_params([data["outer_points"], data["inner_points"]], width,
-                                             height,
-                                             scale_factor=0.9)
-
-    _, _, rotated_finish, finish_rect = lines_params_prep(None, center_point, inner_line, min_x,
-                                                          min_y, outer_line, scale)
-
-    # Draw the finish line image on the screen
-    screen.blit(rotated_finish, finish_rect.topleft)
-
-
-def draw_checkpoints_line(screen, data, width, height, outer_line, inner_line, cars):
-    """
-    Draw the checkpoints line between the outer and inner lines.
-    :param screen: Pygame surface to draw on.
-    :param data: Map data containing the finish line point.
-    :param width: Width of the screen.
-    :param height: Height of the screen.
-    :param outer_line: Scaled outer line points.
-    :param inner_line: Scaled inner line points.
-    """
-    checkpoints_points = data["checkpoints"]
-    min_x, min_y, scale = get_scaling_params([data["outer_points"], data["inner_points"]], width,
-                                             height, scale_factor=0.9)
-
-    for checkpoint in checkpoints_points:
-        # Scale the checkpoint point
-        checkpoint_scaled = scale_points([checkpoint], min_x, min_y, scale)[0]
-
-        # Find the closest points on the outer and inner lines
-        outer_closest = min(outer_line, key=lambda p: math.dist(checkpoint_scaled, p))
-        inner_closest = min(inner_line, key=lambda p: math.dist(checkpoint_scaled, p))
-
-        # Check if any car has passed the checkpoint
-        passed = any(checkpoint in car.checkpoints for car in cars)
-        color = (0, 255, 0) if passed else (255, 255, 0)
-
-        pygame.draw.line(screen, color, outer_closest, inner_closest, 5)
-
-
-def draw_track(screen, data):
-    outer_raw = data["outer_points"]
-    inner_raw = data["inner_points"]
-
-    min_x, min_y, scale = get_scaling_params([outer_raw, inner_raw],
-                                             cg.WIDTH, cg.HEIGHT, scale_factor=0.9)
-    outer = scale_points(outer_raw, min_x, min_y, scale)
-    inner = scale_points(inner_raw, min_x, min_y, scale)
-
-    # Create a surface for the track
-    track_surface = track_surface_create(inner, outer, cg.WIDTH, cg.HEIGHT)
-
-    # Apply the track image to the surface
-    track_surface.blit(cg.TRACK_IMAGE, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
-
-    screen.blit(track_surface, (0, 0))
-
-    inner_surface = pygame.Surface((cg.WIDTH, cg.HEIGHT), pygame.SRCALPHA)
-    inner_surface.fill((0, 0, 0, 0))
-    pygame.draw.polygon(inner_surface, (255, 255, 255), inner)
-    inner_surface.blit(cg.BACKGROUND_IMAGE, (0, 0), special_flags=pygame.BLEND_RGBA_MULT)
-
-    # Drawing on the screen
-    screen.blit(inner_surface, (0, 0))
+class _NoKeys:
+    """Keyboard state of a headless engine: no display, so no key is ever pressed."""
 
-    pygame.draw.lines(screen, OUTER_COLOR, True, outer, 5)
-    pygame.draw.lines(screen, INNER_COLOR, True, inner, 5)
+    def __getitem__(self, key):
+        return False
 
-    # Draw arrows with track direction
-    draw_track_direction_arrows(screen, inner, outer)
 
-    return outer, inner
-
-
-def track_surface_create(inner, outer, width, height):
-    track_surface = pygame.Surface((width, height), pygame.SRCALPHA)
-    track_surface.fill((0, 0, 0, 0))
-    pygame.draw.polygon(track_surface, (255, 255, 255), outer)
-    pygame.draw.polygon(track_surface, (0, 0, 0), inner)
-    return track_surface
-
-
-def generate_track_mask(data, width, height):
-    # Pobierz punkty toru
-    outer_raw = data["outer_points"]
-    inner_raw = data["inner_points"]
-
-    # Oblicz skalowanie i przeskaluj punkty
-    min_x, min_y, scale = get_scaling_params([outer_raw, inner_raw],
-                                             width, height, scale_factor=0.9)
-    outer = scale_points(outer_raw, min_x, min_y, scale)
-    inner = scale_points(inner_raw, min_x, min_y, scale)
-
-    # Stwórz powierzchnię toru
-    track_surface = track_surface_create(inner, outer, width, height)
-
-    # Wygeneruj maskę z powierzchni
-    track_mask = pygame.mask.from_surface(track_surface)
-    return track_mask
+def pressed_keys():
+    """pygame.key.get_pressed() for the keyboard cars, no keys without a display."""
+    if not pygame.display.get_init():
+        return _NoKeys()
+    return pygame.key.get_pressed()
 
 
 # DO NOT MERGE CLASSES BELOW
 # Didactic purposes
 
 class PlayerCar1(Car):
+    observation_parts = frozenset()  # Keyboard driving reads no state
+
     def __init__(self, x, y, track_width, inner_line, outer_line, method=1):
         super().__init__(x, y, track_width, inner_line, outer_line)
         self.method = method  # 1 - arrows, 2 - WASD (not implemented yet)
@@ -220,7 +200,7 @@ class PlayerCar1(Car):
         # To turn on screenshots, set screenshots=True in car.states_generation(..., screenshots=True)!
         # You could also save screenshots to file! Just add debug=True to car.states_generation
 
-        keys = pygame.key.get_pressed()
+        keys = pressed_keys()
         action = None
         if keys[pygame.K_UP]:
             action = 0
@@ -236,6 +216,8 @@ class PlayerCar1(Car):
 
 
 class PlayerCar2(Car):
+    observation_parts = frozenset()  # Keyboard driving reads no state
+
     def __init__(self, x, y, track_width, inner_line, outer_line, method=1):
         super().__init__(x, y, track_width, inner_line, outer_line)
         self.method = method  # 1 - arrows, 2 - WASD (not implemented yet)
@@ -245,7 +227,7 @@ class PlayerCar2(Car):
         # To turn on screenshots, set screenshots=True in car.states_generation(..., screenshots=True)!
         # You could also save screenshots to file! Just add debug=True to car.states_generation
 
-        keys = pygame.key.get_pressed()
+        keys = pressed_keys()
         action = None
         if keys[pygame.K_UP]:
             action = 0
@@ -261,6 +243,8 @@ class PlayerCar2(Car):
 
 
 class PlayerCar3(Car):
+    observation_parts = frozenset()  # Keyboard driving reads no state
+
     def __init__(self, x, y, track_width, inner_line, outer_line, method=1):
         super().__init__(x, y, track_width, inner_line, outer_line)
         self.method = method  # 1 - arrows, 2 - WASD (not implemented yet)
@@ -270,7 +254,7 @@ class PlayerCar3(Car):
         # To turn on screenshots, set screenshots=True in car.states_generation(..., screenshots=True)!
         # You could also save screenshots to file! Just add debug=True to car.states_generation
 
-        keys = pygame.key.get_pressed()
+        keys = pressed_keys()
         action = None
         if keys[pygame.K_UP]:
             action = 0
@@ -286,6 +270,8 @@ class PlayerCar3(Car):
 
 
 class PlayerCar4(Car):
+    observation_parts = frozenset()  # Keyboard driving reads no state
+
     def __init__(self, x, y, track_width, inner_line, outer_line, method=1):
         super().__init__(x, y, track_width, inner_line, outer_line)
         self.method = method  # 1 - arrows, 2 - WASD (not implemented yet)
@@ -295,7 +281,7 @@ class PlayerCar4(Car):
         # To turn on screenshots, set screenshots=True in car.states_generation(..., screenshots=True)!
         # You could also save screenshots to file! Just add debug=True to car.states_generation
 
-        keys = pygame.key.get_pressed()
+        keys = pressed_keys()
         action = None
         if keys[pygame.K_UP]:
             action = 0
@@ -311,176 +297,527 @@ class PlayerCar4(Car):
 
 
 class GameEngine:
-    def __init__(self, visualize=True):
+    def __init__(self, visualize=True, sim_scale=1.0, controller=None, screenshots=False,
+                 render_thread=False, target_fps=60, sim_speed=None, num_cars=4,
+                 car_classes=None, ghost=False, map_file=None, recorder=None, frame_stack=0,
+                 observation_format=None, telemetry=False, decision_deadline=None,
+                 track_cache=None, observation_parts=None):
+        """
+        :param visualize: Open a window and draw every frame. Without it the engine runs
+                          headless: no display, no event loop and no render textures.
+        :param sim_scale: Resolution of the simulation relative to the window
+                          (cg.WIDTH x cg.HEIGHT). Masks, rays and physics run on the scaled
+                          canvas, e.g. 0.5 for fast training, 1.0 or more for evaluation.
+                          Observations are expressed in window pixels at every scale.
+        :param controller: Optional BatchController deciding all cars in one call per tick,
+                           or AsyncController awaiting the decisions of all cars
+                           concurrently, instead of each car's choose_action.
+        :param screenshots: Generate screenshot observations every tick.
+        :param render_thread: Draw on a separate RenderThread at target_fps, dropping frames
+                              when it falls behind, instead of drawing every tick.
+        :param target_fps: Frame rate of the render thread.
+        :param sim_speed: With render_thread, run the simulation at this multiple of real time
+                          (TICKS_PER_SECOND ticks per second); None runs it as fast as possible.
+        :param num_cars: Number of cars on the grid.
+        :param car_classes: Car class or list of classes assigned to the cars in turn
+                            (default: PlayerCar1-4).
+        :param ghost: Ghost-car mode, e.g. for evaluating a population at once: cars neither
+                      collide with nor sense each other, and the border rays of all cars are
+                      cast in one batch (components.raycast).
+        :param map_file: Map JSON to race on (default: cg.MAP_FILE).
+        :param recorder: Optional FrameRecorder capturing the frames drawn by main_loop.
+                         Headless engines then draw offscreen on the ticks it records.
+        :param frame_stack: Keep the last k screenshots of every car in a FrameStack; a batch
+                            controller then gets images of shape (cars, k) + frame shape.
+                            Turns screenshots on.
+        :param observation_format: ObservationFormat of the screenshots (size, grayscale,
+                                   HWC or CHW, dtype). They are rendered at that size straight
+                                   into an engine-owned array. Default: (width, height, 3)
+                                   uint8 arrays of cg.SCREENSHOT_SIZE.
+        :param telemetry: Record per-tick metrics of every car in a Telemetry ring buffer
+                          (engine.telemetry); True or the number of ticks kept.
+        :param decision_deadline: Seconds an AsyncController has for the decisions of a
+                                  tick; cars that miss it get its default_action
+                                  (None: wait for every decision).
+        :param track_cache: TrackCache of prepared maps, e.g. shared by several engines
+                            (default: a cache of this engine). reset(map_file) switches to
+                            a cached or prefetched map without loading anything.
+        :param observation_parts: Parts computed for every car (components.controllers),
+                                  e.g. for deciders outside the engine using observe().
+                                  Default: the controller's observation_parts, without a
+                                  controller each car's. Screenshots are added with
+                                  screenshots or a frame stack.
+        """
         self.visualize = visualize
+        self.sim_scale = sim_scale
+        self.sim_width = max(1, int(cg.WIDTH * sim_scale))
+        self.sim_height = max(1, int(cg.HEIGHT * sim_scale))
+        self.controller = controller
+        self.render_thread = render_thread and visualize
+        self.target_fps = target_fps
+        self.sim_speed = sim_speed
+        self.renderer = None
+        self.num_cars = num_cars
+        if car_classes is None:
+            car_classes = [PlayerCar1, PlayerCar2, PlayerCar3, PlayerCar4]
+        elif isinstance(car_classes, type):
+            car_classes = [car_classes]
+        self.car_classes = list(car_classes)
+        self.screenshots = screenshots
+        self.observation_parts = observation_parts
+        self.ghost = ghost
+        self.map_file = map_file or cg.MAP_FILE
+        self.recorder = recorder
+        if track_cache is None:
+            track_cache = TrackCache(backgrounds=visualize or screenshots or bool(frame_stack)
+                                     or observation_format is not None or recorder is not None)
+        self.track_cache = track_cache
         self.cars = []
+        self.winners = 0
+        self.tick = 0
+        cg.USED_CARS = 0
         self.pygame_load()
         self.textures_load()
         self.track_load()
         self.cars_load()
         self.cars_number = len(self.cars)
-        self.track_mask = generate_track_mask(self.data, cg.WIDTH, cg.HEIGHT)
+        if frame_stack and observation_format is None:
+            observation_format = ObservationFormat()
+        self.observation_format = observation_format
+        self.frame_stack = None
+        self.observation_images = None
+        self._extra_parts = frozenset({SCREENSHOT} if screenshots or frame_stack else ())
+        if frame_stack:
+            self.frame_stack = FrameStack(len(self.all_cars), frame_stack,
+                                          observation_format.shape, observation_format.dtype)
+        elif observation_format is not None:
+            # One row per car, rewritten every tick
+            self.observation_images = observation_format.empty(len(self.all_cars))
+        self.drivable = self.track.drivable if self.ghost else None
+        self.decision_deadline = decision_deadline
+        # Ticks every car got the default action of an AsyncController, by grid index
+        self.deadline_misses = np.zeros(len(self.all_cars), dtype=np.int64)
+        self._event_loop = None
+        self.telemetry = None
+        if telemetry:
+            capacity = TELEMETRY_CAPACITY if telemetry is True else int(telemetry)
+            self.telemetry = Telemetry(len(self.all_cars), len(self.track.gates), capacity)
 
     def pygame_load(self):
-        pygame.init()
-        self.screen = pygame.display.set_mode((cg.WIDTH, cg.HEIGHT))
-        pygame.display.set_caption("Wyścigówka")
+        self.window = None
+        if self.visualize:
+            pygame.init()
+            self.window = pygame.display.set_mode((cg.WIDTH, cg.HEIGHT))
+            pygame.display.set_caption("Wyścigówka")
+        if self.window is not None and self.window.get_size() == (self.sim_width, self.sim_height):
+            self.screen = self.window
+        else:
+            # Simulation canvas, scaled to the window when presenting or used for screenshots
+            self.screen = pygame.Surface((self.sim_width, self.sim_height))
 
         self.clock = pygame.time.Clock()
-        self.data = load_map(cg.MAP_FILE)
 
     def textures_load(self):
-        cg.FINISH_TEXTURE = pygame.image.load(os.path.join("imgs", "finish.png")).convert_alpha()
-        cg.TRACK_IMAGE = pygame.image.load(os.path.join("imgs", "road.jpg")).convert()
-        cg.TRACK_IMAGE = pygame.transform.scale(cg.TRACK_IMAGE, (cg.WIDTH, cg.HEIGHT))
-        # Load and scale the background image to fill the entire screen
-        cg.BACKGROUND_IMAGE = pygame.image.load(os.path.join("imgs", "grass.jpg")).convert()
-        cg.BACKGROUND_IMAGE = pygame.transform.scale(cg.BACKGROUND_IMAGE, (cg.WIDTH, cg.HEIGHT))
-
-    def track_load(self):
-        # Pobierz pozycję linii startu
-        finish_line = self.data["finish_line"]["point"]
-        min_x, min_y, scale = get_scaling_params(
-            [self.data["outer_points"], self.data["inner_points"]],
-            cg.WIDTH, cg.HEIGHT,
-            scale_factor=0.9)
-        self.finish_scaled = scale_points([finish_line], min_x, min_y, scale)[0]
-
-        # Calculate track width
-        self.outer = scale_points(self.data["outer_points"], min_x, min_y, scale)
-        self.inner = scale_points(self.data["inner_points"], min_x, min_y, scale)
-        outer_closest = min(self.outer, key=lambda p: math.dist(self.finish_scaled, p))
-        inner_closest = min(self.inner, key=lambda p: math.dist(self.finish_scaled, p))
-        self.track_width = math.dist(outer_closest, inner_closest)
+        cg.FINISH_TEXTURE = load_image("finish.png")
+        if self.visualize or self.recorder is not None:
+            load_render_textures(self.sim_width, self.sim_height)
+
+    def track_load(self, map_file=None):
+        # Scaled lines, gates, masks and lookups, shared with the cars and the renderer.
+        # map_file becomes the engine's map only once it loaded.
+        map_file = map_file or self.map_file
+        self.track = self.track_cache.get(map_file, self.sim_width, self.sim_height)
+        self.map_file = map_file
+        self.data = self.track.data
+        self.finish_scaled = self.track.finish_point
+        self.outer = self.track.outer
+        self.inner = self.track.inner
+        self.track_width = self.track.track_width
+        self.track_mask = self.track.track_mask
 
     def cars_load(self):
-        num_cars = 4
+        num_cars = self.num_cars
         car_width = self.track_width * cg.CAR_SIZE_RATIO
         car_length = car_width * CAR_LENGTH_RATIO
         offset_distance = car_length * OFFSET_DISTANCE_FACTOR  # Distance from the finish line
         row_offset = car_length * ROW_OFFSET_FACTOR
         spacing = car_width * CAR_SPACING_FACTOR  # Spacing between cars
+        columns = max(1, min(num_cars, int(self.track_width // spacing)))
         starting_positions = calculate_starting_positions(self.finish_scaled,
                                                           self.outer, self.inner, num_cars,
                                                           offset_distance,
                                                           row_offset,
-                                                          spacing)
+                                                          spacing,
+                                                          columns=columns,
+                                                          track_path=self.track.midline,
+                                                          car_length=car_length)
 
         # Place the cars at the starting line
-        # self.cars = [PlayerCar(x, y, self.track_width, self.inner, self.outer, method=1) for
-        #              x, y, angle in
-        #              starting_positions]
-        self.cars.append(PlayerCar1(starting_positions[0][0], starting_positions[0][1],
-                                    self.track_width, self.inner, self.outer, method=1))
-        self.cars.append(PlayerCar2(starting_positions[1][0], starting_positions[1][1],
-                                    self.track_width, self.inner, self.outer, method=1))
-        self.cars.append(PlayerCar3(starting_positions[2][0], starting_positions[2][1],
-                                    self.track_width, self.inner, self.outer, method=1))
-        self.cars.append(PlayerCar4(starting_positions[3][0], starting_positions[3][1],
-                                    self.track_width, self.inner, self.outer, method=1))
-        for car, (_, _, angle) in zip(self.cars, starting_positions):
+        for i, (x, y, angle) in enumerate(starting_positions):
+            car_class = self.car_classes[i % len(self.car_classes)]
+            car = car_class(x, y, self.track_width, self.inner, self.outer)
+            car.grid_index = i  # Row of the car in per-car engine buffers
+            car.scale = self.sim_scale
             car.angle = angle
-            car.fix_angle(self.data["finish_line"]["point"])
-
-    def main_loop(self):
-        winners = 0
+            car.ghost = self.ghost
+            car.track = self.track
+            self.cars.append(car)
+        # Every car of the grid in start order, including those that already finished
+        self.all_cars = list(self.cars)
+
+        self.spatial_hash = None
+        if self.ghost:
+            return
+        self.spatial_hash = SpatialHash(car_length * SPATIAL_CELL_FACTOR)
+        for car in self.cars:
+            car.spatial_hash = self.spatial_hash
+        self.spatial_hash.rebuild(self.cars)
+
+    def step(self):
+        """
+        Advance the simulation by one tick: observe, act, check gates and cast rays.
+        With a batch controller all active cars are decided in one controller call.
+        """
+        if isinstance(self.controller, AsyncController):
+            if self._event_loop is None:
+                self._event_loop = asyncio.new_event_loop()
+            self._event_loop.run_until_complete(self.step_async())
+            return
+        if self.controller is not None:
+            cars, observations, images = self.observe()
+            self.advance(cars, self.controller.act(observations, images),
+                         self.controller.continuous)
+            return
+        cars = list(self.cars)
+        states = self._states(cars)
+        for car, state in zip(cars, states):
+            car.choose_action(self.cars, state)
+        actions = [car.last_action for car in cars]
+        if None in actions:
+            actions = None  # choose_action did not go through Car.update
+        self._finish_tick(cars, actions)
+
+    async def step_async(self):
+        """
+        step() with an AsyncController, for callers that run their own event loop.
+        The tick waits at most decision_deadline for the decisions.
+        """
+        cars, observations, images = self.observe()
+        actions, missed = await gather_actions(self.controller,
+                                               [car.grid_index for car in cars], observations,
+                                               images, self.decision_deadline)
+        for row in missed:
+            self.deadline_misses[cars[row].grid_index] += 1
+        self.advance(cars, actions, self.controller.continuous)
+
+    def observe(self):
+        """
+        First half of a tick for an external decision maker (a server session, an async
+        controller): observations of the cars racing now, in the layout BatchController.act
+        receives. Call advance() with their actions to finish the tick.
+        :return: (cars, observations, images)
+        """
+        cars = list(self.cars)
+        states = self._states(cars)
+        rows = [car.grid_index for car in cars]
+        if self.frame_stack is not None:
+            images = self.frame_stack.stacked(rows)
+        elif self.observation_images is not None and states and states[0][4] is not None:
+            images = self._rows(self.observation_images, rows)
+        else:
+            images = stack_screenshots(states)
+        return cars, stack_observations(states), images
+
+    def advance(self, cars, actions, continuous=False):
+        """
+        Second half of a tick: apply the actions of the cars returned by observe(), check
+        gates and cast rays.
+        :param actions: Discrete codes (cars,) or continuous rows (cars, 3).
+        """
+        apply_actions(cars, actions, self.cars, continuous)
+        self._finish_tick(cars, actions, continuous)
+
+    def _parts(self, car):
+        # Observation parts computed for the car, see the observation_parts parameter
+        if self.observation_parts is not None:
+            parts = self.observation_parts
+        elif self.controller is not None:
+            parts = self.controller.observation_parts
+        else:
+            parts = car.observation_parts
+        return parts | self._extra_parts if self._extra_parts else parts
+
+    def _states(self, cars):
+        states = []
+        for car in cars:
+            parts = self._parts(car)
+            states.append(car.states_generation(
+                self.screen, self.data["checkpoints"], self.cars,
+                screenshots=SCREENSHOT in parts, debug=False,
+                screenshot_out=self._screenshot_out(car),
+                observation_format=self.observation_format, parts=parts))
+        if self.frame_stack is not None:
+            self.frame_stack.push()
+        return states
+
+    def _finish_tick(self, cars, actions, continuous=False):
+        off_track = []
+        for car in cars:
+            car.check_checkpoints(self.data["checkpoints"], self.data, self.outer, self.inner,
+                                  self.sim_width, self.sim_height)
+            car.check_finish_line(self.data["checkpoints"], self.data["finish_line"], self.data,
+                                  self.outer, self.inner,
+                                  self.sim_width, self.sim_height)
+            if not car.check_if_on_track(self.track_mask, self.inner, self.outer):
+                off_track.append(car)
+                car.speed = 0
+            if car.win_state():
+                car.finish_tick = self.tick + 1
+                self.winners += 1
+                self.cars.remove(car)
+        if self.telemetry is not None:
+            self.telemetry.record(self.tick + 1, self.all_cars, cars, off_track, actions,
+                                  continuous)
+
+        # Rays of the next observation, only for the cars whose decider reads them, and for
+        # every car when they are drawn
+        if self.ghost:
+            update_border_rays([car for car in self.cars
+                                if self.visualize or not self._parts(car).isdisjoint(RAY_PARTS)],
+                               self.drivable)
+        else:
+            # Once per tick, used by collisions and rays until the next rebuild
+            self.spatial_hash.rebuild(self.cars)
+            for car in self.cars:
+                parts = RAY_PARTS if self.visualize else self._parts(car)
+                if not parts.isdisjoint(RAY_PARTS):
+                    car.get_rays_and_distances(self.track_mask, self.inner, self.cars,
+                                               sense_cars=CAR_RAYS in parts)
+        self.tick += 1
+
+    def _screenshot_out(self, car):
+        if self.frame_stack is not None:
+            return self.frame_stack.slot(car.grid_index)
+        if self.observation_images is not None:
+            return self.observation_images[car.grid_index]
+        return None
+
+    @staticmethod
+    def _rows(array, rows):
+        # A view while every car is racing, a copy of the selected rows afterwards
+        if rows == list(range(len(array))):
+            return array
+        return array[rows]
+
+    def reset(self, map_file=None):
+        """
+        Start a new race with the same grid, optionally on another map (curriculum, domain
+        randomization). pygame, textures and engine buffers are kept, the map comes from
+        track_cache: a cached or prefetched map is only a reference swap.
+        :param map_file: Map JSON to race on (default: the current map).
+        """
+        self.track_load(map_file)
+        self.cars = []
+        self.winners = 0
+        self.tick = 0
+        cg.USED_CARS = 0
+        self.cars_load()
+        self.cars_number = len(self.cars)
+        self.drivable = self.track.drivable if self.ghost else None
+        if self.frame_stack is not None:
+            self.frame_stack.reset()
+        self.deadline_misses[:] = 0
+        if self.telemetry is not None:
+            if self.telemetry.num_gates == len(self.track.gates):
+                self.telemetry.reset()
+            else:
+                self.telemetry = Telemetry(len(self.all_cars), len(self.track.gates),
+                                           self.telemetry.capacity)
+        if self.renderer is not None:
+            self.renderer.invalidate()
+
+    def prefetch(self, map_files):
+        """Prepare maps for upcoming reset() calls on a background thread."""
+        self.track_cache.prefetch(map_files, self.sim_width, self.sim_height)
+
+    def snapshot(self):
+        """
+        Capture the mutable race state (car positions, speeds, gates, rays, tick) and the
+        telemetry's episode totals so the race can be restored or branched many times, e.g.
+        for tree search or rollouts.
+        Not included, so not rewound by restore(): state of Car subclasses beyond
+        components.snapshot.CarState, the frame stack and observation images, deadline_misses
+        and the telemetry ring buffer rows (see Telemetry.restore).
+        :return: SimulationState
+        """
+        active = {id(car) for car in self.cars}
+        return SimulationState(self.tick, self.winners,
+                               tuple(i for i, car in enumerate(self.all_cars) if id(car) in active),
+                               tuple(capture_car(car) for car in self.all_cars),
+                               None if self.telemetry is None else self.telemetry.capture())
+
+    def restore(self, state):
+        """
+        Return to a state from snapshot() of this engine or one of its clones.
+        Only attributes are assigned, no textures are loaded and no masks rebuilt.
+        """
+        for car, car_state in zip(self.all_cars, state.cars):
+            restore_car(car, car_state)
+        self.cars = [self.all_cars[i] for i in state.active]
+        self.tick = state.tick
+        self.winners = state.winners
+        if self.telemetry is not None:
+            if state.telemetry is not None and self.telemetry.compatible(state.telemetry):
+                self.telemetry.restore(state.telemetry)
+            else:
+                # No totals to rewind to: a new episode from the restored cars
+                self.telemetry.reset()
+                self.telemetry.sync(self.all_cars)
+        if self.spatial_hash is not None:
+            self.spatial_hash.rebuild(self.cars)
+
+    def clone(self):
+        """
+        Independent headless copy of the engine in the current state.
+        Track data, masks, car images and the controller are shared, not copied; frame
+        stack, observation images and telemetry are copied. The clone draws on a canvas of
+        its own and records nothing (recorder is None).
+        """
+        engine = copy.copy(self)
+        engine.visualize = False
+        engine.render_thread = False
+        engine.window = None
+        engine.renderer = None
+        engine.recorder = None
+        engine.screen = pygame.Surface((self.sim_width, self.sim_height))
+        engine.all_cars = [copy.copy(car) for car in self.all_cars]
+        engine.deadline_misses = self.deadline_misses.copy()
+        engine._event_loop = None
+        if self.frame_stack is not None:
+            engine.frame_stack = self.frame_stack.copy()
+        if self.observation_images is not None:
+            engine.observation_images = self.observation_images.copy()
+        if self.telemetry is not None:
+            engine.telemetry = copy.deepcopy(self.telemetry)
+        engine.spatial_hash = None
+        if self.spatial_hash is not None:
+            engine.spatial_hash = SpatialHash(self.spatial_hash.cell_size)
+        for car in engine.all_cars:
+            car.spatial_hash = engine.spatial_hash
+        engine.restore(self.snapshot())
+        return engine
+
+    def close(self):
+        """
+        Release the event loop step() created for an AsyncController, cancelling decisions
+        still running. main_loop() closes the engine when it ends; step() opens a new loop.
+        """
+        loop, self._event_loop = self._event_loop, None
+        if loop is None:
+            return
+        tasks = asyncio.all_tasks(loop)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            loop.run_until_complete(asyncio.wait(tasks, timeout=0))
+        loop.close()
+
+    def draw_frame(self):
+        if self.renderer is None:
+            self.renderer = IncrementalRenderer(self)
+        self.renderer.render(self.screen, self.window, snapshot_cars(self.cars))
+
+    def draw_offscreen(self):
+        """Draw the current frame on the simulation canvas without presenting it."""
+        if cg.BACKGROUND_IMAGE is None:
+            load_render_textures(self.sim_width, self.sim_height)
+        if self.renderer is None:
+            self.renderer = IncrementalRenderer(self)
+        self.renderer.draw(self.screen, snapshot_cars(self.cars))
+        return self.screen
+
+    def rgb_array(self):
+        """Current frame as a (height, width, 3) uint8 array, also without a display."""
+        view = pygame.surfarray.pixels3d(self.draw_offscreen())
+        frame = np.ascontiguousarray(view.transpose(1, 0, 2))
+        del view  # Unlocks the surface
+        return frame
+
+    def _record_frame(self):
+        if self.recorder is None or not self.recorder.wants(self.tick):
+            return
+        if not self.visualize:
+            self.draw_offscreen()
+        self.recorder.capture(self.screen, self.tick)
+
+    def _limit_reached(self, started, max_steps, max_seconds):
+        if max_steps is not None and self.tick >= max_steps:
+            return True
+        return max_seconds is not None and time.perf_counter() - started >= max_seconds
+
+    def _threaded_loop(self, max_steps=None, max_seconds=None):
+        started = time.perf_counter()
+        renderer = RenderThread(self, self.target_fps)
+        renderer.start()
+        event_interval = 1.0 / self.target_fps
+        next_events = 0.0
         running = True
         while running:
-            self.screen.blit(cg.BACKGROUND_IMAGE, (0, 0))
-            self.outer, self.inner = draw_track(self.screen, self.data)  # its switched?
-
-            draw_finish_line(self.screen, self.data, cg.WIDTH, cg.HEIGHT, self.outer, self.inner)
-            draw_checkpoints_line(self.screen, self.data, cg.WIDTH, cg.HEIGHT, self.outer,
-                                  self.inner, self.cars)
-
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    running = False
-
-            for car in self.cars:  # Iterate over all cars
-                state = car.states_generation(self.screen, self.data["checkpoints"], self.cars,
-                                              screenshots=False, debug=False)
-                car.choose_action(self.cars, state)
-                car.check_checkpoints(self.data["checkpoints"], self.data, self.outer, self.inner,
-                                      cg.WIDTH, cg.HEIGHT)
-                car.check_finish_line(self.data["checkpoints"], self.data["finish_line"], self.data,
-                                      self.outer, self.inner,
-                                      cg.WIDTH, cg.HEIGHT)
-                if not car.check_if_on_track(self.track_mask, self.inner, self.outer):
-                    car.speed = 0
-                if car.win_state():
-                    winners += 1
-                    self.cars.remove(car)
-                    continue
-                car.draw(self.screen)
-                # Calculate rays and draw them
-                rays, _ = car.get_rays_and_distances(self.track_mask, self.inner, self.cars)
-                car.draw_rays(self.screen, rays)
+            now = time.perf_counter()
+            if now >= next_events:
+                next_events = now + event_interval
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        running = False
+
+            self.step()
+            renderer.publish(self.cars)
+
+            if self.sim_speed is not None:
+                self.clock.tick(TICKS_PER_SECOND * self.sim_speed)
+            if self.winners == self.cars_number:
+                running = False
+            if self._limit_reached(started, max_steps, max_seconds):
+                running = False
+        renderer.stop()
+
+    def main_loop(self, max_steps=None, max_seconds=None):
+        """
+        Race until every car finished, the window is closed or a limit is reached.
+        :param max_steps: Stop after this many ticks in total.
+        :param max_seconds: Stop after this much wall-clock time.
+        :return: Number of cars that finished.
+        """
+        if self.render_thread:
+            self._threaded_loop(max_steps, max_seconds)
+            self.close()
+            pygame.quit()
+            return self.winners
+
+        started = time.perf_counter()
+        running = True
+        while running:
+            if self.visualize:
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        running = False
+
+            self.step()
 
             if self.visualize:
-                pygame.display.flip()
+                self.draw_frame()
+            self._record_frame()
+            if self.visualize:
                 self.clock.tick(60)
 
-            if winners == self.cars_number:
+            if self.winners == self.cars_number:
+                running = False
+            if self._limit_reached(started, max_steps, max_seconds):
                 running = False
 
+        self.close()
         pygame.quit()
-        return winners
-
-
-def draw_track_direction_arrows(screen, inner, outer, arrow_color=(255, 0, 255), arrow_length=40,
-                                arrow_width=6, step=10):
-    """
-    Draw arrows along the centerline of the track to indicate direction.
-    :param screen: Pygame surface to draw on.
-    :param inner: List of inner track points (scaled).
-    :param outer: List of outer track points (scaled).
-    :param arrow_color: Color of the arrows.
-    :param arrow_length: Length of each arrow.
-    :param arrow_width: Width of the arrow shaft.
-    :param step: Distance between arrows (in points, not pixels).
-    """
-    num_points = min(len(inner), len(outer))
-    for i in range(0, num_points, step):
-        # Get corresponding points
-        p_inner = inner[i % len(inner)]
-        p_outer = outer[i % len(outer)]
-        # Centerline point
-        cx = (p_inner[0] + p_outer[0]) / 2
-        cy = (p_inner[1] + p_outer[1]) / 2
-
-        # Next centerline point for direction
-        next_i = (i + 1) % num_points
-        p_inner_next = inner[next_i % len(inner)]
-        p_outer_next = outer[next_i % len(outer)]
-        nx = (p_inner_next[0] + p_outer_next[0]) / 2
-        ny = (p_inner_next[1] + p_outer_next[1]) / 2
-
-        # Reverse direction vector to fix arrow direction
-        dx = cx - nx
-        dy = cy - ny
-        length = math.hypot(dx, dy)
-        if length == 0:
-            continue
-        dx /= length
-        dy /= length
-
-        # Arrow shaft
-        end_x = cx + dx * arrow_length
-        end_y = cy + dy * arrow_length
-        pygame.draw.line(screen, arrow_color, (cx, cy), (end_x, end_y), arrow_width)
-
-        # Arrow head
-        head_size = arrow_length * 0.4
-        angle = math.atan2(dy, dx)
-        left_angle = angle + math.radians(150)
-        right_angle = angle - math.radians(150)
-        left_x = end_x + head_size * math.cos(left_angle)
-        left_y = end_y + head_size * math.sin(left_angle)
-        right_x = end_x + head_size * math.cos(right_angle)
-        right_y = end_y + head_size * math.sin(right_angle)
-        pygame.draw.polygon(screen, arrow_color,
-                            [(end_x, end_y), (left_x, left_y), (right_x, right_y)])
+        return self.winners
 
 
 if __name__ == "__main__":
@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+
+from map_generators.map_core import Map
+
+
+def compile_map(file_path, out_path, width=50, reexport=False, indent=None):
+    """
+    Rebuild the track boundaries of a map file and write the result.
+
+    :param file_path: Source map JSON file.
+    :param out_path: Destination JSON file (may be the same as file_path).
+    :param width: The half-width of the track used to regenerate the boundaries.
+    :param reexport: Only re-serialize the file without regenerating the boundaries.
+    :param indent: JSON indentation of the written file (None - compact).
+    :return: out_path
+    """
+    with open(file_path, 'r') as file:
+        data = json.load(file)
+    if not reexport:
+        map_data = Map()
+        map_data.from_dict(data)
+        data = map_data.track_data(width)
+    with open(out_path, 'w') as file:
+        json.dump(data, file, indent=indent)
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compile or re-export map files without opening the editor.")
+    parser.add_argument("maps", nargs="+", help="map JSON files")
+    parser.add_argument("--out-dir", default=None,
+                        help="output directory (default: overwrite the input files)")
+    parser.add_argument("--width", type=float, default=50, help="track half-width")
+    parser.add_argument("--reexport", action="store_true",
+                        help="only re-serialize, keep the stored boundaries")
+    parser.add_argument("--indent", type=int, default=None, help="JSON indentation")
+    args = parser.parse_args()
+
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+    for file_path in args.maps:
+        out_path = file_path
+        if args.out_dir:
+            out_path = os.path.join(args.out_dir, os.path.basename(file_path))
+        try:
+            compile_map(file_path, out_path, width=args.width, reexport=args.reexport,
+                        indent=args.indent)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error: {file_path}: {e}")
+            continue
+        print(out_path)
+
+
+if __name__ == '__main__':
+    main()
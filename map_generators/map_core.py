@@ -0,0 +1,363 @@
+import json
+
+import numpy as np
+from shapely.geometry.linestring import LineString
+from shapely.geometry.point import Point
+
+# Cell size of the spatial grid used for hit-testing
+SPATIAL_CELL_SIZE = 50
+
+
+def interpolate_points(start, end, num_points=5):
+    """Generate intermediate points between start and end."""
+    points = []
+    for i in range(1, num_points + 1):
+        t = i / (num_points + 1)
+        x = start[0] + t * (end[0] - start[0])
+        y = start[1] + t * (end[1] - start[1])
+        points.append((x, y))
+    return points
+
+
+def extrapolate_points(start, end, distance=50):
+    """Extend the line beyond the end point."""
+    dx = end[0] - start[0]
+    dy = end[1] - start[1]
+    length = (dx ** 2 + dy ** 2) ** 0.5
+
+    if length == 0:
+        raise ValueError("Start and end points are the same, cannot extrapolate.")
+
+    # Normalize the direction vector
+    unit_dx = dx / length
+    unit_dy = dy / length
+
+    # Calculate the new end point
+    new_end = (end[0] + unit_dx * distance, end[1] + unit_dy * distance)
+    return new_end
+
+
+class SpatialGrid:
+    """
+    Uniform grid of buckets used for hit-testing points and roads near the cursor.
+    """
+
+    def __init__(self, cell_size=SPATIAL_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def _cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def insert(self, item, x1, y1, x2=None, y2=None):
+        """Insert an item covering the point (x1, y1) or the box (x1, y1)-(x2, y2)."""
+        if x2 is None:
+            x2, y2 = x1, y1
+        left, top = self._cell(min(x1, x2), min(y1, y2))
+        right, bottom = self._cell(max(x1, x2), max(y1, y2))
+        for cx in range(left, right + 1):
+            for cy in range(top, bottom + 1):
+                self.cells.setdefault((cx, cy), []).append(item)
+
+    def query(self, position, radius):
+        """Return the items stored in the cells within radius of position (deduplicated)."""
+        left, top = self._cell(position[0] - radius, position[1] - radius)
+        right, bottom = self._cell(position[0] + radius, position[1] + radius)
+        found = {}
+        for cx in range(left, right + 1):
+            for cy in range(top, bottom + 1):
+                for item in self.cells.get((cx, cy), ()):
+                    found[item] = None
+        return list(found)
+
+
+class Map:
+    def __init__(self):
+        self.points = []
+        self.roads = []
+        self.finish_line = {'point': None}
+        self.checkpoints = []
+        self.selected_points = []
+        self.point_index = 1
+        self.revision = 0  # Bumped on every change of points or roads
+        self._points_by_id = {}
+        self._points_by_position = {}
+        self._road_keys = set()
+
+    def _reindex(self):
+        """Rebuild the id, position and road lookups after points or roads were replaced."""
+        self._points_by_id = {p[0]: p for p in self.points}
+        self._points_by_position = {tuple(p[1:]): p for p in self.points}
+        self._road_keys = {frozenset(road) for road in self.roads}
+        self.revision += 1
+
+    def get_point(self, number):
+        """Return the point with the given number, or None."""
+        return self._points_by_id.get(number)
+
+    def point_at(self, position):
+        """Return the point at exactly the given position, or None."""
+        return self._points_by_position.get(tuple(position))
+
+    def add_point(self, position):
+        """Add a point to the map with a unique number."""
+        if tuple(position) not in self._points_by_position:  # Check if position already exists
+            point_number = self.point_index
+            point = (point_number, *position)
+            self.points.append(point)
+            self._points_by_id[point_number] = point
+            self._points_by_position[tuple(position)] = point
+            self.point_index += 1
+            self.revision += 1
+
+    def remove_point(self, position):
+        """Remove a point by its position and all associated roads."""
+        point_to_remove = self.point_at(position)
+        if point_to_remove:
+            self.points.remove(point_to_remove)
+            # Remove all roads connected to this point
+            self.roads = [road for road in self.roads if
+                          road[0] != point_to_remove[0] and road[1] != point_to_remove[0]]
+            self._reindex()
+
+    def toggle_point_selection(self, position):
+        """Toggle the selection of a point."""
+        point = self.point_at(position)
+        if point is not None:
+            if point in self.selected_points:
+                self.selected_points.remove(point)
+            else:
+                self.selected_points.append(point)
+
+    def add_road(self, start, end):
+        """Add a road between two points."""
+        start_number = start[0]
+        end_number = end[0]
+        key = frozenset((start_number, end_number))
+        if key not in self._road_keys:
+            self.roads.append((start_number, end_number))
+            self._road_keys.add(key)
+            self.revision += 1
+
+    def connect_points(self):
+        """Replace the roads with one closed loop through the points in their order."""
+        self.roads = [(point[0], self.points[(index + 1) % len(self.points)][0])
+                      for index, point in enumerate(self.points)]
+        self._reindex()
+
+    def _build_adjacency_list(self):
+        graph = {}
+        for road in self.roads:
+            start, end = road
+            if start not in graph:
+                graph[start] = []
+            if end not in graph:
+                graph[end] = []
+            graph[start].append(end)
+            graph[end].append(start)
+        return graph
+
+    def _get_connected_points(self, graph, start_point):
+        visited = set()
+        stack = [start_point]
+        while stack:
+            current = stack.pop()
+            if current not in visited:
+                visited.add(current)
+                stack.extend(neighbor for neighbor in graph[current] if neighbor not in visited)
+        return visited
+
+    def is_track_closed(self):
+        """
+        Check if the track is logically closed based on the roads.
+        """
+        if not self.roads:
+            return False
+        graph = self._build_adjacency_list()
+        visited = self._get_connected_points(graph, self.roads[0][0])
+        all_points = {point[0] for point in self.points}
+        return visited == all_points and len(visited) > 2
+
+    def smooth_or_extrapolate_track(self, num_samples=100):
+        """
+        Smooth or extrapolate the track using cubic spline interpolation.
+
+        :param num_samples: Number of samples to generate for the smooth track.
+        """
+        if len(self.points) < 3:
+            raise ValueError("At least 3 points are required to smooth the track.")
+
+        # Ensure the track is logically closed
+        if not self.is_track_closed():
+            raise ValueError("The track must be logically closed (all roads form a loop).")
+
+        # Ensure the first point is repeated at the end for interpolation
+        if self.points[0] != self.points[-1]:
+            self.points.append(self.points[0])
+
+        # scipy is only needed here, keep it out of the import path of the library
+        from scipy.interpolate import CubicSpline
+
+        # Extract x and y coordinates
+        x = [p[1] for p in self.points]
+        y = [p[2] for p in self.points]
+
+        # Create a parameter t for the points
+        t = np.linspace(0, 1, len(self.points))
+
+        # Fit cubic splines for x and y
+        spline_x = CubicSpline(t, x, bc_type='periodic')
+        spline_y = CubicSpline(t, y, bc_type='periodic')
+
+        # Generate new points
+        t_new = np.linspace(0, 1, num_samples)
+        x_smooth = spline_x(t_new)
+        y_smooth = spline_y(t_new)
+
+        # Replace the original points with the smoothed points
+        self.points = list(zip(range(1, len(x_smooth) + 1), x_smooth, y_smooth))
+        self._reindex()
+
+    def remove_road(self, start, end):
+        """Remove a road between two points using their numbers."""
+        start_number = start[0]
+        end_number = end[0]
+        if (start_number, end_number) in self.roads:
+            self.roads.remove((start_number, end_number))
+        elif (end_number, start_number) in self.roads:
+            self.roads.remove((end_number, start_number))
+        else:
+            return
+        self._road_keys.discard(frozenset((start_number, end_number)))
+        self.revision += 1
+
+    def set_finish_line(self, start, end):
+        """Set the finish line for the map."""
+        if start not in self.points:
+            raise ValueError("Start point not found in points.")
+        if end not in self.points:
+            raise ValueError("End point not found in points.")
+        self.finish_line['start'] = start
+        self.finish_line['end'] = end
+
+    def add_checkpoint(self, position):
+        """Add a checkpoint at the specified position."""
+        if position not in self.checkpoints:
+            self.checkpoints.append(position)
+
+    def remove_checkpoint(self, position):
+        """Remove a checkpoint at the specified position."""
+        if position in self.checkpoints:
+            self.checkpoints.remove(position)
+
+    # FILE
+
+    def to_dict(self):
+        """Convert the map data to a dictionary."""
+        return {
+            'points': self.points,
+            'roads': self.roads,
+            'finish_line': self.finish_line,
+            'checkpoints': self.checkpoints
+        }
+
+    def from_dict(self, data):
+        """Load the map data from a dictionary."""
+        self.points = data.get('points', [])
+        self.roads = data.get('roads', [])
+        self.finish_line = data.get('finish_line', {'point': None})
+        self.checkpoints = data.get('checkpoints', [])
+        self.point_index = max((p[0] for p in self.points), default=0) + 1
+        self._reindex()
+
+    def _generate_inner_boundary(self, center_line, width):
+        inner_poly = center_line.buffer(-width, cap_style=2, join_style=2, resolution=256)
+        if inner_poly.is_empty:
+            inner = np.array(center_line.coords)
+            if np.allclose(inner[0], inner[-1]):
+                inner = inner[:-1]
+            return inner.tolist()
+        else:
+            inner = np.array(inner_poly.exterior.coords)
+            if np.allclose(inner[0], inner[-1]):
+                inner = inner[:-1]
+            return inner.tolist()
+
+    def _snap_point_to_centerline(self, center_line, point):
+        return center_line.interpolate(center_line.project(Point(point))).coords[0]
+
+    def _snap_checkpoints(self, center_line, checkpoints):
+        snapped = []
+        for checkpoint in checkpoints:
+            if not center_line.contains(Point(checkpoint)):
+                snapped_point = self._snap_point_to_centerline(center_line, checkpoint)
+                snapped.append(snapped_point)
+            else:
+                snapped.append(checkpoint)
+        return snapped
+
+    def generate_track_width(self, width=50):
+        """
+          Generate smooth inner and outer track boundaries based on the centerline points.
+
+          This function uses the current list of points (assumed to be smoothed/interpolated)
+          to create a centerline, then generates the inner and outer boundaries by buffering
+          the centerline using the specified width. The result is maximally smooth track edges.
+
+          :param width: The half-width of the track (distance from centerline to edge).
+          :return: Tuple (inner_points, outer_points) as lists of (x, y) coordinates.
+        """
+        coords = [(p[1], p[2]) for p in self.points]
+        if coords[0] != coords[-1]:
+            coords.append(coords[0])
+        center_line = LineString(coords)
+
+        # Generate the outer boundary with high resolution for smoothness
+        outer_poly = center_line.buffer(width, cap_style=2, join_style=2, resolution=256)
+        outer = np.array(outer_poly.exterior.coords)
+        if np.allclose(outer[0], outer[-1]):
+            outer = outer[:-1]
+
+        # Generate the inner boundary using helper
+        inner = self._generate_inner_boundary(center_line, width)
+
+        # Ensure the finish line is included in the track
+        if self.finish_line['point']:
+            finish_point = self.finish_line['point']
+            if not center_line.contains(Point(finish_point)):
+                finish_point = self._snap_point_to_centerline(center_line, finish_point)
+                self.finish_line['point'] = finish_point
+
+        # Snap all checkpoints using helper
+        self.checkpoints = self._snap_checkpoints(center_line, self.checkpoints)
+
+        return inner, outer.tolist()
+
+    def track_data(self, width=50):
+        """
+        Build the dictionary written to map files, including inner and outer points.
+
+        :param width: The half-width of the track passed to generate_track_width.
+        :return: Map data dictionary as expected by the game.
+        """
+        inner_points, outer_points = self.generate_track_width(width)
+        return {
+            'points': self.points,
+            'roads': self.roads,
+            'finish_line': self.finish_line,
+            'checkpoints': self.checkpoints,
+            'inner_points': inner_points,
+            'outer_points': outer_points
+        }
+
+    def save_to_file(self, file_path, width=50):
+        """Save the map data to a JSON file, including inner and outer points."""
+        data = self.track_data(width)
+        with open(file_path, 'w') as file:
+            json.dump(data, file, indent=4)
+
+    def load_from_file(self, file_path):
+        """Load the map data from a JSON file."""
+        with open(file_path, 'r') as file:
+            data = json.load(file)
+            self.from_dict(data)
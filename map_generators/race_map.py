@@ -1,20 +1,21 @@
+import os
 import tkinter as tk
 from tkinter import messagebox
 import threading
 import pygame
 import pygame_gui
-import json
-import numpy as np
-from scipy.interpolate import CubicSpline
-from shapely.geometry.linestring import LineString
-from shapely.geometry.point import Point
-
-# Initialize pygame and pygame_gui
-pygame.init()
-pygame.display.set_caption('Map Editor')
+from functools import lru_cache
+
+from map_generators.map_core import Map, SpatialGrid
+
+# The game loads map_generators/map_data.json, also when the editor runs from the repository
+# root (python -m map_generators.race_map)
+MAP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'map_data.json')
+
 window_size = (1024, 768)
-window_surface = pygame.display.set_mode(window_size)
-manager = pygame_gui.UIManager(window_size)
+# Created by init_display(), importing this module does not open a window
+window_surface = None
+manager = None
 
 # Colors
 WHITE = (255, 255, 255)
@@ -25,280 +26,22 @@ GRAY = (200, 200, 200)
 CHECKPOINT_COLLISION_OFFSET = 5
 CHECKPOINT_COLLISION_SIZE = 10
 
-
-def interpolate_points(start, end, num_points=5):
-    """Generate intermediate points between start and end."""
-    points = []
-    for i in range(1, num_points + 1):
-        t = i / (num_points + 1)
-        x = start[0] + t * (end[0] - start[0])
-        y = start[1] + t * (end[1] - start[1])
-        points.append((x, y))
-    return points
-
-
-def extrapolate_points(start, end, distance=50):
-    """Extend the line beyond the end point."""
-    dx = end[0] - start[0]
-    dy = end[1] - start[1]
-    length = (dx ** 2 + dy ** 2) ** 0.5
-
-    if length == 0:
-        raise ValueError("Start and end points are the same, cannot extrapolate.")
-
-    # Normalize the direction vector
-    unit_dx = dx / length
-    unit_dy = dy / length
-
-    # Calculate the new end point
-    new_end = (end[0] + unit_dx * distance, end[1] + unit_dy * distance)
-    return new_end
-
+# Constants for hit-testing
+POINT_HIT_RADIUS = 5
 
 # Main drawing area
 drawing_area_rect = pygame.Rect(0, 0, window_size[0], window_size[1])
 
 
-class Map:
-    def __init__(self):
-        self.points = []
-        self.roads = []
-        self.finish_line = {'point': None}
-        self.checkpoints = []
-        self.selected_points = []
-        self.point_index = 1
-
-    def add_point(self, position):
-        """Add a point to the map with a unique number."""
-        if not any(p[1:] == position for p in self.points):  # Check if position already exists
-            point_number = self.point_index
-            self.points.append((point_number, *position))
-            self.point_index += 1
-
-    def remove_point(self, position):
-        """Remove a point by its position and all associated roads."""
-        point_to_remove = next((p for p in self.points if p[1:] == position), None)
-        if point_to_remove:
-            self.points.remove(point_to_remove)
-            # Remove all roads connected to this point
-            self.roads = [road for road in self.roads if
-                          road[0] != point_to_remove[0] and road[1] != point_to_remove[0]]
-
-    def toggle_point_selection(self, position):
-        """Toggle the selection of a point."""
-        for point in self.points:
-            if point[1:] == position:
-                if point in self.selected_points:
-                    self.selected_points.remove(point)
-                else:
-                    self.selected_points.append(point)
-                break
-
-    def add_road(self, start, end):
-        """Add a road between two points."""
-        start_number = start[0]
-        end_number = end[0]
-        if (start_number, end_number) not in self.roads and (
-                end_number, start_number) not in self.roads:
-            self.roads.append((start_number, end_number))
-
-    def _build_adjacency_list(self):
-        graph = {}
-        for road in self.roads:
-            start, end = road
-            if start not in graph:
-                graph[start] = []
-            if end not in graph:
-                graph[end] = []
-            graph[start].append(end)
-            graph[end].append(start)
-        return graph
-
-    def _get_connected_points(self, graph, start_point):
-        visited = set()
-        stack = [start_point]
-        while stack:
-            current = stack.pop()
-            if current not in visited:
-                visited.add(current)
-                stack.extend(neighbor for neighbor in graph[current] if neighbor not in visited)
-        return visited
-
-    def is_track_closed(self):
-        """
-        Check if the track is logically closed based on the roads.
-        """
-        if not self.roads:
-            return False
-        graph = self._build_adjacency_list()
-        visited = self._get_connected_points(graph, self.roads[0][0])
-        all_points = {point[0] for point in self.points}
-        return visited == all_points and len(visited) > 2
-
-    def smooth_or_extrapolate_track(self, num_samples=100):
-        """
-        Smooth or extrapolate the track using cubic spline interpolation.
-
-        :param num_samples: Number of samples to generate for the smooth track.
-        """
-        if len(self.points) < 3:
-            raise ValueError("At least 3 points are required to smooth the track.")
-
-        # Ensure the track is logically closed
-        if not self.is_track_closed():
-            raise ValueError("The track must be logically closed (all roads form a loop).")
-
-        # Ensure the first point is repeated at the end for interpolation
-        if self.points[0] != self.points[-1]:
-            self.points.append(self.points[0])
-
-        # Extract x and y coordinates
-        x = [p[1] for p in self.points]
-        y = [p[2] for p in self.points]
-
-        # Create a parameter t for the points
-        t = np.linspace(0, 1, len(self.points))
-
-        # Fit cubic splines for x and y
-        spline_x = CubicSpline(t, x, bc_type='periodic')
-        spline_y = CubicSpline(t, y, bc_type='periodic')
-
-        # Generate new points
-        t_new = np.linspace(0, 1, num_samples)
-        x_smooth = spline_x(t_new)
-        y_smooth = spline_y(t_new)
-
-        # Replace the original points with the smoothed points
-        self.points = list(zip(range(1, len(x_smooth) + 1), x_smooth, y_smooth))
-
-    def remove_road(self, start, end):
-        """Remove a road between two points using their numbers."""
-        start_number = start[0]
-        end_number = end[0]
-        if (start_number, end_number) in self.roads:
-            self.roads.remove((start_number, end_number))
-        elif (end_number, start_number) in self.roads:
-            self.roads.remove((end_number, start_number))
-
-    def set_finish_line(self, start, end):
-        """Set the finish line for the map."""
-        if start not in self.points:
-            raise ValueError("Start point not found in points.")
-        if end not in self.points:
-            raise ValueError("End point not found in points.")
-        self.finish_line['start'] = start
-        self.finish_line['end'] = end
-
-    def add_checkpoint(self, position):
-        """Add a checkpoint at the specified position."""
-        if position not in self.checkpoints:
-            self.checkpoints.append(position)
-
-    def remove_checkpoint(self, position):
-        """Remove a checkpoint at the specified position."""
-        if position in self.checkpoints:
-            self.checkpoints.remove(position)
-
-    # FILE
-
-    def to_dict(self):
-        """Convert the map data to a dictionary."""
-        return {
-            'points': self.points,
-            'roads': self.roads,
-            'finish_line': self.finish_line,
-            'checkpoints': self.checkpoints
-        }
-
-    def from_dict(self, data):
-        """Load the map data from a dictionary."""
-        self.points = data.get('points', [])
-        self.roads = data.get('roads', [])
-        self.finish_line = data.get('finish_line', {'point': None})
-        self.checkpoints = data.get('checkpoints', [])
-
-    def _generate_inner_boundary(self, center_line, width):
-        inner_poly = center_line.buffer(-width, cap_style=2, join_style=2, resolution=256)
-        if inner_poly.is_empty:
-            inner = np.array(center_line.coords)
-            if np.allclose(inner[0], inner[-1]):
-                inner = inner[:-1]
-            return inner.tolist()
-        else:
-            inner = np.array(inner_poly.exterior.coords)
-            if np.allclose(inner[0], inner[-1]):
-                inner = inner[:-1]
-            return inner.tolist()
-
-    def _snap_point_to_centerline(self, center_line, point):
-        return center_line.interpolate(center_line.project(Point(point))).coords[0]
-
-    def _snap_checkpoints(self, center_line, checkpoints):
-        snapped = []
-        for checkpoint in checkpoints:
-            if not center_line.contains(Point(checkpoint)):
-                snapped_point = self._snap_point_to_centerline(center_line, checkpoint)
-                snapped.append(snapped_point)
-            else:
-                snapped.append(checkpoint)
-        return snapped
-
-    def generate_track_width(self, width=50):
-        """
-          Generate smooth inner and outer track boundaries based on the centerline points.
-
-          This function uses the current list of points (assumed to be smoothed/interpolated)
-          to create a centerline, then generates the inner and outer boundaries by buffering
-          the centerline using the specified width. The result is maximally smooth track edges.
-
-          :param width: The half-width of the track (distance from centerline to edge).
-          :return: Tuple (inner_points, outer_points) as lists of (x, y) coordinates.
-        """
-        coords = [(p[1], p[2]) for p in self.points]
-        if coords[0] != coords[-1]:
-            coords.append(coords[0])
-        center_line = LineString(coords)
-
-        # Generate the outer boundary with high resolution for smoothness
-        outer_poly = center_line.buffer(width, cap_style=2, join_style=2, resolution=256)
-        outer = np.array(outer_poly.exterior.coords)
-        if np.allclose(outer[0], outer[-1]):
-            outer = outer[:-1]
-
-        # Generate the inner boundary using helper
-        inner = self._generate_inner_boundary(center_line, width)
-
-        # Ensure the finish line is included in the track
-        if self.finish_line['point']:
-            finish_point = self.finish_line['point']
-            if not center_line.contains(Point(finish_point)):
-                finish_point = self._snap_point_to_centerline(center_line, finish_point)
-                self.finish_line['point'] = finish_point
-
-        # Snap all checkpoints using helper
-        self.checkpoints = self._snap_checkpoints(center_line, self.checkpoints)
-
-        return inner, outer.tolist()
-
-    def save_to_file(self, file_path):
-        """Save the map data to a JSON file, including inner and outer points."""
-        inner_points, outer_points = self.generate_track_width()
-        data = {
-            'points': self.points,
-            'roads': self.roads,
-            'finish_line': self.finish_line,
-            'checkpoints': self.checkpoints,
-            'inner_points': inner_points,
-            'outer_points': outer_points
-        }
-        with open(file_path, 'w') as file:
-            json.dump(data, file, indent=4)
-
-    def load_from_file(self, file_path):
-        """Load the map data from a JSON file."""
-        with open(file_path, 'r') as file:
-            data = json.load(file)
-            self.from_dict(data)
+def init_display():
+    """Initialize pygame and pygame_gui and open the editor window."""
+    global window_surface, manager
+    if window_surface is None:
+        pygame.init()
+        pygame.display.set_caption('Map Editor')
+        window_surface = pygame.display.set_mode(window_size)
+        manager = pygame_gui.UIManager(window_size)
+    return window_surface
 
 
 class StepController:
@@ -370,7 +113,7 @@ class StepController:
 
         # Check if the finish line is set before proceeding from step 4
         if self.current_index == 3 and not self.map_data.finish_line['point']:
-            tk.messagebox.showerror("Error", "Finish line must be set before proceeding.")
+            messagebox.showerror("Error", "Finish line must be set before proceeding.")
             return
         if self.current_index < len(self.steps) - 1:
             self.current_index += 1
@@ -413,35 +156,80 @@ class StepController:
             self.wait_window = None
 
 
-def draw_coordinate_grid(surface, rect, grid_size=50, color=(0, 0, 0)):
-    """Draw a coordinate grid in the specified rectangle."""
+@lru_cache(maxsize=None)
+def get_font(size=20):
+    """Return a shared font instance for the given size."""
+    return pygame.font.Font(None, size)
+
+
+@lru_cache(maxsize=4096)
+def render_label(text, color, size=20):
+    """Render a text label once and reuse the surface on later frames."""
+    return get_font(size).render(text, True, color)
+
+
+@lru_cache(maxsize=8)
+def _grid_layer(size, grid_size, color):
+    """Render the coordinate grid on a transparent surface of the given size."""
+    width, height = size
+    layer = pygame.Surface(size, pygame.SRCALPHA)
     # Draw vertical lines
-    for x in range(rect.left, rect.right, grid_size):
-        pygame.draw.line(surface, color, (x, rect.top), (x, rect.bottom))
+    for x in range(0, width, grid_size):
+        pygame.draw.line(layer, color, (x, 0), (x, height))
         # Draw x-axis labels
-        label = pygame.font.Font(None, 20).render(str(x - rect.left), True, color)
-        surface.blit(label, (x + 2, rect.top + 2))
+        layer.blit(render_label(str(x), color), (x + 2, 2))
 
     # Draw horizontal lines
-    for y in range(rect.top, rect.bottom, grid_size):
-        pygame.draw.line(surface, color, (rect.left, y), (rect.right, y))
+    for y in range(0, height, grid_size):
+        pygame.draw.line(layer, color, (0, y), (width, y))
         # Draw y-axis labels
-        label = pygame.font.Font(None, 20).render(str(y - rect.top), True, color)
-        surface.blit(label, (rect.left + 2, y + 2))
+        layer.blit(render_label(str(y), color), (2, y + 2))
+    return layer
+
+
+def draw_coordinate_grid(surface, rect, grid_size=50, color=(0, 0, 0)):
+    """Draw a coordinate grid in the specified rectangle."""
+    surface.blit(_grid_layer((rect.width + 1, rect.height + 1), grid_size, tuple(color)),
+                 rect.topleft)
 
 
 class generator:
     def __init__(self):
+        init_display()
         self.selected_tool = None
         self.selected_detailed_tool = None
         self.step = 1
         # Create an instance of the Map class
         self.map_data = Map()
         self.clock = pygame.time.Clock()
+        self._index_revision = None
+        self._point_grid = None
+        self._road_grid = None
         self.step_controller = StepController(self.map_data)
 
         self.main_loop()
 
+    def _spatial_indexes(self):
+        """Return (point grid, road grid), rebuilding them only after the map changed."""
+        if self._index_revision != self.map_data.revision:
+            self._point_grid = SpatialGrid()
+            for point in self.map_data.points:
+                self._point_grid.insert(point, point[1], point[2])
+            self._road_grid = SpatialGrid()
+            for road in self.map_data.roads:
+                end, _, start = self.start_end_road_prep(road)
+                self._road_grid.insert(tuple(road), start[1], start[2], end[1], end[2])
+            self._index_revision = self.map_data.revision
+        return self._point_grid, self._road_grid
+
+    def _find_clicked_point(self, pos):
+        point_grid, _ = self._spatial_indexes()
+        for point in point_grid.query(pos, POINT_HIT_RADIUS):
+            if pygame.Rect(point[1] - POINT_HIT_RADIUS, point[2] - POINT_HIT_RADIUS,
+                           2 * POINT_HIT_RADIUS, 2 * POINT_HIT_RADIUS).collidepoint(pos):
+                return point
+        return None
+
     # Function to handle mouse clicks for adding/removing points
     def _handle_point_click(self, event):
         if event.type != pygame.MOUSEBUTTONDOWN:
@@ -450,10 +238,9 @@ class generator:
             if drawing_area_rect.collidepoint(event.pos):
                 self.map_data.add_point(event.pos)
         elif event.button == 3:
-            for point in self.map_data.points:
-                if pygame.Rect(point[1] - 5, point[2] - 5, 10, 10).collidepoint(event.pos):
-                    self.map_data.remove_point((point[1], point[2]))
-                    break
+            point = self._find_clicked_point(event.pos)
+            if point is not None:
+                self.map_data.remove_point((point[1], point[2]))
 
     def handle_mouse_click(self, event):
         if self.selected_tool == 'Draw Tool':
@@ -466,10 +253,9 @@ class generator:
 
     def _handle_left_click_road(self, event):
         # Check if a point was clicked
-        for point in self.map_data.points:
-            if pygame.Rect(point[1] - 5, point[2] - 5, 10, 10).collidepoint(event.pos):
-                self.map_data.toggle_point_selection((point[1], point[2]))
-                break
+        point = self._find_clicked_point(event.pos)
+        if point is not None:
+            self.map_data.toggle_point_selection((point[1], point[2]))
         # If two points are selected, create a road
         if len(self.map_data.selected_points) == 2:
             start, end = self.map_data.selected_points
@@ -480,8 +266,8 @@ class generator:
         closest_road, _ = self._find_closest_road_and_point(event.pos, max_distance=15)
         if closest_road:
             start_number, end_number = closest_road
-            start = next(p for p in self.map_data.points if p[0] == start_number)
-            end = next(p for p in self.map_data.points if p[0] == end_number)
+            start = self.map_data.get_point(start_number)
+            end = self.map_data.get_point(end_number)
             self.map_data.remove_road(start, end)
 
     def handle_mouse_click_road(self, event):
@@ -494,8 +280,8 @@ class generator:
 
     def start_end_road_prep(self, road):
         start_number, end_number = road
-        start = next(p for p in self.map_data.points if p[0] == start_number)
-        end = next(p for p in self.map_data.points if p[0] == end_number)
+        start = self.map_data.get_point(start_number)
+        end = self.map_data.get_point(end_number)
         mid_point = ((start[1] + end[1]) // 2, (start[2] + end[2]) // 2)
         return end, mid_point, start
 
@@ -513,7 +299,8 @@ class generator:
         min_distance = float('inf')
         closest_road = None
         closest_point_on_road = None
-        for road in self.map_data.roads:
+        _, road_grid = self._spatial_indexes()
+        for road in road_grid.query(cursor_pos, max_distance):
             end, _, start = self.start_end_road_prep(road)
             closest_point = self._closest_point_on_segment(start, end, cursor_pos)
             distance = ((cursor_pos[0] - closest_point[0]) ** 2 + (
@@ -556,8 +343,8 @@ class generator:
     # Add functions to handle saving and loading
     def save_map(self):
         """Save the current map to a file."""
-        self.map_data.save_to_file('map_data.json')
-        print("Map saved to 'map_data.json'.")
+        self.map_data.save_to_file(MAP_FILE)
+        print(f"Map saved to '{MAP_FILE}'.")
 
     def handle_step_1(self, event):
         self.selected_tool = 'Draw Tool'
@@ -604,23 +391,25 @@ class generator:
         return True  # Signal to exit
 
     def _draw_points(self):
+        selected = {point[0] for point in self.map_data.selected_points}
+        labels = []
         for point in self.map_data.points:
             number, x, y = point
-            color = (0, 0, 255) if point in self.map_data.selected_points else (255, 0, 0)
+            color = (0, 0, 255) if number in selected else (255, 0, 0)
             pygame.draw.circle(window_surface, color, (x, y), 5)
-            label = pygame.font.Font(None, 20).render(str(number), True, (0, 0, 0))
-            window_surface.blit(label, (x + 5, y - 10))
+            labels.append((render_label(str(number), (0, 0, 0)), (x + 5, y - 10)))
+        window_surface.blits(labels, doreturn=False)
 
     def _draw_roads(self):
         for start_number, end_number in self.map_data.roads:
-            start = next(p for p in self.map_data.points if p[0] == start_number)
-            end = next(p for p in self.map_data.points if p[0] == end_number)
+            start = self.map_data.get_point(start_number)
+            end = self.map_data.get_point(end_number)
             pygame.draw.line(window_surface, (0, 0, 0), (start[1], start[2]), (end[1], end[2]), 2)
 
     def _draw_checkpoints(self):
+        label = render_label("Checkpoint", (255, 255, 0))
         for checkpoint in self.map_data.checkpoints:
             pygame.draw.circle(window_surface, (255, 255, 0), checkpoint, 6)
-            label = pygame.font.Font(None, 20).render("Checkpoint", True, (255, 255, 0))
             window_surface.blit(label, (checkpoint[0] + 10, checkpoint[1] - 10))
 
     def _draw_finish_line(self):
@@ -628,7 +417,7 @@ class generator:
             finish_point = self.map_data.finish_line['point']
             pygame.draw.circle(window_surface, (0, 255, 0),
                                (int(finish_point[0]), int(finish_point[1])), 6)
-            label = pygame.font.Font(None, 20).render("Finish", True, (0, 255, 0))
+            label = render_label("Finish", (0, 255, 0))
             window_surface.blit(label, (int(finish_point[0]) + 10, int(finish_point[1]) - 10))
 
     def main_loop(self):
@@ -0,0 +1,174 @@
+import argparse
+import json
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+from shapely.geometry.linestring import LineString
+from shapely.geometry.polygon import Polygon
+
+from map_generators.map_core import Map
+
+# Editor canvas the generated centerlines are laid out in (same as the GUI editor)
+CANVAS_SIZE = (1024, 768)
+CANVAS_MARGIN = 80
+
+DEFAULT_CONTROL_POINTS = (8, 14)
+DEFAULT_RADIUS_JITTER = 0.35
+DEFAULT_SAMPLES = 200
+DEFAULT_WIDTH = 50
+DEFAULT_CHECKPOINTS = 6
+MAX_ATTEMPTS = 50
+
+
+def random_control_points(rng, count, radius_jitter=DEFAULT_RADIUS_JITTER):
+    """
+    Generate control points of a random star-shaped loop around the canvas center.
+
+    :param rng: random.Random instance used for all draws.
+    :param count: Number of control points.
+    :param radius_jitter: Relative radius variation (0 - circle, 1 - very irregular).
+    :return: List of (x, y) positions ordered by angle.
+    """
+    center_x, center_y = CANVAS_SIZE[0] / 2, CANVAS_SIZE[1] / 2
+    radius_x = CANVAS_SIZE[0] / 2 - CANVAS_MARGIN
+    radius_y = CANVAS_SIZE[1] / 2 - CANVAS_MARGIN
+    sector = 2 * math.pi / count
+
+    points = []
+    for i in range(count):
+        angle = (i + rng.uniform(-0.3, 0.3)) * sector
+        radius = 1 - rng.uniform(0, radius_jitter)
+        points.append((center_x + radius_x * radius * math.cos(angle),
+                       center_y + radius_y * radius * math.sin(angle)))
+    return points
+
+
+def place_gates(map_data, num_checkpoints):
+    """
+    Put the finish line on the first centerline point and spread checkpoints evenly after it.
+
+    :param map_data: Smoothed Map instance.
+    :param num_checkpoints: Number of checkpoints to place.
+    """
+    center_line = LineString([(p[1], p[2]) for p in map_data.points])
+    map_data.finish_line = {'point': tuple(center_line.coords[0])}
+    map_data.checkpoints = [
+        tuple(center_line.interpolate(i / (num_checkpoints + 1), normalized=True).coords[0])
+        for i in range(1, num_checkpoints + 1)
+    ]
+
+
+def validate_track(data, width):
+    """
+    Check that generated map data describes a drivable track.
+
+    :param data: Map data dictionary returned by Map.track_data.
+    :param width: The half-width used to build the boundaries.
+    :raises ValueError: If the track pinches or a boundary intersects itself.
+    """
+    # The inner boundary of Map.generate_track_width is the centerline itself
+    center = [(p[1], p[2]) for p in data['points']]
+    if not Polygon(center).is_valid:
+        raise ValueError("Centerline intersects itself.")
+    band = LineString(center).buffer(width, cap_style=2, join_style=2)
+    if len(band.interiors) != 1:
+        raise ValueError("Track boundaries touch each other.")
+    if not Polygon(data['outer_points']).is_valid:
+        raise ValueError("Outer boundary intersects itself.")
+
+
+def generate_map(seed, width=DEFAULT_WIDTH, num_checkpoints=DEFAULT_CHECKPOINTS,
+                 control_points=DEFAULT_CONTROL_POINTS, radius_jitter=DEFAULT_RADIUS_JITTER,
+                 samples=DEFAULT_SAMPLES):
+    """
+    Generate a random closed track from a seed.
+
+    The same seed and options always give the same map. Candidates failing validation
+    are rejected and redrawn from the same random stream.
+
+    :param seed: Seed of the random generator.
+    :param width: The half-width of the track.
+    :param num_checkpoints: Number of evenly spaced checkpoints.
+    :param control_points: (min, max) number of control points of the centerline.
+    :param radius_jitter: Relative radius variation of the control points.
+    :param samples: Number of smoothed centerline points.
+    :return: Map data dictionary in the same format as Map.save_to_file writes.
+    :raises ValueError: If num_checkpoints is below 1 or no valid track was found.
+    """
+    if num_checkpoints < 1:
+        # Cars and observations expect at least one checkpoint before the finish line
+        raise ValueError(f"A map needs at least one checkpoint, got {num_checkpoints}")
+    rng = random.Random(seed)
+    last_error = None
+    for _ in range(MAX_ATTEMPTS):
+        map_data = Map()
+        count = rng.randint(*control_points)
+        for position in random_control_points(rng, count, radius_jitter):
+            map_data.add_point(position)
+        map_data.connect_points()
+
+        map_data.smooth_or_extrapolate_track(num_samples=samples)
+        # Smoothing replaces the points, the roads of the control points are stale
+        map_data.connect_points()
+        place_gates(map_data, num_checkpoints)
+        data = map_data.track_data(width)
+        try:
+            validate_track(data, width)
+        except ValueError as e:
+            last_error = e
+            continue
+        return data
+    raise ValueError(f"Could not generate a valid track for seed {seed}: {last_error}")
+
+
+def _generate_to_file(job):
+    seed, out_dir, options = job
+    data = generate_map(seed, **options)
+    file_path = os.path.join(out_dir, f"map_{seed:06d}.json")
+    with open(file_path, 'w') as file:
+        json.dump(data, file)
+    return file_path
+
+
+def generate_maps(seeds, out_dir, workers=None, **options):
+    """
+    Generate many maps in parallel and write them to out_dir as map_<seed>.json.
+
+    :param seeds: Iterable of seeds, one map per seed.
+    :param out_dir: Output directory (created if missing).
+    :param workers: Number of worker processes (None - number of CPUs).
+    :param options: Keyword arguments passed to generate_map.
+    :return: Generator of written file paths, in seed order.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = [(seed, out_dir, options) for seed in seeds]
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(_generate_to_file, jobs, chunksize=chunksize)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate random race maps without the editor.")
+    parser.add_argument("--count", type=int, default=1, help="number of maps to generate")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first map")
+    parser.add_argument("--out", default="generated_maps", help="output directory")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes")
+    parser.add_argument("--width", type=float, default=DEFAULT_WIDTH, help="track half-width")
+    parser.add_argument("--checkpoints", type=int, default=DEFAULT_CHECKPOINTS)
+    parser.add_argument("--samples", type=int, default=DEFAULT_SAMPLES,
+                        help="smoothed centerline points")
+    args = parser.parse_args()
+    if args.checkpoints < 1:
+        parser.error("--checkpoints must be at least 1")
+
+    seeds = range(args.seed, args.seed + args.count)
+    options = {'width': args.width, 'num_checkpoints': args.checkpoints, 'samples': args.samples}
+    for file_path in generate_maps(seeds, args.out, workers=args.workers, **options):
+        print(file_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Parity of components.kernels with the tuple based code they replace, on a fixed synthetic
+track: the kernel sources as plain Python and, when numba is installed, JIT-compiled.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import math
+
+import pytest
+
+from components import kernels
+from components.car_class import Car
+from components.functions_helper import point_in_polygon
+from components.track_context import TrackContext
+
+WIDTH, HEIGHT = 320, 240
+
+
+def _loop(radius, wobble, count=72):
+    # Closed line around the origin, wavy so that rays hit both borders at many angles
+    return [(radius * (1 + wobble * math.sin(3 * a)) * math.cos(a),
+             radius * (1 + wobble * math.sin(3 * a)) * math.sin(a))
+            for a in (2 * math.pi * i / count for i in range(count))]
+
+
+@pytest.fixture(scope="module")
+def track():
+    outer = _loop(100, 0.15)
+    inner = _loop(55, 0.15)
+    data = {"outer_points": outer, "inner_points": inner,
+            "checkpoints": [[0, 78], [-78, 0], [0, -78]], "finish_line": {"point": [78, 0]}}
+    return TrackContext(data, WIDTH, HEIGHT)
+
+
+@pytest.fixture(params=["python", "jit"])
+def backend(request, monkeypatch):
+    """Kernel functions of one backend: (point_in_polygon, march_border_ray)."""
+    if request.param == "jit":
+        pytest.importorskip("numba")
+        kernels.compile_kernels()
+        return kernels.point_in_polygon, kernels.march_border_ray
+    # The Python ray kernel calls the module's point_in_polygon, keep it uncompiled
+    monkeypatch.setattr(kernels, "point_in_polygon", kernels._point_in_polygon)
+    return kernels._point_in_polygon, kernels._march_border_ray
+
+
+def _points():
+    # Every 7 pixels of the canvas and a margin around it
+    return [(x + 0.5, y + 0.25) for x in range(-14, WIDTH + 14, 7)
+            for y in range(-14, HEIGHT + 14, 7)]
+
+
+def _rays(track):
+    # Centres on the track, on the border lines and outside, in 16 directions
+    centres = [track.scale_point(point) for point in _loop(78, 0.15, count=12)]
+    centres += list(track.outer[::9]) + list(track.inner[::9]) + [(3, 3), (WIDTH - 2, 120)]
+    directions = [(math.cos(a), math.sin(a)) for a in (math.pi * i / 8 for i in range(16))]
+    return [(centre, direction, max_length) for centre in centres for direction in directions
+            for max_length in (6, 1000)]
+
+
+def _reference_ray(track, centre, direction, max_length):
+    # The border part of Car._cast_single_ray on the pygame mask and the inner tuple
+    car = Car.__new__(Car)
+    car.track = None
+    _, _, hit, distance = Car._cast_single_ray(
+        car, centre, direction, max_length, track.track_mask.get_size(), track.track_mask,
+        track.inner, [])
+    return hit[0], hit[1], distance
+
+
+@pytest.mark.parametrize("line", ["outer", "inner"])
+def test_point_in_polygon(track, backend, line):
+    kernel, _ = backend
+    polygon = getattr(track, line)
+    polygon_array = getattr(track, line + "_array")
+    for x, y in _points():
+        assert kernel(x, y, polygon_array) == point_in_polygon(x, y, polygon), (x, y)
+
+
+def test_march_border_ray(track, backend):
+    _, kernel = backend
+    for centre, direction, max_length in _rays(track):
+        expected = _reference_ray(track, centre, direction, max_length)
+        hit_x, hit_y, distance, steps = kernel(centre[0], centre[1], direction[0],
+                                               direction[1], max_length, track.track_bits,
+                                               track.inner_array)
+        assert (hit_x, hit_y, distance) == expected, (centre, direction, max_length)
+        assert 0 <= steps <= max_length + 1